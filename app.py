@@ -5,13 +5,38 @@ import json
 import os
 from datetime import datetime, timedelta
 import time
-from facebook_business.api import FacebookAdsApi
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.adobjects.campaign import Campaign
 from facebook_business.adobjects.adset import AdSet
 from facebook_business.adobjects.ad import Ad
-import sqlite3
-from sqlite3 import Error
+from database import (
+    acquire_run_lock, add_rule, delete_api_config, delete_rule, get_active_api_config,
+    get_all_api_configs, get_all_rules, get_rule_executions, get_rule_schedules, init_db,
+    release_run_lock, save_api_config, set_active_api_config, toggle_rule_status,
+    update_rule_schedule
+)
+from entity_catalog import catalog_synced_at, expire_catalog_sync
+from facebook_api import (
+    get_account_insights, get_facebook_ads, get_facebook_adsets,
+    get_facebook_api, get_facebook_campaigns, release_facebook_api
+)
+from graph_cache import graph_cache
+from graph_ledger import (
+    graph_caller, graph_latency_over_time, graph_ledger, load_graph_calls, set_graph_caller,
+    summarize_graph_calls
+)
+from insights_store import INSIGHTS_RETENTION_DAYS, expire_insights_sync, get_local_campaign_insights
+from messages import set_message_handlers
+from render_profiler import (
+    PROFILE_ENABLED_BY_DEFAULT, PROFILE_PHASES, bucket_labels, export_profiles, profile_history,
+    profiled, rerun_profile, set_profile_page, summarize_page_profile
+)
+from rule_actions import LEVEL_LABELS, SNAPSHOT_MAX_AGE_SECONDS, build_campaign_snapshot
+from rule_backtest import BACKTEST_DAYS, backtest_rules
+from rule_engine import RULE_LEVELS, rule_level
+from rule_runner import apply_rules, lock_owner, rules_lock_name
+from rule_scheduler import DEFAULT_INTERVAL_SECONDS, DEFAULT_MAX_WORKERS, run_all_accounts
+from rule_trace import OUTCOME_LABELS, VERBOSITY_LEVELS, RuleTrace
 
 # Configuração da página
 st.set_page_config(
@@ -21,553 +46,42 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Função para criar banco de dados SQLite
-def create_connection():
-    conn = None
-    try:
-        if not os.path.exists('data'):
-            os.makedirs('data')
-        conn = sqlite3.connect('data/facebook_ads_manager.db')
-        return conn
-    except Error as e:
-        st.error(f"Erro ao conectar ao banco de dados: {e}")
-    return conn
-
-# Inicializar banco de dados e tabelas
-def init_db():
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            
-            # Tabela de configurações da API (múltiplas contas)
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS api_config (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    app_id TEXT NOT NULL,
-                    app_secret TEXT NOT NULL,
-                    access_token TEXT NOT NULL,
-                    account_id TEXT NOT NULL,
-                    business_id TEXT,
-                    page_id TEXT,
-                    is_active INTEGER DEFAULT 0,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Verificar se a tabela rules existe
-            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rules'")
-            table_exists = c.fetchone()
-            
-            if table_exists:
-                # Verificar se a coluna is_composite existe
-                try:
-                    c.execute("SELECT is_composite FROM rules LIMIT 1")
-                except Error:
-                    # Coluna não existe, vamos criar uma tabela temporária e migrar os dados
-                    st.info("Migrando banco de dados para suportar regras compostas...")
-                    
-                    # Criar nova tabela com estrutura atualizada
-                    c.execute('''
-                        CREATE TABLE rules_new (
-                            id INTEGER PRIMARY KEY,
-                            name TEXT NOT NULL,
-                            description TEXT,
-                            condition_type TEXT NOT NULL,
-                            is_composite INTEGER DEFAULT 0,
-                            primary_metric TEXT NOT NULL,
-                            primary_operator TEXT NOT NULL,
-                            primary_value REAL NOT NULL,
-                            secondary_metric TEXT,
-                            secondary_operator TEXT,
-                            secondary_value REAL,
-                            join_operator TEXT DEFAULT 'AND',
-                            action_type TEXT NOT NULL,
-                            action_value REAL,
-                            is_active INTEGER DEFAULT 1,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    ''')
-                    
-                    # Migrar dados da tabela antiga para a nova
-                    c.execute('''
-                        INSERT INTO rules_new (
-                            id, name, description, condition_type, is_composite,
-                            primary_metric, primary_operator, primary_value, 
-                            action_type, action_value, is_active, created_at, updated_at
-                        )
-                        SELECT 
-                            id, name, description, condition_type, 0,
-                            condition_metric, condition_operator, condition_value, 
-                            action_type, action_value, is_active, created_at, updated_at
-                        FROM rules
-                    ''')
-                    
-                    # Renomear tabelas
-                    c.execute("DROP TABLE rules")
-                    c.execute("ALTER TABLE rules_new RENAME TO rules")
-                    
-                    conn.commit()
-                    st.success("Migração concluída com sucesso!")
-            else:
-                # Tabela não existe, criar com a nova estrutura
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS rules (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        description TEXT,
-                        condition_type TEXT NOT NULL,
-                        is_composite INTEGER DEFAULT 0,
-                        primary_metric TEXT NOT NULL,
-                        primary_operator TEXT NOT NULL,
-                        primary_value REAL NOT NULL,
-                        secondary_metric TEXT,
-                        secondary_operator TEXT,
-                        secondary_value REAL,
-                        join_operator TEXT DEFAULT 'AND',
-                        action_type TEXT NOT NULL,
-                        action_value REAL,
-                        is_active INTEGER DEFAULT 1,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-            
-            # Tabela de execuções de regras
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS rule_executions (
-                    id INTEGER PRIMARY KEY,
-                    rule_id INTEGER NOT NULL,
-                    ad_object_id TEXT NOT NULL,
-                    ad_object_type TEXT NOT NULL,
-                    ad_object_name TEXT NOT NULL,
-                    executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    was_successful INTEGER DEFAULT 0,
-                    message TEXT,
-                    FOREIGN KEY (rule_id) REFERENCES rules (id)
-                )
-            ''')
-            
-            conn.commit()
-        except Error as e:
-            st.error(f"Erro ao criar tabelas: {e}")
-        finally:
-            conn.close()
+# Mensagens dos módulos de banco de dados e da Graph API aparecem na página
+set_message_handlers(error=st.error, info=st.info, success=st.success)
 
 # Inicializar o banco de dados
 init_db()
 
-# Função para salvar configurações da API
-def save_api_config(name, app_id, app_secret, access_token, account_id, business_id="", page_id=""):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            # Verifica se é a primeira conexão
-            c.execute("SELECT COUNT(*) FROM api_config")
-            count = c.fetchone()[0]
-            is_active = 1 if count == 0 else 0
-            
-            c.execute(
-                """INSERT INTO api_config 
-                   (name, app_id, app_secret, access_token, account_id, business_id, page_id, is_active) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (name, app_id, app_secret, access_token, account_id, business_id, page_id, is_active)
-            )
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao salvar configurações: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para obter configurações ativas da API
-def get_active_api_config():
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute("""SELECT id, name, app_id, app_secret, access_token, account_id, 
-                         business_id, page_id FROM api_config WHERE is_active = 1 LIMIT 1""")
-            row = c.fetchone()
-            if row:
-                return {
-                    "id": row[0],
-                    "name": row[1],
-                    "app_id": row[2],
-                    "app_secret": row[3],
-                    "access_token": row[4],
-                    "account_id": row[5],
-                    "business_id": row[6],
-                    "page_id": row[7]
-                }
-        except Error as e:
-            st.error(f"Erro ao obter configurações ativas: {e}")
-        finally:
-            conn.close()
-    return None
-
-# Função para obter todas as configurações da API
-def get_all_api_configs():
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute("""SELECT id, name, app_id, app_secret, access_token, account_id, 
-                         business_id, page_id, is_active FROM api_config ORDER BY name""")
-            rows = c.fetchall()
-            configs = []
-            for row in rows:
-                configs.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "app_id": row[2],
-                    "app_secret": row[3],
-                    "access_token": row[4],
-                    "account_id": row[5],
-                    "business_id": row[6],
-                    "page_id": row[7],
-                    "is_active": row[8]
-                })
-            return configs
-        except Error as e:
-            st.error(f"Erro ao obter todas as configurações: {e}")
-        finally:
-            conn.close()
-    return []
-
-# Função para definir configuração ativa
-def set_active_api_config(config_id):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            # Desativa todas as configurações
-            c.execute("UPDATE api_config SET is_active = 0")
-            # Ativa a configuração selecionada
-            c.execute("UPDATE api_config SET is_active = 1 WHERE id = ?", (config_id,))
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao definir configuração ativa: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
+# Leituras do banco (inclusive do catálogo e dos insights locais, que sincronizam
+# com a Graph API quando preciso), montagem de DataFrames e tabelas medidas pelo
+# perfil de renderização (ver render_profiler)
+get_active_api_config = profiled('db', get_active_api_config)
+get_all_api_configs = profiled('db', get_all_api_configs)
+get_all_rules = profiled('db', get_all_rules)
+get_rule_executions = profiled('db', get_rule_executions)
+get_rule_schedules = profiled('db', get_rule_schedules)
+get_facebook_campaigns = profiled('db', get_facebook_campaigns)
+get_facebook_adsets = profiled('db', get_facebook_adsets)
+get_facebook_ads = profiled('db', get_facebook_ads)
+get_account_insights = profiled('db', get_account_insights)
+get_local_campaign_insights = profiled('db', get_local_campaign_insights)
+get_facebook_api = profiled('api_init', get_facebook_api)
+make_dataframe = profiled('dataframe', pd.DataFrame)
+show_dataframe = profiled('render', st.dataframe)
+show_line_chart = profiled('render', st.line_chart)
+show_bar_chart = profiled('render', st.bar_chart)
 
-# Função para excluir uma configuração
-def delete_api_config(config_id):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            # Verifica se é a configuração ativa
-            c.execute("SELECT is_active FROM api_config WHERE id = ?", (config_id,))
-            row = c.fetchone()
-            if row and row[0] == 1:
-                # Se for a configuração ativa, ativa outra antes de excluir
-                c.execute("SELECT id FROM api_config WHERE id != ? LIMIT 1", (config_id,))
-                other_config = c.fetchone()
-                if other_config:
-                    c.execute("UPDATE api_config SET is_active = 1 WHERE id = ?", (other_config[0],))
-            
-            # Exclui a configuração
-            c.execute("DELETE FROM api_config WHERE id = ?", (config_id,))
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao excluir configuração: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para inicializar a API do Facebook
+# Função para obter a conta ativa e a sua instância da API do Facebook
+# (reaproveitada entre os reruns, ver facebook_api.get_facebook_api)
 def init_facebook_api():
     config = get_active_api_config()
     if config:
         try:
-            FacebookAdsApi.init(
-                app_id=config["app_id"],
-                app_secret=config["app_secret"],
-                access_token=config["access_token"]
-            )
-            return config["account_id"]
+            # Chamadas passam pelo balde de requisições da conta (ver graph_throttle)
+            return config["account_id"], get_facebook_api(config)
         except Exception as e:
             st.error(f"Erro ao inicializar API do Facebook: {e}")
-    return None
-
-# Função para adicionar regra (com suporte a regras compostas)
-def add_rule(name, description, condition_type, primary_metric, primary_operator, 
-             primary_value, action_type, action_value, is_composite=0, secondary_metric=None, 
-             secondary_operator=None, secondary_value=None, join_operator="AND"):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute(
-                '''INSERT INTO rules 
-                   (name, description, condition_type, is_composite, primary_metric, 
-                    primary_operator, primary_value, secondary_metric, secondary_operator, 
-                    secondary_value, join_operator, action_type, action_value) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (name, description, condition_type, is_composite, primary_metric, 
-                 primary_operator, primary_value, secondary_metric, secondary_operator, 
-                 secondary_value, join_operator, action_type, action_value)
-            )
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao adicionar regra: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para obter todas as regras
-def get_all_rules():
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            # Verificar quais colunas existem na tabela rules
-            c.execute("PRAGMA table_info(rules)")
-            columns_info = c.fetchall()
-            column_names = [column[1] for column in columns_info]
-            
-            # Construir consulta SQL com base nas colunas existentes
-            if 'is_composite' in column_names:
-                # Novo formato (após migração)
-                c.execute("""
-                    SELECT id, name, description, condition_type, is_composite,
-                           primary_metric, primary_operator, primary_value,
-                           secondary_metric, secondary_operator, secondary_value,
-                           join_operator, action_type, action_value, is_active, 
-                           created_at, updated_at
-                    FROM rules 
-                    ORDER BY created_at DESC
-                """)
-            else:
-                # Formato antigo (antes da migração)
-                c.execute("""
-                    SELECT id, name, description, condition_type,
-                           condition_metric, condition_operator, condition_value,
-                           action_type, action_value, is_active, 
-                           created_at, updated_at
-                    FROM rules 
-                    ORDER BY created_at DESC
-                """)
-            
-            rules = c.fetchall()
-            columns = [description[0] for description in c.description]
-            result = []
-            for rule in rules:
-                rule_dict = {}
-                for i, column in enumerate(columns):
-                    rule_dict[column] = rule[i]
-                result.append(rule_dict)
-            return result
-        except Error as e:
-            st.error(f"Erro ao obter regras: {e}")
-        finally:
-            conn.close()
-    return []
-
-# Função para excluir regra
-def delete_rule(rule_id):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute("DELETE FROM rules WHERE id = ?", (rule_id,))
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao excluir regra: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para atualizar estado da regra (ativar/desativar)
-def toggle_rule_status(rule_id, is_active):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute("UPDATE rules SET is_active = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
-                     (1 if is_active else 0, rule_id))
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao atualizar status da regra: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para registrar execução de regra
-def log_rule_execution(rule_id, ad_object_id, ad_object_type, ad_object_name, was_successful, message=""):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute(
-                '''INSERT INTO rule_executions 
-                   (rule_id, ad_object_id, ad_object_type, ad_object_name, was_successful, message) 
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (rule_id, ad_object_id, ad_object_type, ad_object_name, 1 if was_successful else 0, message)
-            )
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao registrar execução da regra: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
-
-# Função para obter histórico de execuções
-def get_rule_executions(limit=100):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            c = conn.cursor()
-            c.execute('''
-                SELECT re.id, r.name as rule_name, re.ad_object_id, re.ad_object_type, 
-                       re.ad_object_name, re.executed_at, re.was_successful, re.message
-                FROM rule_executions re
-                JOIN rules r ON re.rule_id = r.id
-                ORDER BY re.executed_at DESC
-                LIMIT ?
-            ''', (limit,))
-            executions = c.fetchall()
-            columns = [description[0] for description in c.description]
-            result = []
-            for execution in executions:
-                execution_dict = {}
-                for i, column in enumerate(columns):
-                    execution_dict[column] = execution[i]
-                result.append(execution_dict)
-            return result
-        except Error as e:
-            st.error(f"Erro ao obter histórico de execução: {e}")
-        finally:
-            conn.close()
-    return []
-
-# Função para obter campanhas do Facebook
-def get_facebook_campaigns(account_id):
-    try:
-        account = AdAccount(f'act_{account_id}')
-        campaigns = account.get_campaigns(
-            fields=[
-                'id', 'name', 'status', 'objective', 'created_time', 
-                'start_time', 'stop_time', 'daily_budget', 'lifetime_budget'
-            ]
-        )
-        return campaigns
-    except Exception as e:
-        st.error(f"Erro ao obter campanhas: {e}")
-        return []
-
-# Função para obter conjuntos de anúncios
-def get_facebook_adsets(account_id, campaign_id=None):
-    try:
-        account = AdAccount(f'act_{account_id}')
-        params = {}
-        if campaign_id:
-            params['campaign_id'] = campaign_id
-            
-        adsets = account.get_ad_sets(
-            params=params,
-            fields=[
-                'id', 'name', 'status', 'campaign_id', 'daily_budget', 
-                'lifetime_budget', 'targeting', 'bid_amount'
-            ]
-        )
-        return adsets
-    except Exception as e:
-        st.error(f"Erro ao obter conjuntos de anúncios: {e}")
-        return []
-
-# Função para obter anúncios
-def get_facebook_ads(account_id, adset_id=None):
-    try:
-        account = AdAccount(f'act_{account_id}')
-        params = {}
-        if adset_id:
-            params['adset_id'] = adset_id
-            
-        ads = account.get_ads(
-            params=params,
-            fields=[
-                'id', 'name', 'status', 'adset_id', 'creative', 
-                'created_time', 'updated_time'
-            ]
-        )
-        return ads
-    except Exception as e:
-        st.error(f"Erro ao obter anúncios: {e}")
-        return []
-
-# Função para obter insights de campanhas
-def get_campaign_insights(account_id, campaign_ids, time_range='last_7d'):
-    try:
-        params = {
-            'level': 'campaign',
-            'filtering': [{'field': 'campaign.id', 'operator': 'IN', 'value': campaign_ids}]
-        }
-        
-        if time_range == 'yesterday':
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            params['time_range'] = {'since': yesterday, 'until': yesterday}
-        elif time_range == 'last_7d':
-            params['date_preset'] = 'last_7d'
-        elif time_range == 'last_30d':
-            params['date_preset'] = 'last_30d'
-        
-        account = AdAccount(f'act_{account_id}')
-        insights = account.get_insights(
-            params=params,
-            fields=[
-                'campaign_id', 'campaign_name', 'spend', 'impressions', 'clicks', 
-                'ctr', 'cpc', 'actions', 'cost_per_action_type'
-            ]
-        )
-        
-        processed_insights = []
-        for insight in insights:
-            insight_dict = insight.export_all_data()
-            
-            # Processar ações e conversões
-            purchases = 0
-            if 'actions' in insight_dict:
-                for action in insight_dict['actions']:
-                    if action['action_type'] == 'purchase':
-                        purchases = int(action['value'])
-            
-            # Calcular CPA
-            cpa = 0
-            if 'cost_per_action_type' in insight_dict:
-                for cost_action in insight_dict['cost_per_action_type']:
-                    if cost_action['action_type'] == 'purchase':
-                        cpa = float(cost_action['value'])
-            
-            # Adicionar dados processados
-            insight_dict['purchases'] = purchases
-            insight_dict['cpa'] = cpa
-            
-            processed_insights.append(insight_dict)
-            
-        return processed_insights
-    except Exception as e:
-        st.error(f"Erro ao obter insights de campanhas: {e}")
-        return []
+    return None, None
 
 # NOVA FUNÇÃO: Testar pausa de campanha diretamente
 def test_pause_campaign(campaign_id):
@@ -575,7 +89,7 @@ def test_pause_campaign(campaign_id):
     
     try:
         # Inicializar a API
-        account_id = init_facebook_api()
+        account_id, api = init_facebook_api()
         if not account_id:
             st.error("Não foi possível inicializar a API do Facebook")
             return
@@ -583,7 +97,7 @@ def test_pause_campaign(campaign_id):
         st.info(f"Testando pausa da campanha ID: {campaign_id}")
         
         # Tentar obter a campanha
-        campaign = Campaign(campaign_id)
+        campaign = Campaign(campaign_id, api=api)
         
         # Verificar estado atual
         try:
@@ -599,6 +113,9 @@ def test_pause_campaign(campaign_id):
             campaign.api_update(params={'status': 'PAUSED'})
             st.success("✅ Campanha pausada com sucesso!")
             
+            # Descartar leituras em cache que ainda mostram o status antigo
+            graph_cache.invalidate(account_id)
+            
             # Verificar o novo estado
             updated_data = campaign.api_get(fields=['status'])
             st.info(f"Novo status: {updated_data.get('status')}")
@@ -614,7 +131,7 @@ def test_pause_campaign(campaign_id):
             st.warning("Verificando informações do token:")
             try:
                 from facebook_business.adobjects.adaccount import AdAccount
-                ad_account = AdAccount(f'act_{account_id}')
+                ad_account = AdAccount(f'act_{account_id}', api=api)
                 ad_account_info = ad_account.api_get()
                 st.json(ad_account_info)
             except Exception as account_error:
@@ -624,331 +141,104 @@ def test_pause_campaign(campaign_id):
         st.error(f"Erro geral: {str(e)}")
 
 # NOVA FUNÇÃO: Verificação de regras com debug detalhado
-def check_and_apply_rules(insights):
+# ad_insights são os insights por anúncio já lidos pela página; as regras de
+# conjuntos e campanhas usam os anúncios somados em cada nível
+def check_and_apply_rules(ad_insights, campaign_snapshot=None, snapshot_max_age=SNAPSHOT_MAX_AGE_SECONDS,
+                          verbosity='matches'):
     st.subheader("Log de Verificação de Regras")
-    debug_container = st.empty()
-    debug_log = []
+    progress_container = st.empty()
     
-    def add_log(message):
-        debug_log.append(message)
-        debug_container.code("\n".join(debug_log))
+    # O log é redesenhado em lotes (no máximo a cada UPDATE_INTERVAL_SECONDS), apenas
+    # com as últimas linhas e a contagem de decisões; o detalhe fica na tabela abaixo
+    def render_progress(trace):
+        lines = trace.lines[-30:]
+        counts = ", ".join(f"{OUTCOME_LABELS[outcome]}: {count}" for outcome, count in trace.counts.items() if count)
+        if counts:
+            lines = lines + ["", counts]
+        progress_container.code("\n".join(lines))
     
-    add_log("Iniciando verificação de regras...")
+    trace = RuleTrace(verbosity, on_update=render_progress)
+    trace.message("Iniciando verificação de regras...", essential=True)
     
     rules = get_all_rules()
-    account_id = init_facebook_api()
-    
-    add_log(f"- Total de regras encontradas: {len(rules)}")
-    add_log(f"- Total de insights de campanhas: {len(insights)}")
+    account_id, api = init_facebook_api()
     
     if not account_id:
-        add_log("❌ ERRO: Não foi possível inicializar a API do Facebook (account_id não encontrado)")
+        trace.message("❌ ERRO: Não foi possível inicializar a API do Facebook (account_id não encontrado)", essential=True)
+        trace.finish()
         return
     
-    if not rules:
-        add_log("❌ ERRO: Nenhuma regra encontrada no banco de dados")
+    # A mesma trava é usada pelo agendador, para que as execuções não se sobreponham
+    lock_name = rules_lock_name(account_id)
+    owner = lock_owner()
+    if not acquire_run_lock(lock_name, owner):
+        trace.message("❌ ERRO: Já existe uma execução de regras em andamento para esta conta", essential=True)
+        trace.finish()
         return
     
-    if not insights:
-        add_log("❌ ERRO: Nenhum insight de campanha disponível para análise")
+    try:
+        apply_rules(ad_insights, rules, account_id, campaign_snapshot, snapshot_max_age,
+                    api=api, trace=trace, insights_level='ad')
+    finally:
+        release_run_lock(lock_name, owner)
+    
+    trace.message("\nVerificação de regras concluída!", essential=True)
+    trace.finish()
+    
+    # As decisões ficam na sessão para a tabela filtrável sobreviver aos reruns
+    st.session_state.rule_trace = trace.to_frame()
+
+# Função para exibir as decisões da última verificação de regras em uma tabela filtrável
+def show_rule_trace():
+    trace_frame = st.session_state.get('rule_trace')
+    if trace_frame is None or trace_frame.empty:
         return
     
-    for insight in insights:
-        campaign_id = insight.get('campaign_id')
-        campaign_name = insight.get('campaign_name')
-        cpa = insight.get('cpa', 0)
-        purchases = insight.get('purchases', 0)
-        
-        add_log(f"\n🔍 Verificando campanha: {campaign_name}")
-        add_log(f"- ID: {campaign_id}")
-        add_log(f"- CPA: R${cpa:.2f}")
-        add_log(f"- Compras: {purchases}")
-        
-        for rule in rules:
-            add_log(f"\n  📋 Verificando regra: {rule['name']}")
-            
-            if not rule.get('is_active', 1):
-                add_log(f"  - Regra inativa, pulando")
-                continue
-            
-            # Iniciar verificação de condições
-            add_log(f"  - Status da regra: {'Ativa' if rule.get('is_active', 1) else 'Inativa'}")
-            
-            # Verificar se estamos usando o formato antigo ou novo de regras
-            if 'is_composite' in rule:
-                # Novo formato (com regras compostas)
-                primary_condition_met = False
-                primary_metric_value = None
-                
-                # Obter valor da métrica primária
-                if rule['primary_metric'] == 'cpa':
-                    primary_metric_value = cpa
-                    add_log(f"  - Verificando condição primária: CPA {rule['primary_operator']} {rule['primary_value']}")
-                    add_log(f"  - Valor atual: R${cpa:.2f}")
-                elif rule['primary_metric'] == 'purchases':
-                    primary_metric_value = purchases
-                    add_log(f"  - Verificando condição primária: Compras {rule['primary_operator']} {rule['primary_value']}")
-                    add_log(f"  - Valor atual: {purchases}")
-                
-                # Verificar condição primária
-                if primary_metric_value is not None:
-                    if rule['primary_operator'] == '<' and primary_metric_value < rule['primary_value']:
-                        primary_condition_met = True
-                    elif rule['primary_operator'] == '<=' and primary_metric_value <= rule['primary_value']:
-                        primary_condition_met = True
-                    elif rule['primary_operator'] == '>' and primary_metric_value > rule['primary_value']:
-                        primary_condition_met = True
-                    elif rule['primary_operator'] == '>=' and primary_metric_value >= rule['primary_value']:
-                        primary_condition_met = True
-                    elif rule['primary_operator'] == '==' and primary_metric_value == rule['primary_value']:
-                        primary_condition_met = True
-                
-                add_log(f"  - Condição primária atendida: {primary_condition_met}")
-                
-                # Se regra não é composta, usa apenas a condição primária
-                if not rule.get('is_composite', 0):
-                    condition_met = primary_condition_met
-                else:
-                    # Para regra composta, verifica também a condição secundária
-                    secondary_condition_met = False
-                    secondary_metric_value = None
-                    
-                    # Obter valor da métrica secundária
-                    if rule.get('secondary_metric') == 'cpa':
-                        secondary_metric_value = cpa
-                        add_log(f"  - Verificando condição secundária: CPA {rule.get('secondary_operator')} {rule.get('secondary_value')}")
-                        add_log(f"  - Valor atual: R${cpa:.2f}")
-                    elif rule.get('secondary_metric') == 'purchases':
-                        secondary_metric_value = purchases
-                        add_log(f"  - Verificando condição secundária: Compras {rule.get('secondary_operator')} {rule.get('secondary_value')}")
-                        add_log(f"  - Valor atual: {purchases}")
-                    
-                    # Verificar condição secundária
-                    if secondary_metric_value is not None:
-                        if rule.get('secondary_operator') == '<' and secondary_metric_value < rule.get('secondary_value', 0):
-                            secondary_condition_met = True
-                        elif rule.get('secondary_operator') == '<=' and secondary_metric_value <= rule.get('secondary_value', 0):
-                            secondary_condition_met = True
-                        elif rule.get('secondary_operator') == '>' and secondary_metric_value > rule.get('secondary_value', 0):
-                            secondary_condition_met = True
-                        elif rule.get('secondary_operator') == '>=' and secondary_metric_value >= rule.get('secondary_value', 0):
-                            secondary_condition_met = True
-                        elif rule.get('secondary_operator') == '==' and secondary_metric_value == rule.get('secondary_value', 0):
-                            secondary_condition_met = True
-                    
-                    add_log(f"  - Condição secundária atendida: {secondary_condition_met}")
-                    
-                    # Combina as condições de acordo com o operador de junção
-                    if rule.get('join_operator') == 'AND':
-                        condition_met = primary_condition_met and secondary_condition_met
-                    elif rule.get('join_operator') == 'OR':
-                        condition_met = primary_condition_met or secondary_condition_met
-                    else:
-                        condition_met = primary_condition_met
-                    
-                    add_log(f"  - Operador de junção: {rule.get('join_operator', 'AND')}")
-            else:
-                # Formato antigo (regras simples)
-                condition_met = False
-                metric_value = None
-                
-                if rule.get('condition_metric') == 'cpa':
-                    metric_value = cpa
-                    add_log(f"  - Verificando condição: CPA {rule.get('condition_operator')} {rule.get('condition_value')}")
-                    add_log(f"  - Valor atual: R${cpa:.2f}")
-                elif rule.get('condition_metric') == 'purchases':
-                    metric_value = purchases
-                    add_log(f"  - Verificando condição: Compras {rule.get('condition_operator')} {rule.get('condition_value')}")
-                    add_log(f"  - Valor atual: {purchases}")
-                
-                if metric_value is not None:
-                    if rule.get('condition_operator') == '<' and metric_value < rule.get('condition_value', 0):
-                        condition_met = True
-                    elif rule.get('condition_operator') == '<=' and metric_value <= rule.get('condition_value', 0):
-                        condition_met = True
-                    elif rule.get('condition_operator') == '>' and metric_value > rule.get('condition_value', 0):
-                        condition_met = True
-                    elif rule.get('condition_operator') == '>=' and metric_value >= rule.get('condition_value', 0):
-                        condition_met = True
-                    elif rule.get('condition_operator') == '==' and metric_value == rule.get('condition_value', 0):
-                        condition_met = True
-            
-            add_log(f"  - Condição final atendida: {condition_met}")
-            
-            if not condition_met:
-                add_log(f"  - Condição não atendida, pulando para próxima regra")
-                continue
-            
-            # Condição atendida, aplicar ação da regra
-            add_log(f"  ✅ CONDIÇÃO ATENDIDA! Executando ação: {rule.get('action_type')}")
-            
-            # Aplicar ação da regra
-            try:
-                campaign = Campaign(campaign_id)
-                
-                # Testar se conseguimos acessar a campanha
-                try:
-                    campaign_data = campaign.api_get(fields=['name', 'status', 'daily_budget', 'lifetime_budget'])
-                    add_log(f"  - Campanha acessada com sucesso: {campaign_data.get('name')}")
-                    add_log(f"  - Status atual: {campaign_data.get('status')}")
-                    add_log(f"  - Orçamento diário: {campaign_data.get('daily_budget')}")
-                    add_log(f"  - Orçamento total: {campaign_data.get('lifetime_budget')}")
-                except Exception as e:
-                    add_log(f"  ❌ ERRO ao acessar dados da campanha: {str(e)}")
-                    continue
-                
-                success = False
-                message = ""
-                
-                if rule.get('action_type') == 'duplicate_budget':
-                    add_log(f"  - Tentando duplicar orçamento")
-                    
-                    if 'daily_budget' in campaign_data and campaign_data['daily_budget']:
-                        new_budget = int(campaign_data['daily_budget']) * 2
-                        add_log(f"  - Duplicando orçamento diário de {campaign_data['daily_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'daily_budget': new_budget})
-                            message = f"Orçamento diário duplicado de {campaign_data['daily_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    elif 'lifetime_budget' in campaign_data and campaign_data['lifetime_budget']:
-                        new_budget = int(campaign_data['lifetime_budget']) * 2
-                        add_log(f"  - Duplicando orçamento total de {campaign_data['lifetime_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'lifetime_budget': new_budget})
-                            message = f"Orçamento total duplicado de {campaign_data['lifetime_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    else:
-                        add_log(f"  ❌ ERRO: Nenhum orçamento encontrado para duplicar")
-                
-                elif rule.get('action_type') == 'triple_budget':
-                    add_log(f"  - Tentando triplicar orçamento")
-                    
-                    if 'daily_budget' in campaign_data and campaign_data['daily_budget']:
-                        new_budget = int(campaign_data['daily_budget']) * 3
-                        add_log(f"  - Triplicando orçamento diário de {campaign_data['daily_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'daily_budget': new_budget})
-                            message = f"Orçamento diário triplicado de {campaign_data['daily_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    elif 'lifetime_budget' in campaign_data and campaign_data['lifetime_budget']:
-                        new_budget = int(campaign_data['lifetime_budget']) * 3
-                        add_log(f"  - Triplicando orçamento total de {campaign_data['lifetime_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'lifetime_budget': new_budget})
-                            message = f"Orçamento total triplicado de {campaign_data['lifetime_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    else:
-                        add_log(f"  ❌ ERRO: Nenhum orçamento encontrado para triplicar")
-                
-                elif rule.get('action_type') == 'pause_campaign':
-                    add_log(f"  - Tentando pausar campanha")
-                    
-                    try:
-                        add_log(f"  - Estado atual: {campaign_data.get('status')}")
-                        campaign.api_update(params={'status': 'PAUSED'})
-                        message = "Campanha pausada"
-                        success = True
-                        add_log(f"  ✅ Sucesso: Campanha pausada")
-                    except Exception as e:
-                        add_log(f"  ❌ ERRO ao pausar campanha: {str(e)}")
-                
-                elif rule.get('action_type') == 'halve_budget':
-                    add_log(f"  - Tentando reduzir orçamento pela metade")
-                    
-                    if 'daily_budget' in campaign_data and campaign_data['daily_budget']:
-                        new_budget = int(campaign_data['daily_budget']) // 2
-                        add_log(f"  - Reduzindo orçamento diário de {campaign_data['daily_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'daily_budget': new_budget})
-                            message = f"Orçamento diário reduzido pela metade de {campaign_data['daily_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    elif 'lifetime_budget' in campaign_data and campaign_data['lifetime_budget']:
-                        new_budget = int(campaign_data['lifetime_budget']) // 2
-                        add_log(f"  - Reduzindo orçamento total de {campaign_data['lifetime_budget']} para {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'lifetime_budget': new_budget})
-                            message = f"Orçamento total reduzido pela metade de {campaign_data['lifetime_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    else:
-                        add_log(f"  ❌ ERRO: Nenhum orçamento encontrado para reduzir")
-                
-                elif rule.get('action_type') == 'custom_budget_multiplier' and rule.get('action_value'):
-                    add_log(f"  - Tentando aplicar multiplicador personalizado de {rule.get('action_value')}")
-                    
-                    if 'daily_budget' in campaign_data and campaign_data['daily_budget']:
-                        new_budget = int(int(campaign_data['daily_budget']) * rule.get('action_value', 1))
-                        add_log(f"  - Multiplicando orçamento diário de {campaign_data['daily_budget']} por {rule.get('action_value')} = {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'daily_budget': new_budget})
-                            message = f"Orçamento diário multiplicado por {rule.get('action_value')} de {campaign_data['daily_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    elif 'lifetime_budget' in campaign_data and campaign_data['lifetime_budget']:
-                        new_budget = int(int(campaign_data['lifetime_budget']) * rule.get('action_value', 1))
-                        add_log(f"  - Multiplicando orçamento total de {campaign_data['lifetime_budget']} por {rule.get('action_value')} = {new_budget}")
-                        
-                        try:
-                            campaign.api_update(params={'lifetime_budget': new_budget})
-                            message = f"Orçamento total multiplicado por {rule.get('action_value')} de {campaign_data['lifetime_budget']} para {new_budget}"
-                            success = True
-                            add_log(f"  ✅ Sucesso: {message}")
-                        except Exception as e:
-                            add_log(f"  ❌ ERRO ao atualizar orçamento: {str(e)}")
-                    else:
-                        add_log(f"  ❌ ERRO: Nenhum orçamento encontrado para multiplicar")
-                
-                # Registrar execução da regra
-                add_log(f"  - Registrando execução no histórico: {success}, {message}")
-                log_result = log_rule_execution(
-                    rule_id=rule.get('id'),
-                    ad_object_id=campaign_id,
-                    ad_object_type='campaign',
-                    ad_object_name=campaign_name,
-                    was_successful=success,
-                    message=message
-                )
-                add_log(f"  - Resultado do log: {log_result}")
-                
-            except Exception as e:
-                error_message = f"Erro ao aplicar regra: {str(e)}"
-                add_log(f"  ❌ ERRO GERAL: {error_message}")
-                log_rule_execution(
-                    rule_id=rule.get('id'),
-                    ad_object_id=campaign_id,
-                    ad_object_type='campaign',
-                    ad_object_name=campaign_name,
-                    was_successful=False,
-                    message=error_message
-                )
+    st.subheader("Decisões da Última Verificação de Regras")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        outcome_options = [outcome for outcome in OUTCOME_LABELS if outcome in set(trace_frame['outcome'])]
+        selected_outcomes = st.multiselect(
+            "Resultado:",
+            outcome_options,
+            default=outcome_options,
+            format_func=lambda x: OUTCOME_LABELS[x]
+        )
     
-    add_log("\nVerificação de regras concluída!")
+    with col2:
+        level_options = [level for level in RULE_LEVELS if level in set(trace_frame['level'])]
+        selected_levels = st.multiselect(
+            "Nível:",
+            level_options,
+            default=level_options,
+            format_func=lambda x: LEVEL_LABELS[x]
+        )
+    
+    with col3:
+        search = st.text_input("Buscar objeto ou regra:").strip()
+    
+    mask = trace_frame['outcome'].isin(selected_outcomes) & trace_frame['level'].isin(selected_levels)
+    if search:
+        mask &= (
+            trace_frame['object_name'].astype(str).str.contains(search, case=False, regex=False)
+            | trace_frame['object_id'].astype(str).str.contains(search, regex=False)
+            | trace_frame['rule_name'].astype(str).str.contains(search, case=False, regex=False)
+        )
+    filtered = trace_frame[mask]
+    
+    show_dataframe(make_dataframe({
+        "Resultado": filtered['outcome'].map(OUTCOME_LABELS),
+        "Nível": filtered['level'].map(LEVEL_LABELS),
+        "ID do Objeto": filtered['object_id'],
+        "Nome do Objeto": filtered['object_name'],
+        "Regra": filtered['rule_name'],
+        "Ação": filtered['action_type'],
+        "CPA (R$)": filtered['cpa'],
+        "Compras": filtered['purchases'],
+        "Mensagem": filtered['message']
+    }))
+    st.caption(f"{len(filtered)} de {len(trace_frame)} decisões")
 
 # Interface do Streamlit
 def main():
@@ -961,6 +251,7 @@ def main():
     active_config = get_active_api_config()
     all_configs = get_all_api_configs()
     account_id = None
+    api = None
     
     # Seletor de contas na barra lateral
     if all_configs:
@@ -995,22 +286,30 @@ def main():
         account_id = active_config["account_id"]
         
         try:
-            # Inicializar API do Facebook
-            FacebookAdsApi.init(
-                app_id=active_config["app_id"],
-                app_secret=active_config["app_secret"],
-                access_token=active_config["access_token"]
-            )
+            # API da conta, criada uma vez e reaproveitada entre os reruns (chamadas
+            # passam pelo balde de requisições da conta)
+            api = get_facebook_api(active_config)
             st.sidebar.success(f"Conectado: {active_config['name']}")
         except Exception as e:
             st.sidebar.error(f"Erro na conexão: {e}")
+        
+        # Forçar nova leitura da Graph API, ignorando o cache; o catálogo é lido
+        # por completo, removendo os objetos excluídos no Gerenciador de Anúncios
+        if st.sidebar.button("Recarregar dados da API"):
+            graph_cache.invalidate(account_id)
+            expire_insights_sync(account_id)
+            expire_catalog_sync(account_id)
     
     # Menu de navegação
     page = st.sidebar.radio(
         "Selecione uma página:",
-        ["Configuração de Contas", "Campanhas", "Conjuntos de Anúncios", "Anúncios", "Regras", "Execuções", "Dashboard"]
+        ["Configuração de Contas", "Campanhas", "Conjuntos de Anúncios", "Anúncios", "Regras", "Execuções", "Dashboard", "Desempenho da API"]
     )
     
+    # Chamadas à Graph API feitas daqui em diante são atribuídas à página
+    set_graph_caller(f"página: {page}")
+    set_profile_page(page)
+    
     # Verificar se existe pelo menos uma configuração
     if not all_configs:
         if page != "Configuração de Contas":
@@ -1046,6 +345,8 @@ def main():
                         
                         if st.button("Excluir", key=f"delete_{config['id']}"):
                             if delete_api_config(config['id']):
+                                # Fechar as conexões abertas com as credenciais da conta
+                                release_facebook_api(config['id'])
                                 st.success(f"Conta {config['name']} excluída com sucesso!")
                                 st.rerun()
         
@@ -1099,6 +400,17 @@ def main():
             }.get(x)
         )
         
+        # Detalhe do log da verificação de regras
+        trace_verbosity = st.selectbox(
+            "Detalhe do log de regras:",
+            list(VERBOSITY_LEVELS),
+            index=1,
+            format_func=lambda x: VERBOSITY_LEVELS[x]
+        )
+        
+        # Busca por nome na lista de campanhas (as regras continuam valendo para todas)
+        campaign_search = st.text_input("Buscar campanha por nome:", key="campaign_search")
+        
         # Adicionar campo para ID de campanha para teste direto
         test_campaign_id = st.text_input("ID da Campanha para Teste Direto (opcional)")
         
@@ -1108,35 +420,51 @@ def main():
             # Botão para atualizar dados
             if st.button("Atualizar Campanhas"):
                 with st.spinner("Carregando campanhas..."):
-                    campaigns = get_facebook_campaigns(account_id)
+                    campaigns = get_facebook_campaigns(account_id, api=api)
                     
                     if campaigns:
                         # Preparar dados para tabela
+                        campaign_ids = [campaign.get("id") for campaign in campaigns]
+                        listed_campaigns = (
+                            get_facebook_campaigns(account_id, api=api, search=campaign_search)
+                            if campaign_search else campaigns
+                        )
                         campaign_data = []
-                        campaign_ids = []
                         
-                        for campaign in campaigns:
-                            campaign_dict = campaign.export_all_data()
+                        for campaign in listed_campaigns:
                             campaign_data.append({
-                                "ID": campaign_dict.get("id"),
-                                "Nome": campaign_dict.get("name"),
-                                "Status": campaign_dict.get("status"),
-                                "Objetivo": campaign_dict.get("objective"),
-                                "Orçamento Diário": campaign_dict.get("daily_budget"),
-                                "Orçamento Total": campaign_dict.get("lifetime_budget"),
-                                "Data de Criação": campaign_dict.get("created_time")
+                                "ID": campaign.get("id"),
+                                "Nome": campaign.get("name"),
+                                "Status": campaign.get("status"),
+                                "Objetivo": campaign.get("objective"),
+                                "Orçamento Diário": campaign.get("daily_budget"),
+                                "Orçamento Total": campaign.get("lifetime_budget"),
+                                "Data de Criação": campaign.get("created_time")
                             })
-                            campaign_ids.append(campaign_dict.get("id"))
+                        
+                        # Snapshot com orçamentos e status, reutilizado pelas regras
+                        # Os dados têm a idade da última sincronização do catálogo; os
+                        # antigos são relidos antes de planejar as ações
+                        campaign_snapshot = build_campaign_snapshot(
+                            campaigns, catalog_synced_at(account_id, 'campaign')
+                        )
                         
                         # Exibir tabela de campanhas
                         st.subheader("Lista de Campanhas")
-                        campaign_df = pd.DataFrame(campaign_data)
-                        st.dataframe(campaign_df)
+                        campaign_df = make_dataframe(campaign_data)
+                        show_dataframe(campaign_df)
                         
                         # Obter e exibir insights
                         if campaign_ids:
                             with st.spinner("Carregando insights..."):
-                                insights = get_campaign_insights(account_id, campaign_ids, time_range)
+                                # Uma única leitura (com sincronização) dos insights por anúncio,
+                                # usada pelas regras; os totais por campanha vêm do mesmo histórico
+                                campaign_id_set = set(campaign_ids)
+                                ad_insights = [
+                                    insight for insight in get_account_insights(account_id, 'ad', time_range, api=api)
+                                    if insight['campaign_id'] in campaign_id_set
+                                ]
+                                insights = get_local_campaign_insights(account_id, campaign_ids, time_range) if ad_insights else []
                                 
                                 if insights:
                                     insight_data = []
@@ -1154,14 +482,15 @@ def main():
                                         })
                                     
                                     st.subheader(f"Insights das Campanhas ({time_range})")
-                                    insight_df = pd.DataFrame(insight_data)
-                                    st.dataframe(insight_df)
+                                    insight_df = make_dataframe(insight_data)
+                                    show_dataframe(insight_df)
                                     
                                     # Verificar e aplicar regras com versão de debug
                                     st.subheader("Verificação de Regras")
-                                    with st.spinner("Verificando e aplicando regras..."):
+                                    with st.spinner("Verificando e aplicando regras..."), graph_caller("regras: página Campanhas"):
                                         # Usar nossa função de debug
-                                        check_and_apply_rules(insights)
+                                        check_and_apply_rules(ad_insights, campaign_snapshot,
+                                                              verbosity=trace_verbosity)
                                 else:
                                     st.info("Nenhum insight encontrado.")
                         else:
@@ -1172,13 +501,16 @@ def main():
         with col2:
             if test_campaign_id and st.button("Testar Pausa Direta"):
                 test_pause_campaign(test_campaign_id)
+        
+        # Tabela da última verificação de regras (fora do botão, para os filtros funcionarem)
+        show_rule_trace()
     
     # Página: Conjuntos de Anúncios
     elif page == "Conjuntos de Anúncios" and account_id:
         st.header("Conjuntos de Anúncios")
         
         # Obter campanhas para filtro
-        campaigns = get_facebook_campaigns(account_id)
+        campaigns = get_facebook_campaigns(account_id, api=api)
         campaign_options = [{"label": campaign["name"], "value": campaign["id"]} for campaign in campaigns]
         campaign_options.insert(0, {"label": "Todas as campanhas", "value": ""})
         
@@ -1189,31 +521,33 @@ def main():
             format_func=lambda x: next((opt["label"] for opt in campaign_options if opt["value"] == x), x)
         )
         
+        # Busca por nome (catálogo local)
+        adset_search = st.text_input("Buscar conjunto por nome:", key="adset_search")
+        
         # Botão para atualizar dados
         if st.button("Atualizar Conjuntos de Anúncios"):
             with st.spinner("Carregando conjuntos de anúncios..."):
-                adsets = get_facebook_adsets(account_id, selected_campaign)
+                adsets = get_facebook_adsets(account_id, selected_campaign, api=api, search=adset_search)
                 
                 if adsets:
                     # Preparar dados para tabela
                     adset_data = []
                     
                     for adset in adsets:
-                        adset_dict = adset.export_all_data()
                         adset_data.append({
-                            "ID": adset_dict.get("id"),
-                            "Nome": adset_dict.get("name"),
-                            "Status": adset_dict.get("status"),
-                            "ID da Campanha": adset_dict.get("campaign_id"),
-                            "Orçamento Diário": adset_dict.get("daily_budget"),
-                            "Orçamento Total": adset_dict.get("lifetime_budget"),
-                            "Valor da Oferta": adset_dict.get("bid_amount")
+                            "ID": adset.get("id"),
+                            "Nome": adset.get("name"),
+                            "Status": adset.get("status"),
+                            "ID da Campanha": adset.get("campaign_id"),
+                            "Orçamento Diário": adset.get("daily_budget"),
+                            "Orçamento Total": adset.get("lifetime_budget"),
+                            "Valor da Oferta": adset.get("bid_amount")
                         })
                     
                     # Exibir tabela de conjuntos de anúncios
                     st.subheader("Lista de Conjuntos de Anúncios")
-                    adset_df = pd.DataFrame(adset_data)
-                    st.dataframe(adset_df)
+                    adset_df = make_dataframe(adset_data)
+                    show_dataframe(adset_df)
                 else:
                     st.info("Nenhum conjunto de anúncios encontrado.")
     
@@ -1222,7 +556,7 @@ def main():
         st.header("Anúncios")
         
         # Obter conjuntos de anúncios para filtro
-        adsets = get_facebook_adsets(account_id)
+        adsets = get_facebook_adsets(account_id, api=api)
         adset_options = [{"label": adset["name"], "value": adset["id"]} for adset in adsets]
         adset_options.insert(0, {"label": "Todos os conjuntos de anúncios", "value": ""})
         
@@ -1233,30 +567,32 @@ def main():
             format_func=lambda x: next((opt["label"] for opt in adset_options if opt["value"] == x), x)
         )
         
+        # Busca por nome (catálogo local)
+        ad_search = st.text_input("Buscar anúncio por nome:", key="ad_search")
+        
         # Botão para atualizar dados
         if st.button("Atualizar Anúncios"):
             with st.spinner("Carregando anúncios..."):
-                ads = get_facebook_ads(account_id, selected_adset)
+                ads = get_facebook_ads(account_id, selected_adset, api=api, search=ad_search)
                 
                 if ads:
                     # Preparar dados para tabela
                     ad_data = []
                     
                     for ad in ads:
-                        ad_dict = ad.export_all_data()
                         ad_data.append({
-                            "ID": ad_dict.get("id"),
-                            "Nome": ad_dict.get("name"),
-                            "Status": ad_dict.get("status"),
-                            "ID do Conjunto": ad_dict.get("adset_id"),
-                            "Data de Criação": ad_dict.get("created_time"),
-                            "Última Atualização": ad_dict.get("updated_time")
+                            "ID": ad.get("id"),
+                            "Nome": ad.get("name"),
+                            "Status": ad.get("status"),
+                            "ID do Conjunto": ad.get("adset_id"),
+                            "Data de Criação": ad.get("created_time"),
+                            "Última Atualização": ad.get("updated_time")
                         })
                     
                     # Exibir tabela de anúncios
                     st.subheader("Lista de Anúncios")
-                    ad_df = pd.DataFrame(ad_data)
-                    st.dataframe(ad_df)
+                    ad_df = make_dataframe(ad_data)
+                    show_dataframe(ad_df)
                 else:
                     st.info("Nenhum anúncio encontrado.")
     
@@ -1319,11 +655,12 @@ def main():
                         elif rule['action_type'] == 'triple_budget':
                             action_text = "Triplicar orçamento"
                         elif rule['action_type'] == 'pause_campaign':
-                            action_text = "Pausar campanha"
+                            action_text = "Pausar"
                         elif rule['action_type'] == 'halve_budget':
                             action_text = "Reduzir orçamento pela metade"
                             
                         st.markdown(f"**Ação:** {action_text}")
+                        st.markdown(f"**Aplicar em:** {LEVEL_LABELS[rule_level(rule)]}")
                         st.markdown(f"**Criada em:** {rule['created_at']}")
                     
                     with col3:
@@ -1338,7 +675,72 @@ def main():
                             key=f"status_{rule['id']}",
                             on_change=lambda: toggle_rule_status(rule['id'], not rule['is_active'])
                         )
-        
+
+        # Simulação das regras sobre o histórico diário, sem alterar as campanhas
+        if rules and account_id:
+            with st.expander("Simular regras no histórico (backtest)"):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    backtest_days = st.number_input(
+                        "Dias simulados", min_value=1, max_value=INSIGHTS_RETENTION_DAYS - 30,
+                        value=BACKTEST_DAYS, step=1
+                    )
+                with col2:
+                    backtest_range = st.selectbox(
+                        "Janela verificada pelas regras",
+                        ["last_7d", "last_30d", "yesterday"],
+                        format_func=lambda x: {
+                            "last_7d": "Últimos 7 dias",
+                            "last_30d": "Últimos 30 dias",
+                            "yesterday": "Ontem"
+                        }.get(x)
+                    )
+                with col3:
+                    backtest_inactive = st.checkbox("Incluir regras inativas", value=True)
+
+                result = None
+                if st.button("Simular"):
+                    with st.spinner("Simulando regras..."):
+                        try:
+                            result = backtest_rules(
+                                account_id, rules, int(backtest_days), backtest_range,
+                                include_inactive=backtest_inactive, sync=True, api=api
+                            )
+                        except Exception as e:
+                            st.error(f"Erro ao simular regras: {e}")
+
+                if result is not None:
+                    totals = result['totals']
+
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("Gasto real", f"R$ {totals['spend']:.2f}")
+                    with col2:
+                        st.metric("Gasto simulado", f"R$ {totals['simulated_spend']:.2f}",
+                                  f"{totals['simulated_spend'] - totals['spend']:.2f}")
+                    with col3:
+                        st.metric("Compras simuladas", f"{totals['simulated_purchases']:.0f}",
+                                  f"{totals['simulated_purchases'] - totals['purchases']:.0f}")
+                    with col4:
+                        st.metric("CPA simulado", f"R$ {totals['simulated_cpa']:.2f}")
+
+                    rules_df = result['rules'].copy()
+                    rules_df['level'] = rules_df['level'].map(LEVEL_LABELS)
+                    show_dataframe(rules_df.rename(columns={
+                        "rule_name": "Regra", "level": "Aplicar em", "action_type": "Ação",
+                        "fires": "Disparos", "objects": "Objetos atingidos",
+                        "first_date": "Primeiro disparo", "last_date": "Último disparo"
+                    }).drop(columns=["rule_id"]))
+
+                    show_line_chart(
+                        result['daily'].rename(columns={"spend": "Gasto real", "simulated_spend": "Gasto simulado"}),
+                        x="date", y=["Gasto real", "Gasto simulado"]
+                    )
+                    st.caption(
+                        "Uma verificação por dia, com efeito a partir do dia seguinte; o gasto simulado "
+                        "supõe gasto proporcional ao orçamento e CPA constante."
+                    )
+
         st.subheader("Criar Nova Regra")
         
         # Interface dinâmica fora do formulário
@@ -1481,7 +883,15 @@ def main():
             
             # Ação a ser executada
             st.subheader("Ação a Executar")
-            col1, col2 = st.columns(2)
+            col0, col1, col2 = st.columns(3)
+            
+            with col0:
+                # Nível do objeto alvo (conjuntos e campanhas usam a soma dos anúncios)
+                target_level = st.selectbox(
+                    "Aplicar em",
+                    options=RULE_LEVELS,
+                    format_func=lambda x: LEVEL_LABELS[x]
+                )
             
             with col1:
                 action_type = st.selectbox(
@@ -1496,7 +906,7 @@ def main():
                     format_func=lambda x: {
                         "duplicate_budget": "Duplicar orçamento", 
                         "triple_budget": "Triplicar orçamento", 
-                        "pause_campaign": "Pausar campanha", 
+                        "pause_campaign": "Pausar", 
                         "halve_budget": "Reduzir orçamento pela metade",
                         "custom_budget_multiplier": "Multiplicar orçamento por valor personalizado"
                     }.get(x)
@@ -1533,13 +943,13 @@ def main():
             elif action_type == "triple_budget":
                 action_text = "Triplicar orçamento"
             elif action_type == "pause_campaign":
-                action_text = "Pausar campanha"
+                action_text = "Pausar"
             elif action_type == "halve_budget":
                 action_text = "Reduzir orçamento pela metade"
             elif action_type == "custom_budget_multiplier":
                 action_text = f"Multiplicar orçamento por {action_value}"
             
-            rule_summary += f", **ENTÃO** {action_text}"
+            rule_summary += f", **ENTÃO** {action_text} ({LEVEL_LABELS[target_level].lower()})"
             
             st.markdown(rule_summary)
             
@@ -1574,7 +984,8 @@ def main():
                     if add_rule(
                         name, description, "custom", primary_metric, primary_operator, 
                         final_primary_value, action_type, action_value, st.session_state.is_composite, 
-                        secondary_metric, secondary_operator, final_secondary_value, join_operator
+                        secondary_metric, secondary_operator, final_secondary_value, join_operator,
+                        target_level
                     ):
                         st.success("Regra criada com sucesso!")
                         st.rerun()
@@ -1585,12 +996,132 @@ def main():
     elif page == "Execuções":
         st.header("Histórico de Execuções de Regras")
         
+        # Situação do executor de regras em segundo plano (rule_scheduler.py)
+        with st.expander("Execução automática das regras"):
+            st.markdown("As regras são executadas em segundo plano por `python rule_scheduler.py`.")
+            
+            schedules = get_rule_schedules()
+            if schedules:
+                schedule_data = []
+                for schedule in schedules:
+                    schedule_data.append({
+                        "Conta": f"{schedule['name']} ({schedule['account_id']})",
+                        "Intervalo (min)": (schedule['interval_seconds'] or DEFAULT_INTERVAL_SECONDS) // 60,
+                        "Última Execução": datetime.fromtimestamp(schedule['last_started_at']).strftime('%Y-%m-%d %H:%M:%S') if schedule['last_started_at'] else "-",
+                        "Situação": schedule['last_status'] or "-",
+                        "Mensagem": schedule['last_message'] or ""
+                    })
+                show_dataframe(make_dataframe(schedule_data))
+                
+                # Intervalo por conta
+                with st.form("rule_schedule_form"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        schedule_index = st.selectbox(
+                            "Conta:",
+                            range(len(schedules)),
+                            format_func=lambda i: f"{schedules[i]['name']} ({schedules[i]['account_id']})"
+                        )
+                    with col2:
+                        interval_minutes = st.number_input(
+                            "Intervalo entre execuções (minutos)",
+                            min_value=5,
+                            step=5,
+                            value=DEFAULT_INTERVAL_SECONDS // 60
+                        )
+                    if st.form_submit_button("Salvar intervalo"):
+                        update_rule_schedule(schedules[schedule_index]['config_id'], interval_seconds=int(interval_minutes) * 60)
+                        st.success("Intervalo atualizado!")
+                        st.rerun()
+
+                # Executar agora as regras de todas as contas, em paralelo
+                col1, col2 = st.columns([1, 2])
+                with col1:
+                    max_workers = st.number_input(
+                        "Contas em paralelo",
+                        min_value=1,
+                        max_value=32,
+                        value=DEFAULT_MAX_WORKERS
+                    )
+                with col2:
+                    st.write("")
+                    run_all_clicked = st.button("Executar regras de todas as contas agora")
+
+                if run_all_clicked:
+                    with st.spinner(f"Executando regras de {len(schedules)} contas..."):
+                        started_at = time.monotonic()
+                        results = run_all_accounts(max_workers=int(max_workers))
+                        elapsed = time.monotonic() - started_at
+
+                    failed = sum(1 for result in results if result['status'] == 'error')
+                    if failed:
+                        st.warning(f"{len(results)} contas executadas em {elapsed:.1f}s, {failed} com falha.")
+                    else:
+                        st.success(f"{len(results)} contas executadas em {elapsed:.1f}s.")
+
+                    result_data = []
+                    for result in results:
+                        summary = result['summary'] or {}
+                        result_data.append({
+                            "Conta": f"{result['name']} ({result['account_id']})",
+                            "Situação": {'ok': "✅ OK", 'error': "❌ Falha", 'skipped': "⏭️ Em execução"}[result['status']],
+                            "Tempo (s)": round(result['seconds'], 1),
+                            "Condições Atendidas": summary.get('matches', 0),
+                            "Ações Aplicadas": summary.get('successes', 0),
+                            "Ações com Falha": summary.get('failures', 0),
+                            "Erro": result['error'] or ""
+                        })
+                    show_dataframe(make_dataframe(result_data))
+        
+        # Filtros do histórico
+        rules = get_all_rules()
+        rule_options = {rule['id']: rule['name'] for rule in rules}
+        
+        col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+        
+        with col1:
+            selected_rule_id = st.selectbox(
+                "Regra:",
+                options=[None] + list(rule_options),
+                format_func=lambda x: "Todas as regras" if x is None else rule_options[x]
+            )
+        
+        with col2:
+            object_filter = st.text_input("ID do objeto:").strip()
+        
+        with col3:
+            success_filter = st.selectbox(
+                "Sucesso:",
+                options=[None, True, False],
+                format_func=lambda x: {None: "Todos", True: "Sim", False: "Não"}.get(x)
+            )
+        
+        with col4:
+            page_size = st.selectbox("Por página:", [50, 100, 250, 500], index=1)
+        
+        # Pilha de cursores das páginas visitadas; reinicia quando os filtros mudam
+        filter_key = (selected_rule_id, object_filter, success_filter, page_size)
+        if st.session_state.get('executions_filter_key') != filter_key:
+            st.session_state.executions_filter_key = filter_key
+            st.session_state.executions_cursors = [None]
+        
         # Botão para atualizar histórico
         if st.button("Atualizar Histórico"):
+            st.session_state.executions_cursors = [None]
             st.rerun()
         
-        # Obter histórico de execuções
-        executions = get_rule_executions()
+        cursors = st.session_state.executions_cursors
+        
+        # Obter uma página do histórico (uma linha extra indica se há próxima página)
+        executions = get_rule_executions(
+            limit=page_size + 1,
+            before=cursors[-1],
+            rule_id=selected_rule_id,
+            ad_object_id=object_filter,
+            was_successful=success_filter
+        )
+        has_next_page = len(executions) > page_size
+        executions = executions[:page_size]
         
         if executions:
             execution_data = []
@@ -1606,10 +1137,27 @@ def main():
                 })
             
             # Exibir tabela de execuções
-            execution_df = pd.DataFrame(execution_data)
-            st.dataframe(execution_df)
+            execution_df = make_dataframe(execution_data)
+            show_dataframe(execution_df)
         else:
             st.info("Nenhum histórico de execução encontrado.")
+        
+        # Navegação entre páginas
+        col1, col2, col3 = st.columns([1, 1, 3])
+        
+        with col1:
+            if st.button("← Página anterior", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        
+        with col2:
+            if st.button("Próxima página →", disabled=not has_next_page):
+                last_execution = executions[-1]
+                cursors.append((last_execution["executed_at"], last_execution["id"]))
+                st.rerun()
+        
+        with col3:
+            st.caption(f"Página {len(cursors)}")
     
     # Página: Dashboard
     elif page == "Dashboard" and account_id:
@@ -1629,67 +1177,187 @@ def main():
         # Botão para atualizar dashboard
         if st.button("Atualizar Dashboard"):
             with st.spinner("Carregando dados..."):
-                campaigns = get_facebook_campaigns(account_id)
+                # Insights somados por campanha no histórico local, sem listar as campanhas antes
+                insights = get_account_insights(account_id, 'campaign', time_range, api=api)
                 
-                if campaigns:
-                    campaign_ids = [campaign["id"] for campaign in campaigns]
-                    insights = get_campaign_insights(account_id, campaign_ids, time_range)
+                if insights:
+                    # Métricas gerais
+                    total_spend = sum(float(insight.get("spend", 0)) for insight in insights)
+                    total_impressions = sum(int(insight.get("impressions", 0)) for insight in insights)
+                    total_clicks = sum(int(insight.get("clicks", 0)) for insight in insights)
+                    total_purchases = sum(insight.get("purchases", 0) for insight in insights)
                     
-                    if insights:
-                        # Métricas gerais
-                        total_spend = sum(float(insight.get("spend", 0)) for insight in insights)
-                        total_impressions = sum(int(insight.get("impressions", 0)) for insight in insights)
-                        total_clicks = sum(int(insight.get("clicks", 0)) for insight in insights)
-                        total_purchases = sum(insight.get("purchases", 0) for insight in insights)
-                        
-                        # Calcular médias
-                        avg_ctr = total_clicks / total_impressions * 100 if total_impressions > 0 else 0
-                        avg_cpc = total_spend / total_clicks if total_clicks > 0 else 0
-                        avg_cpa = total_spend / total_purchases if total_purchases > 0 else 0
-                        
-                        # Exibir métricas em cards
-                        col1, col2, col3, col4 = st.columns(4)
-                        
-                        with col1:
-                            st.metric("Gasto Total", f"R$ {total_spend:.2f}")
-                        
-                        with col2:
-                            st.metric("Compras", total_purchases)
-                        
-                        with col3:
-                            st.metric("CTR Médio", f"{avg_ctr:.2f}%")
-                        
-                        with col4:
-                            st.metric("CPA Médio", f"R$ {avg_cpa:.2f}")
-                        
-                        # Gráfico de desempenho por campanha
-                        st.subheader("Desempenho por Campanha")
-                        
-                        campaign_data = []
-                        for insight in insights:
-                            campaign_data.append({
-                                "Campanha": insight.get("campaign_name", "Desconhecida"),
-                                "Gasto": float(insight.get("spend", 0)),
-                                "Compras": insight.get("purchases", 0),
-                                "CPA": float(insight.get("cpa", 0))
-                            })
-                        
-                        campaign_df = pd.DataFrame(campaign_data)
-                        
-                        # Gráfico de barras para gasto e compras
-                        st.bar_chart(campaign_df, x="Campanha", y=["Gasto", "Compras"])
-                        
-                        # Gráfico de barras para CPA
-                        st.subheader("CPA por Campanha")
-                        st.bar_chart(campaign_df, x="Campanha", y=["CPA"])
-                        
-                        # Tabela detalhada
-                        st.subheader("Dados Detalhados")
-                        st.dataframe(campaign_df)
-                    else:
-                        st.info("Nenhum insight encontrado para o período selecionado.")
+                    # Calcular médias
+                    avg_ctr = total_clicks / total_impressions * 100 if total_impressions > 0 else 0
+                    avg_cpc = total_spend / total_clicks if total_clicks > 0 else 0
+                    avg_cpa = total_spend / total_purchases if total_purchases > 0 else 0
+                    
+                    # Exibir métricas em cards
+                    col1, col2, col3, col4 = st.columns(4)
+                    
+                    with col1:
+                        st.metric("Gasto Total", f"R$ {total_spend:.2f}")
+                    
+                    with col2:
+                        st.metric("Compras", total_purchases)
+                    
+                    with col3:
+                        st.metric("CTR Médio", f"{avg_ctr:.2f}%")
+                    
+                    with col4:
+                        st.metric("CPA Médio", f"R$ {avg_cpa:.2f}")
+                    
+                    # Gráfico de desempenho por campanha
+                    st.subheader("Desempenho por Campanha")
+                    
+                    campaign_data = []
+                    for insight in insights:
+                        campaign_data.append({
+                            "Campanha": insight.get("campaign_name", "Desconhecida"),
+                            "Gasto": float(insight.get("spend", 0)),
+                            "Compras": insight.get("purchases", 0),
+                            "CPA": float(insight.get("cpa", 0))
+                        })
+                    
+                    campaign_df = make_dataframe(campaign_data)
+                    
+                    # Gráfico de barras para gasto e compras
+                    show_bar_chart(campaign_df, x="Campanha", y=["Gasto", "Compras"])
+                    
+                    # Gráfico de barras para CPA
+                    st.subheader("CPA por Campanha")
+                    show_bar_chart(campaign_df, x="Campanha", y=["CPA"])
+                    
+                    # Tabela detalhada
+                    st.subheader("Dados Detalhados")
+                    show_dataframe(campaign_df)
                 else:
-                    st.info("Nenhuma campanha encontrada.")
+                    st.info("Nenhum insight encontrado para o período selecionado.")
+    
+    # Página: Desempenho da API
+    elif page == "Desempenho da API":
+        st.header("Desempenho da API")
+        st.caption("Chamadas à Graph API registradas: latência, tamanho das respostas e uso informado pela API")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            period_hours = st.selectbox(
+                "Período:",
+                [24, 24 * 7, 24 * 30],
+                format_func=lambda x: {24: "Últimas 24 horas", 24 * 7: "Últimos 7 dias", 24 * 30: "Últimos 30 dias"}.get(x)
+            )
+        with col2:
+            only_active_account = st.checkbox("Somente a conta selecionada", value=bool(account_id))
+        
+        calls = load_graph_calls(
+            time.time() - period_hours * 3600,
+            account_id=account_id if only_active_account else None
+        )
+        
+        if calls.empty:
+            st.info("Nenhuma chamada registrada no período.")
+        else:
+            # Métricas gerais
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Chamadas", len(calls))
+            with col2:
+                st.metric("Erros", int((calls["status"] >= 400).sum()))
+            with col3:
+                st.metric("Dados recebidos", f"{calls['response_bytes'].sum() / 2 ** 20:.1f} MB")
+            with col4:
+                st.metric("Latência p95", f"{np.percentile(calls['latency_ms'], 95):.0f} ms")
+            
+            column_labels = {
+                "caller": "Origem", "endpoint": "Endpoint", "fields": "Campos", "calls": "Chamadas",
+                "errors": "Erros", "response_mb": "MB recebidos", "rows": "Linhas",
+                "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "max_usage_pct": "Uso máximo (%)"
+            }
+            
+            # Quem mais chama a API
+            st.subheader("Origens das chamadas")
+            by_caller = summarize_graph_calls(calls, ["caller"])
+            show_dataframe(by_caller.rename(columns=column_labels), use_container_width=True)
+            
+            # Endpoints e campos que mais trafegam dados
+            st.subheader("Endpoints e campos")
+            by_endpoint = summarize_graph_calls(calls, ["endpoint", "fields"])
+            by_endpoint = by_endpoint.sort_values("response_mb", ascending=False, ignore_index=True)
+            show_dataframe(by_endpoint.rename(columns=column_labels).head(20), use_container_width=True)
+            
+            # Latência ao longo do tempo das principais origens
+            st.subheader("Latência ao longo do tempo")
+            percentile = st.radio("Percentil:", ["p50_ms", "p95_ms"], format_func=lambda x: x[:3], horizontal=True)
+            latency = graph_latency_over_time(
+                calls, freq='h' if period_hours <= 24 * 7 else 'D', callers=by_caller["caller"].head(5)
+            )
+            chart_df = latency.pivot(index="called_at", columns="caller", values=percentile)
+            show_line_chart(chart_df)
+    
+    # Perfil de renderização: tempos por fase das últimas execuções da página
+    st.sidebar.checkbox("Perfil de renderização", key="render_profiling")
+    if st.session_state.render_profiling:
+        show_render_profile(page)
+    
+    # Grava as chamadas à Graph API ainda no buffer
+    graph_ledger.flush()
+
+# Função para exibir na barra lateral os tempos por fase das execuções medidas de uma página
+def show_render_profile(page):
+    with st.sidebar.expander("Tempos da página", expanded=True):
+        summary = summarize_page_profile(page)
+        if summary is None:
+            st.caption("Nenhuma execução medida ainda. Interaja com a página para medir.")
+        else:
+            st.caption(f"Últimas {summary['reruns']} execuções de {page} (a atual entra na próxima)")
+            phase_labels = {"total": "Total", **PROFILE_PHASES}
+            st.dataframe(pd.DataFrame([
+                {
+                    "Fase": phase_labels[name],
+                    "Última (ms)": values["last_ms"],
+                    "p50 (ms)": values["p50_ms"],
+                    "p95 (ms)": values["p95_ms"],
+                }
+                for name, values in summary["phases"].items()
+            ]), hide_index=True)
+            
+            # Tempo das threads do executor (ex.: insights em paralelo); corre junto
+            # com a fase do script que as aguarda e não entra no total acima
+            if summary["worker_phases"]:
+                st.caption("Em paralelo (threads do executor)")
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Fase": PROFILE_PHASES[name],
+                        "Última (ms)": values["last_ms"],
+                        "p50 (ms)": values["p50_ms"],
+                        "p95 (ms)": values["p95_ms"],
+                    }
+                    for name, values in summary["worker_phases"].items()
+                ]), hide_index=True)
+            
+            # Histograma (execuções por faixa de tempo) da execução completa ou de uma fase
+            phase = st.selectbox(
+                "Histograma:", list(phase_labels), format_func=lambda x: phase_labels[x]
+            )
+            histogram = summary["phases"][phase]["histogram"]
+            st.dataframe(pd.DataFrame({"Execuções": list(histogram.values())}, index=bucket_labels()))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "Exportar JSON",
+                json.dumps(export_profiles(), ensure_ascii=False, indent=2),
+                file_name="perfil_renderizacao.json",
+                mime="application/json"
+            )
+        with col2:
+            if st.button("Limpar"):
+                profile_history.clear()
+                st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # O perfil (opção na barra lateral, ligada por padrão com RENDER_PROFILE=1)
+    # mede a execução inteira do script, inclusive a barra lateral
+    st.session_state.setdefault("render_profiling", PROFILE_ENABLED_BY_DEFAULT)
+    with rerun_profile(st.session_state.render_profiling):
+        main()
\ No newline at end of file
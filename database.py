@@ -0,0 +1,776 @@
+import os
+import sqlite3
+import threading
+import time
+from sqlite3 import Error
+
+from messages import report_error, report_info, report_success
+
+# Caminho do banco de dados SQLite
+DB_DIR = 'data'
+DB_PATH = os.path.join(DB_DIR, 'facebook_ads_manager.db')
+
+# Tempo máximo (ms) de espera quando o banco estiver bloqueado por outra conexão
+BUSY_TIMEOUT_MS = 5000
+
+# Quantidade de comandos SQL preparados mantidos em cache por conexão
+STATEMENT_CACHE_SIZE = 256
+
+# Conexões persistentes do processo. Cada conexão é usada por uma thread de cada
+# vez; quando a thread termina (o Streamlit usa uma thread nova a cada rerun), a
+# próxima thread que pedir uma conexão reaproveita a dela, com os PRAGMAs e o
+# cache de comandos preparados já prontos. As threads do pool do agendador fecham
+# a sua ao final (close_connection), pois são descartadas depois
+_local = threading.local()
+_connections = {}
+_connections_lock = threading.Lock()
+
+# Função para abrir uma conexão configurada com WAL e busy_timeout
+def _open_connection():
+    os.makedirs(DB_DIR, exist_ok=True)
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False
+    )
+    # WAL permite leituras concorrentes com uma escrita em andamento
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+# Função para obter uma conexão do processo para a thread atual, reaproveitando a
+# de uma thread já encerrada ou abrindo uma nova
+def _checkout_connection():
+    with _connections_lock:
+        for conn, (path, owner) in _connections.items():
+            if path == DB_PATH and not owner.is_alive():
+                break
+        else:
+            conn = _open_connection()
+        _connections[conn] = (DB_PATH, threading.current_thread())
+    # Transação deixada aberta pela thread anterior (ex.: interrompida por st.rerun)
+    if conn.in_transaction:
+        conn.rollback()
+    return conn
+
+# Função para obter a conexão persistente da thread atual
+# A conexão não deve ser fechada pelos chamadores; ela é reutilizada entre as chamadas
+def get_connection():
+    conn = getattr(_local, 'connection', None)
+    if conn is None or _connections.get(conn, (None,))[0] != DB_PATH:
+        conn = _checkout_connection()
+        _local.connection = conn
+    return conn
+
+# Função para fechar a conexão da thread atual (ex.: threads do pool do agendador
+# ou ao trocar de banco)
+def close_connection():
+    conn = getattr(_local, 'connection', None)
+    if conn is not None:
+        with _connections_lock:
+            _connections.pop(conn, None)
+        conn.close()
+        _local.connection = None
+
+# Função para criar banco de dados SQLite
+# A conexão é persistente por thread (ver get_connection) e não deve ser fechada
+def create_connection():
+    conn = None
+    try:
+        conn = get_connection()
+        return conn
+    except Error as e:
+        report_error(f"Erro ao conectar ao banco de dados: {e}")
+    return conn
+
+# Migrações do esquema, em ordem. A versão aplicada fica em PRAGMA user_version
+# (a migração na posição i leva o banco à versão i + 1). Bancos criados antes do
+# controle de versão estão na versão 0; por isso as migrações usam IF NOT EXISTS
+# e verificam as colunas antes de alterar tabelas que já podem existir
+
+# Função para obter as colunas de uma tabela (lista vazia se a tabela não existir)
+def _table_columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in c.fetchall()]
+
+# Colunas da tabela rules (estrutura com regras compostas)
+RULES_TABLE_SQL = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        condition_type TEXT NOT NULL,
+        is_composite INTEGER DEFAULT 0,
+        primary_metric TEXT NOT NULL,
+        primary_operator TEXT NOT NULL,
+        primary_value REAL NOT NULL,
+        secondary_metric TEXT,
+        secondary_operator TEXT,
+        secondary_value REAL,
+        join_operator TEXT DEFAULT 'AND',
+        action_type TEXT NOT NULL,
+        action_value REAL,
+        target_level TEXT DEFAULT 'campaign',
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# 1: configurações da API e regras (inclui a migração das regras simples para compostas)
+def _migrate_api_config_and_rules(c):
+    # Tabela de configurações da API (múltiplas contas)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS api_config (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            app_id TEXT NOT NULL,
+            app_secret TEXT NOT NULL,
+            access_token TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            business_id TEXT,
+            page_id TEXT,
+            is_active INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    rules_columns = _table_columns(c, 'rules')
+    if not rules_columns:
+        c.execute(RULES_TABLE_SQL.format(name='rules'))
+    elif 'is_composite' not in rules_columns:
+        # Formato antigo (condição única): criar a tabela nova e migrar os dados
+        report_info("Migrando banco de dados para suportar regras compostas...")
+        c.execute(RULES_TABLE_SQL.format(name='rules_new'))
+        c.execute('''
+            INSERT INTO rules_new (
+                id, name, description, condition_type, is_composite,
+                primary_metric, primary_operator, primary_value,
+                action_type, action_value, is_active, created_at, updated_at
+            )
+            SELECT
+                id, name, description, condition_type, 0,
+                condition_metric, condition_operator, condition_value,
+                action_type, action_value, is_active, created_at, updated_at
+            FROM rules
+        ''')
+
+        # Renomear tabelas
+        c.execute("DROP TABLE rules")
+        c.execute("ALTER TABLE rules_new RENAME TO rules")
+        report_success("Migração concluída com sucesso!")
+
+# 2: nível do objeto alvo da regra (campanha, conjunto ou anúncio)
+def _migrate_rules_target_level(c):
+    if 'target_level' not in _table_columns(c, 'rules'):
+        c.execute("ALTER TABLE rules ADD COLUMN target_level TEXT DEFAULT 'campaign'")
+
+# 3: histórico de execuções de regras e seus índices (ordenação e filtros)
+def _migrate_rule_executions(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rule_executions (
+            id INTEGER PRIMARY KEY,
+            rule_id INTEGER NOT NULL,
+            ad_object_id TEXT NOT NULL,
+            ad_object_type TEXT NOT NULL,
+            ad_object_name TEXT NOT NULL,
+            executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            was_successful INTEGER DEFAULT 0,
+            message TEXT,
+            FOREIGN KEY (rule_id) REFERENCES rules (id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rule_executions_executed_at ON rule_executions (executed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rule_executions_rule_executed_at ON rule_executions (rule_id, executed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rule_executions_object_executed_at ON rule_executions (ad_object_id, executed_at)")
+
+# 4: histórico diário de insights por anúncio (ver insights_store.py)
+def _migrate_insights_daily(c):
+    # A versão antiga (por campanha) é descartada e baixada novamente na próxima sincronização
+    insights_columns = _table_columns(c, 'insights_daily')
+    if insights_columns and 'ad_id' not in insights_columns:
+        c.execute("DROP TABLE IF EXISTS insights_daily")
+        c.execute("DROP TABLE IF EXISTS insights_sync")
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS insights_daily (
+            account_id TEXT NOT NULL,
+            ad_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            campaign_id TEXT NOT NULL,
+            campaign_name TEXT,
+            adset_id TEXT NOT NULL,
+            adset_name TEXT,
+            ad_name TEXT,
+            spend REAL DEFAULT 0,
+            impressions INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0,
+            purchases INTEGER DEFAULT 0,
+            PRIMARY KEY (account_id, ad_id, date)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_insights_daily_account_date ON insights_daily (account_id, date)")
+
+    # Período já sincronizado de cada conta
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS insights_sync (
+            account_id TEXT PRIMARY KEY,
+            synced_since TEXT NOT NULL,
+            synced_until TEXT NOT NULL,
+            synced_at REAL NOT NULL
+        )
+    ''')
+
+# 5: agenda do executor de regras em segundo plano (ver rule_scheduler.py) e travas
+def _migrate_rule_schedule(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rule_schedule (
+            config_id INTEGER PRIMARY KEY,
+            interval_seconds INTEGER,
+            last_started_at REAL,
+            last_finished_at REAL,
+            last_status TEXT,
+            last_message TEXT,
+            FOREIGN KEY (config_id) REFERENCES api_config (id)
+        )
+    ''')
+
+    # Travas para impedir execuções de regras sobrepostas na mesma conta
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS run_locks (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+# Colunas da tabela catalog_entities; row_id (INTEGER PRIMARY KEY) é a chave
+# estável usada pelo índice de busca
+CATALOG_ENTITIES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        row_id INTEGER PRIMARY KEY,
+        account_id TEXT NOT NULL,
+        level TEXT NOT NULL,
+        id TEXT NOT NULL,
+        name TEXT,
+        status TEXT,
+        campaign_id TEXT,
+        adset_id TEXT,
+        updated_time TEXT,
+        data TEXT NOT NULL,
+        UNIQUE (account_id, level, id)
+    )
+'''
+
+# Função para criar a busca por nome no catálogo (FTS5, mantida por gatilhos)
+# Sem FTS5 no SQLite a busca é feita em Python (ver entity_catalog.py)
+def _create_catalog_search(c):
+    try:
+        c.execute('''
+            CREATE VIRTUAL TABLE catalog_entities_fts USING fts5(
+                name, content='catalog_entities', content_rowid='row_id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except Error:
+        return
+    c.execute('''
+        CREATE TRIGGER catalog_entities_ai AFTER INSERT ON catalog_entities BEGIN
+            INSERT INTO catalog_entities_fts (rowid, name) VALUES (new.row_id, new.name);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER catalog_entities_ad AFTER DELETE ON catalog_entities BEGIN
+            INSERT INTO catalog_entities_fts (catalog_entities_fts, rowid, name) VALUES ('delete', old.row_id, old.name);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER catalog_entities_au AFTER UPDATE OF name ON catalog_entities BEGIN
+            INSERT INTO catalog_entities_fts (catalog_entities_fts, rowid, name) VALUES ('delete', old.row_id, old.name);
+            INSERT INTO catalog_entities_fts (rowid, name) VALUES (new.row_id, new.name);
+        END
+    ''')
+    c.execute("INSERT INTO catalog_entities_fts (catalog_entities_fts) VALUES ('rebuild')")
+
+# 6: catálogo local de campanhas, conjuntos e anúncios (ver entity_catalog.py)
+# Bancos que já passaram por esta migração antes da chave row_id são
+# convertidos pela migração 8
+def _migrate_catalog(c):
+    c.execute(CATALOG_ENTITIES_TABLE_SQL.format(name='catalog_entities'))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_catalog_entities_campaign ON catalog_entities (account_id, level, campaign_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_catalog_entities_adset ON catalog_entities (account_id, level, adset_id)")
+
+    # Estado da sincronização do catálogo (maior updated_time visto e última leitura completa)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_sync (
+            account_id TEXT NOT NULL,
+            level TEXT NOT NULL,
+            watermark INTEGER,
+            full_synced_at REAL NOT NULL,
+            synced_at REAL NOT NULL,
+            PRIMARY KEY (account_id, level)
+        )
+    ''')
+
+    if 'row_id' in _table_columns(c, 'catalog_entities'):
+        _create_catalog_search(c)
+
+# 7: registro das chamadas à Graph API (ver graph_ledger.py)
+def _migrate_graph_calls(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS graph_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            called_at REAL NOT NULL,
+            account_id TEXT,
+            caller TEXT,
+            method TEXT,
+            endpoint TEXT,
+            fields TEXT,
+            status INTEGER,
+            error_code INTEGER,
+            attempt INTEGER DEFAULT 0,
+            latency_ms REAL,
+            response_bytes INTEGER,
+            rows INTEGER,
+            usage_pct REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_graph_calls_called_at ON graph_calls (called_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_graph_calls_caller ON graph_calls (caller, called_at)")
+
+# 8: catálogo com row_id (INTEGER PRIMARY KEY) para o índice de busca; o rowid
+# implícito de uma tabela com chave composta pode mudar em um VACUUM e deixar o
+# FTS5 (conteúdo externo) apontando para outras linhas
+def _migrate_catalog_row_id(c):
+    if 'row_id' in _table_columns(c, 'catalog_entities'):
+        return
+    c.execute("DROP TABLE IF EXISTS catalog_entities_fts")
+    c.execute(CATALOG_ENTITIES_TABLE_SQL.format(name='catalog_entities_new'))
+    c.execute('''
+        INSERT INTO catalog_entities_new
+            (row_id, account_id, level, id, name, status, campaign_id, adset_id, updated_time, data)
+        SELECT rowid, account_id, level, id, name, status, campaign_id, adset_id, updated_time, data
+        FROM catalog_entities
+    ''')
+    c.execute("DROP TABLE catalog_entities")
+    c.execute("ALTER TABLE catalog_entities_new RENAME TO catalog_entities")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_catalog_entities_campaign ON catalog_entities (account_id, level, campaign_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_catalog_entities_adset ON catalog_entities (account_id, level, adset_id)")
+
+    _create_catalog_search(c)
+
+# Migrações em ordem; novas migrações entram sempre no final
+MIGRATIONS = [
+    _migrate_api_config_and_rules,
+    _migrate_rules_target_level,
+    _migrate_rule_executions,
+    _migrate_insights_daily,
+    _migrate_rule_schedule,
+    _migrate_catalog,
+    _migrate_graph_calls,
+    _migrate_catalog_row_id,
+]
+
+# Versão do esquema após todas as migrações
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Bancos (caminhos) já atualizados neste processo; o Streamlit chama init_db a cada
+# execução do script e, depois da primeira, a chamada não consulta o banco
+_migrated_paths = set()
+_migration_lock = threading.Lock()
+
+# Função para obter a versão do esquema de um banco
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Inicializar banco de dados e tabelas: aplica as migrações pendentes, uma vez por
+# processo. Cada migração roda em uma transação com a trava de escrita do banco
+# (BEGIN IMMEDIATE), para que outro processo (ex.: o agendador) não a aplique junto
+def init_db():
+    if DB_PATH in _migrated_paths:
+        return
+    with _migration_lock:
+        if DB_PATH in _migrated_paths:
+            return
+        conn = create_connection()
+        if conn is None:
+            return
+        try:
+            if get_schema_version(conn) < SCHEMA_VERSION:
+                c = conn.cursor()
+                for version, migration in enumerate(MIGRATIONS, start=1):
+                    c.execute("BEGIN IMMEDIATE")
+                    if get_schema_version(conn) >= version:
+                        conn.rollback()
+                        continue
+                    migration(c)
+                    c.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+            _migrated_paths.add(DB_PATH)
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao criar tabelas: {e}")
+
+# Função para salvar configurações da API
+def save_api_config(name, app_id, app_secret, access_token, account_id, business_id="", page_id=""):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            # Verifica se é a primeira conexão
+            c.execute("SELECT COUNT(*) FROM api_config")
+            count = c.fetchone()[0]
+            is_active = 1 if count == 0 else 0
+
+            c.execute(
+                """INSERT INTO api_config
+                   (name, app_id, app_secret, access_token, account_id, business_id, page_id, is_active)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (name, app_id, app_secret, access_token, account_id, business_id, page_id, is_active)
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao salvar configurações: {e}")
+            return False
+    return False
+
+# Função para obter configurações ativas da API
+def get_active_api_config():
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""SELECT id, name, app_id, app_secret, access_token, account_id,
+                         business_id, page_id FROM api_config WHERE is_active = 1 LIMIT 1""")
+            row = c.fetchone()
+            if row:
+                return {
+                    "id": row[0],
+                    "name": row[1],
+                    "app_id": row[2],
+                    "app_secret": row[3],
+                    "access_token": row[4],
+                    "account_id": row[5],
+                    "business_id": row[6],
+                    "page_id": row[7]
+                }
+        except Error as e:
+            report_error(f"Erro ao obter configurações ativas: {e}")
+    return None
+
+# Função para obter todas as configurações da API
+def get_all_api_configs():
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""SELECT id, name, app_id, app_secret, access_token, account_id,
+                         business_id, page_id, is_active FROM api_config ORDER BY name""")
+            rows = c.fetchall()
+            configs = []
+            for row in rows:
+                configs.append({
+                    "id": row[0],
+                    "name": row[1],
+                    "app_id": row[2],
+                    "app_secret": row[3],
+                    "access_token": row[4],
+                    "account_id": row[5],
+                    "business_id": row[6],
+                    "page_id": row[7],
+                    "is_active": row[8]
+                })
+            return configs
+        except Error as e:
+            report_error(f"Erro ao obter todas as configurações: {e}")
+    return []
+
+# Função para definir configuração ativa
+def set_active_api_config(config_id):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            # Desativa todas as configurações
+            c.execute("UPDATE api_config SET is_active = 0")
+            # Ativa a configuração selecionada
+            c.execute("UPDATE api_config SET is_active = 1 WHERE id = ?", (config_id,))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao definir configuração ativa: {e}")
+            return False
+    return False
+
+# Função para excluir uma configuração
+def delete_api_config(config_id):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            # Verifica se é a configuração ativa
+            c.execute("SELECT is_active FROM api_config WHERE id = ?", (config_id,))
+            row = c.fetchone()
+            if row and row[0] == 1:
+                # Se for a configuração ativa, ativa outra antes de excluir
+                c.execute("SELECT id FROM api_config WHERE id != ? LIMIT 1", (config_id,))
+                other_config = c.fetchone()
+                if other_config:
+                    c.execute("UPDATE api_config SET is_active = 1 WHERE id = ?", (other_config[0],))
+
+            # Exclui a configuração
+            c.execute("DELETE FROM api_config WHERE id = ?", (config_id,))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao excluir configuração: {e}")
+            return False
+    return False
+
+# Função para adicionar regra (com suporte a regras compostas)
+def add_rule(name, description, condition_type, primary_metric, primary_operator,
+             primary_value, action_type, action_value, is_composite=0, secondary_metric=None,
+             secondary_operator=None, secondary_value=None, join_operator="AND",
+             target_level="campaign"):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute(
+                '''INSERT INTO rules
+                   (name, description, condition_type, is_composite, primary_metric,
+                    primary_operator, primary_value, secondary_metric, secondary_operator,
+                    secondary_value, join_operator, action_type, action_value, target_level)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (name, description, condition_type, is_composite, primary_metric,
+                 primary_operator, primary_value, secondary_metric, secondary_operator,
+                 secondary_value, join_operator, action_type, action_value, target_level)
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao adicionar regra: {e}")
+            return False
+    return False
+
+# Função para obter todas as regras
+def get_all_rules():
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            # As migrações de init_db garantem a estrutura com regras compostas
+            c.execute("""
+                SELECT id, name, description, condition_type, is_composite,
+                       primary_metric, primary_operator, primary_value,
+                       secondary_metric, secondary_operator, secondary_value,
+                       join_operator, action_type, action_value, target_level,
+                       is_active, created_at, updated_at
+                FROM rules
+                ORDER BY created_at DESC
+            """)
+
+            rules = c.fetchall()
+            columns = [description[0] for description in c.description]
+            result = []
+            for rule in rules:
+                rule_dict = {}
+                for i, column in enumerate(columns):
+                    rule_dict[column] = rule[i]
+                result.append(rule_dict)
+            return result
+        except Error as e:
+            report_error(f"Erro ao obter regras: {e}")
+    return []
+
+# Função para excluir regra
+def delete_rule(rule_id):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("DELETE FROM rules WHERE id = ?", (rule_id,))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao excluir regra: {e}")
+            return False
+    return False
+
+# Função para atualizar estado da regra (ativar/desativar)
+def toggle_rule_status(rule_id, is_active):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("UPDATE rules SET is_active = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     (1 if is_active else 0, rule_id))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            report_error(f"Erro ao atualizar status da regra: {e}")
+            return False
+    return False
+
+# Função para obter histórico de execuções
+# Paginação por chave: "before" é o par (executed_at, id) da última linha da página anterior
+def get_rule_executions(limit=100, before=None, rule_id=None, ad_object_id=None, was_successful=None):
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+
+            # Filtros aplicados no próprio banco
+            conditions = []
+            params = []
+            if rule_id is not None:
+                conditions.append("re.rule_id = ?")
+                params.append(rule_id)
+            if ad_object_id:
+                conditions.append("re.ad_object_id = ?")
+                params.append(ad_object_id)
+            if was_successful is not None:
+                conditions.append("re.was_successful = ?")
+                params.append(1 if was_successful else 0)
+            if before is not None:
+                conditions.append("(re.executed_at, re.id) < (?, ?)")
+                params.extend(before)
+
+            where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            c.execute(f'''
+                SELECT re.id, r.name as rule_name, re.ad_object_id, re.ad_object_type,
+                       re.ad_object_name, re.executed_at, re.was_successful, re.message
+                FROM rule_executions re
+                JOIN rules r ON re.rule_id = r.id
+                {where_clause}
+                ORDER BY re.executed_at DESC, re.id DESC
+                LIMIT ?
+            ''', params + [limit])
+            executions = c.fetchall()
+            columns = [description[0] for description in c.description]
+            result = []
+            for execution in executions:
+                execution_dict = {}
+                for i, column in enumerate(columns):
+                    execution_dict[column] = execution[i]
+                result.append(execution_dict)
+            return result
+        except Error as e:
+            report_error(f"Erro ao obter histórico de execução: {e}")
+    return []
+
+# Função para obter uma trava de execução (ex.: regras de uma conta)
+# Retorna False se outra execução já tiver a trava; travas expiradas são descartadas
+def acquire_run_lock(name, owner, ttl_seconds=3600):
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute("DELETE FROM run_locks WHERE name = ? AND expires_at < ?", (name, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO run_locks (name, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?)",
+            (name, owner, now, now + ttl_seconds)
+        )
+    return cursor.rowcount == 1
+
+# Função para liberar uma trava de execução obtida por este dono
+def release_run_lock(name, owner):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM run_locks WHERE name = ? AND owner = ?", (name, owner))
+
+# Função para obter a agenda do executor de regras de todas as contas
+def get_rule_schedules():
+    conn = create_connection()
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT a.id AS config_id, a.name, a.account_id, s.interval_seconds,
+                       s.last_started_at, s.last_finished_at, s.last_status, s.last_message
+                FROM api_config a
+                LEFT JOIN rule_schedule s ON s.config_id = a.id
+                ORDER BY a.name
+            ''')
+            columns = [description[0] for description in c.description]
+            return [dict(zip(columns, row)) for row in c.fetchall()]
+        except Error as e:
+            report_error(f"Erro ao obter agenda das regras: {e}")
+    return []
+
+# Função para registrar início ou fim de uma execução agendada
+def update_rule_schedule(config_id, **values):
+    conn = get_connection()
+    columns = list(values)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO rule_schedule (config_id) VALUES (?)", (config_id,))
+        if columns:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            conn.execute(
+                f"UPDATE rule_schedule SET {assignments} WHERE config_id = ?",
+                [values[column] for column in columns] + [config_id]
+            )
+
+# Comando de inserção de uma execução de regra
+INSERT_RULE_EXECUTION_SQL = '''
+    INSERT INTO rule_executions
+    (rule_id, ad_object_id, ad_object_type, ad_object_name, was_successful, message)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Registro de execuções em buffer: acumula as linhas durante uma execução de regras
+# e grava todas com executemany em uma única transação. O buffer é gravado ao
+# passar de max_rows linhas ou max_seconds segundos, e sempre ao sair do bloco with,
+# inclusive quando ocorre uma exceção
+class ExecutionLogger:
+    def __init__(self, max_rows=500, max_seconds=5.0):
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows = []
+        self.first_row_at = None
+        self.total_written = 0
+
+    def log(self, rule_id, ad_object_id, ad_object_type, ad_object_name, was_successful, message=""):
+        if not self.rows:
+            self.first_row_at = time.monotonic()
+        self.rows.append((
+            rule_id, ad_object_id, ad_object_type, ad_object_name,
+            1 if was_successful else 0, message
+        ))
+        if len(self.rows) >= self.max_rows or time.monotonic() - self.first_row_at >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        conn = get_connection()
+        # O bloco with faz commit ao final ou rollback em caso de erro;
+        # em caso de erro as linhas continuam no buffer para nova tentativa
+        with conn:
+            conn.executemany(INSERT_RULE_EXECUTION_SQL, self.rows)
+        written = len(self.rows)
+        self.total_written += written
+        self.rows = []
+        self.first_row_at = None
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        except sqlite3.Error:
+            # Não esconder a exceção original da execução
+            if exc_type is None:
+                raise
+        return False
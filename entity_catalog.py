@@ -0,0 +1,238 @@
+import json
+import re
+import time
+import unicodedata
+from datetime import datetime
+
+from facebook_business.adobjects.adaccount import AdAccount
+
+from database import get_connection
+
+# Cópia local da hierarquia da conta (campanhas, conjuntos e anúncios) em
+# catalog_entities, atualizada apenas com os objetos alterados desde a última
+# sincronização (filtro por updated_time). As páginas e filtros leem daqui
+
+# Campos guardados de cada nível
+CATALOG_FIELDS = {
+    'campaign': [
+        'id', 'name', 'status', 'effective_status', 'objective', 'created_time', 'updated_time',
+        'start_time', 'stop_time', 'daily_budget', 'lifetime_budget'
+    ],
+    'adset': [
+        'id', 'name', 'status', 'effective_status', 'campaign_id', 'daily_budget',
+        'lifetime_budget', 'bid_amount', 'updated_time'
+    ],
+    'ad': [
+        'id', 'name', 'status', 'effective_status', 'campaign_id', 'adset_id', 'creative',
+        'created_time', 'updated_time'
+    ],
+}
+
+# Método da AdAccount que lista cada nível
+CATALOG_READERS = {
+    'campaign': 'get_campaigns',
+    'adset': 'get_ad_sets',
+    'ad': 'get_ads',
+}
+
+# Todos os status de cada nível; a sincronização incremental pede também os
+# excluídos e arquivados, para que saiam das listagens
+CATALOG_EFFECTIVE_STATUSES = {
+    'campaign': ['ACTIVE', 'PAUSED', 'DELETED', 'ARCHIVED', 'IN_PROCESS', 'WITH_ISSUES'],
+    'adset': ['ACTIVE', 'PAUSED', 'DELETED', 'ARCHIVED', 'IN_PROCESS', 'WITH_ISSUES', 'CAMPAIGN_PAUSED'],
+    'ad': [
+        'ACTIVE', 'PAUSED', 'DELETED', 'ARCHIVED', 'IN_PROCESS', 'WITH_ISSUES', 'CAMPAIGN_PAUSED',
+        'ADSET_PAUSED', 'PENDING_REVIEW', 'DISAPPROVED', 'PREAPPROVED', 'PENDING_BILLING_INFO'
+    ],
+}
+
+# Status que não aparecem nas listagens
+HIDDEN_STATUSES = ('DELETED', 'ARCHIVED')
+
+# Objetos por página nas leituras da Graph API
+CATALOG_PAGE_SIZE = 500
+
+# Intervalo (em segundos) entre sincronizações completas, que também removem
+# objetos que deixaram de existir
+CATALOG_FULL_SYNC_SECONDS = 86400
+
+# Margem (em segundos) subtraída do último updated_time visto, para não perder
+# objetos alterados no mesmo segundo
+CATALOG_UPDATED_OVERLAP_SECONDS = 60
+
+# Função para converter o updated_time da Graph API (ex.: 2025-03-06T15:52:32-0300) em timestamp
+def _parse_updated_time(value):
+    if not value:
+        return None
+    try:
+        return int(datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z').timestamp())
+    except ValueError:
+        return None
+
+# Função para obter o estado de sincronização de um nível de uma conta
+def get_catalog_state(account_id, level):
+    c = get_connection().cursor()
+    c.execute(
+        "SELECT watermark, full_synced_at, synced_at FROM catalog_sync WHERE account_id = ? AND level = ?",
+        (str(account_id), level)
+    )
+    row = c.fetchone()
+    if row:
+        return {"watermark": row[0], "full_synced_at": row[1], "synced_at": row[2]}
+    return None
+
+# Função para obter quando um nível do catálogo foi sincronizado pela última vez
+# (0 se nunca foi); é a idade dos dados lidos do catálogo
+def catalog_synced_at(account_id, level):
+    state = get_catalog_state(account_id, level)
+    return state['synced_at'] if state else 0.0
+
+# Função para forçar uma sincronização completa do catálogo de uma conta na próxima leitura
+def expire_catalog_sync(account_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE catalog_sync SET full_synced_at = 0 WHERE account_id = ?", (str(account_id),))
+
+# Função para gravar (inserir ou atualizar) objetos no catálogo
+# ON CONFLICT mantém o row_id da linha, usado pelo índice de busca (FTS5)
+def _upsert_entities(conn, account_id, level, ad_objects):
+    rows = []
+    for ad_object in ad_objects:
+        data = ad_object.export_all_data() if hasattr(ad_object, 'export_all_data') else dict(ad_object)
+        rows.append((
+            str(account_id), level, data['id'], data.get('name'),
+            data.get('effective_status') or data.get('status'),
+            data.get('campaign_id'), data.get('adset_id'), data.get('updated_time'),
+            json.dumps(data)
+        ))
+    conn.executemany('''
+        INSERT INTO catalog_entities
+        (account_id, level, id, name, status, campaign_id, adset_id, updated_time, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (account_id, level, id) DO UPDATE SET
+            name = excluded.name, status = excluded.status, campaign_id = excluded.campaign_id,
+            adset_id = excluded.adset_id, updated_time = excluded.updated_time, data = excluded.data
+    ''', rows)
+    return rows
+
+# Função para sincronizar um nível do catálogo de uma conta
+# Sem estado (ou após CATALOG_FULL_SYNC_SECONDS) lê o nível inteiro e remove o que
+# não veio; nas demais vezes lê apenas os objetos com updated_time após a última
+# sincronização. Retorna a quantidade de objetos gravados
+def sync_catalog(account_id, level, api=None, force_full=False):
+    state = get_catalog_state(account_id, level)
+    full = (
+        force_full or state is None or state['watermark'] is None
+        or time.time() - state['full_synced_at'] > CATALOG_FULL_SYNC_SECONDS
+    )
+
+    params = {'limit': CATALOG_PAGE_SIZE}
+    if not full:
+        params['effective_status'] = CATALOG_EFFECTIVE_STATUSES[level]
+        params['filtering'] = [{
+            'field': 'updated_time',
+            'operator': 'GREATER_THAN',
+            'value': state['watermark'] - CATALOG_UPDATED_OVERLAP_SECONDS,
+        }]
+
+    account = AdAccount(f'act_{account_id}', api=api)
+    ad_objects = getattr(account, CATALOG_READERS[level])(fields=CATALOG_FIELDS[level], params=params)
+
+    # As páginas são convertidas em linhas à medida que chegam e gravadas em uma transação
+    conn = get_connection()
+    with conn:
+        rows = _upsert_entities(conn, account_id, level, ad_objects)
+        if full:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS catalog_seen (id TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM catalog_seen")
+            conn.executemany("INSERT OR IGNORE INTO catalog_seen (id) VALUES (?)", [(row[2],) for row in rows])
+            conn.execute('''
+                DELETE FROM catalog_entities
+                WHERE account_id = ? AND level = ? AND id NOT IN (SELECT id FROM catalog_seen)
+            ''', (str(account_id), level))
+
+        updated_times = [_parse_updated_time(row[7]) for row in rows]
+        watermark = max([value for value in updated_times if value] + [state['watermark'] if state and state['watermark'] else 0])
+        now = time.time()
+        conn.execute('''
+            INSERT INTO catalog_sync (account_id, level, watermark, full_synced_at, synced_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (account_id, level) DO UPDATE SET
+                watermark = excluded.watermark, synced_at = excluded.synced_at,
+                full_synced_at = CASE WHEN ? THEN excluded.full_synced_at ELSE catalog_sync.full_synced_at END
+        ''', (str(account_id), level, watermark or None, now, now, full))
+
+    return len(rows)
+
+# Função para montar a consulta de busca do FTS5 a partir do texto digitado
+# Cada palavra vira um prefixo ("palavra"*) e todas precisam aparecer no nome
+def _fts_query(search):
+    terms = [term.replace('"', '""') for term in search.split()]
+    return " ".join(f'"{term}"*' for term in terms)
+
+# Função para separar um texto nas palavras usadas pela busca, como o tokenizador
+# unicode61 do FTS5 (sem acentos e sem diferença entre maiúsculas e minúsculas)
+def _search_tokens(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'[^\W_]+', text.casefold())
+
+# Função para verificar se um nome atende à busca sem o FTS5, com a mesma regra de
+# _fts_query: cada termo digitado é uma sequência de palavras, a última como prefixo
+def _name_matches(name, search):
+    tokens = _search_tokens(name)
+    for term in search.split():
+        words = _search_tokens(term)
+        if not words:
+            continue
+        found = any(
+            tokens[start:start + len(words) - 1] == words[:-1]
+            and tokens[start + len(words) - 1].startswith(words[-1])
+            for start in range(len(tokens) - len(words) + 1)
+        )
+        if not found:
+            return False
+    return True
+
+# Função para verificar se o índice de busca por nome (FTS5) está disponível
+def catalog_search_available():
+    c = get_connection().cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'catalog_entities_fts'")
+    return c.fetchone() is not None
+
+# Função para listar objetos do catálogo de um nível, no formato da Graph API
+# Filtros opcionais: campanha (conjuntos e anúncios), conjunto (anúncios) e busca por nome
+def get_catalog_entities(account_id, level, campaign_id=None, adset_id=None, search=None, limit=None):
+    query = f'''
+        SELECT data FROM catalog_entities
+        WHERE account_id = ? AND level = ?
+          AND (status IS NULL OR status NOT IN ({", ".join("?" for _ in HIDDEN_STATUSES)}))
+    '''
+    params = [str(account_id), level, *HIDDEN_STATUSES]
+
+    if campaign_id:
+        query += " AND campaign_id = ?"
+        params.append(str(campaign_id))
+    if adset_id:
+        query += " AND adset_id = ?"
+        params.append(str(adset_id))
+    # A busca encontra o objeto pelo id exato ou pelas palavras do nome; sem FTS5
+    # o nome é comparado em Python, com a mesma regra
+    search = search.strip() if search else ''
+    fallback_search = bool(search) and not catalog_search_available()
+    if search and not fallback_search:
+        query += " AND (id = ? OR row_id IN (SELECT rowid FROM catalog_entities_fts WHERE catalog_entities_fts MATCH ?))"
+        params.extend([search, _fts_query(search)])
+
+    query += " ORDER BY name COLLATE NOCASE"
+    if limit and not fallback_search:
+        query += " LIMIT ?"
+        params.append(int(limit))
+
+    c = get_connection().cursor()
+    if fallback_search:
+        c.execute(query.replace("SELECT data", "SELECT data, id, name", 1), params)
+        rows = [row for row in c.fetchall() if row[1] == search or _name_matches(row[2], search)]
+        return [json.loads(row[0]) for row in rows[:int(limit) if limit else None]]
+    c.execute(query, params)
+    return [json.loads(row[0]) for row in c.fetchall()]
@@ -0,0 +1,124 @@
+import threading
+
+from facebook_business.session import FacebookSession
+from requests.adapters import HTTPAdapter
+
+from entity_catalog import CATALOG_FIELDS, get_catalog_entities, sync_catalog
+from graph_cache import cache_key, graph_cache
+from graph_insights import CHUNK_FETCH_WORKERS
+from graph_replay import install_graph_traffic
+from graph_retry import get_circuit_breaker
+from graph_throttle import GovernedFacebookAdsApi, get_governor
+from insights_store import get_local_insights, sync_insights_daily
+from messages import report_error
+
+# Conexões HTTP mantidas abertas (keep-alive) por sessão da Graph API; cobre os
+# blocos de insights lidos em paralelo e as demais chamadas da conta
+HTTP_POOL_MAXSIZE = CHUNK_FETCH_WORKERS * 2
+
+# Hosts com conexões guardadas por sessão (graph.facebook.com e graph-video.facebook.com)
+HTTP_POOL_CONNECTIONS = 2
+
+# Função para criar uma instância da API para uma conta, sem alterar a API padrão
+# As chamadas passam pelo balde de requisições da conta (ver graph_throttle) e
+# falhas temporárias são repetidas sob o circuito da conta (ver graph_retry).
+# Com GRAPH_TRAFFIC_MODE definido, o tráfego é gravado ou reproduzido (ver graph_replay)
+def create_facebook_api(config):
+    session = FacebookSession(config["app_id"], config["app_secret"], config["access_token"])
+    # As repetições ficam com graph_retry; o adaptador só guarda as conexões abertas
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0
+    )
+    session.requests.mount('https://', adapter)
+    install_graph_traffic(session)
+    return GovernedFacebookAdsApi(
+        session, get_governor(config["account_id"]), get_circuit_breaker(config["account_id"]),
+        account_id=config["account_id"]
+    )
+
+# Instâncias da API por configuração (api_config.id), reaproveitadas entre os
+# reruns do Streamlit e as rodadas do agendador para manter as conexões abertas
+_apis = {}
+_apis_lock = threading.Lock()
+
+# Função para obter as credenciais de uma configuração; se mudarem, a instância é recriada
+def _credentials(config):
+    return (config["app_id"], config["app_secret"], config["access_token"], config["account_id"])
+
+# Função para fechar as conexões de uma instância da API
+def _close_api(api):
+    close = getattr(api._session.requests, 'close', None)
+    if close is not None:
+        close()
+
+# Função para obter a instância da API de uma configuração, criando-a na primeira
+# chamada ou quando as credenciais mudaram. A instância deve ser passada às
+# funções e objetos da SDK (api=...) em vez de virar a API padrão
+def get_facebook_api(config):
+    with _apis_lock:
+        entry = _apis.get(config["id"])
+        if entry is not None and entry[0] == _credentials(config):
+            return entry[1]
+        api = create_facebook_api(config)
+        _apis[config["id"]] = (_credentials(config), api)
+    if entry is not None:
+        _close_api(entry[1])
+    return api
+
+# Função para descartar a instância da API de uma configuração (ex.: conta excluída)
+def release_facebook_api(config_id):
+    with _apis_lock:
+        entry = _apis.pop(config_id, None)
+    if entry is not None:
+        _close_api(entry[1])
+
+# As listagens abaixo leem o catálogo local (ver entity_catalog), que é
+# sincronizado com a Graph API no máximo uma vez por TTL do graph_cache; assim
+# reruns do Streamlit não repetem chamadas e graph_cache.invalidate força uma
+# nova sincronização. Retornam dicts no formato da Graph API e aceitam uma
+# instância de FacebookAdsApi; sem ela, usam a API padrão
+
+# Função para sincronizar um nível do catálogo, se o último sincronismo expirou
+def _sync_level(account_id, level, api=None):
+    graph_cache.get_or_load(
+        cache_key(account_id, f'catalog_{level}', CATALOG_FIELDS[level]),
+        lambda: sync_catalog(account_id, level, api=api)
+    )
+
+# Função para obter campanhas do Facebook
+def get_facebook_campaigns(account_id, api=None, search=None):
+    try:
+        _sync_level(account_id, 'campaign', api)
+        return get_catalog_entities(account_id, 'campaign', search=search)
+    except Exception as e:
+        report_error(f"Erro ao obter campanhas: {e}")
+        return []
+
+# Função para obter conjuntos de anúncios
+def get_facebook_adsets(account_id, campaign_id=None, api=None, search=None):
+    try:
+        _sync_level(account_id, 'adset', api)
+        return get_catalog_entities(account_id, 'adset', campaign_id=campaign_id, search=search)
+    except Exception as e:
+        report_error(f"Erro ao obter conjuntos de anúncios: {e}")
+        return []
+
+# Função para obter anúncios
+def get_facebook_ads(account_id, adset_id=None, api=None, search=None):
+    try:
+        _sync_level(account_id, 'ad', api)
+        return get_catalog_entities(account_id, 'ad', adset_id=adset_id, search=search)
+    except Exception as e:
+        report_error(f"Erro ao obter anúncios: {e}")
+        return []
+
+# Função para obter insights de um nível (campaign, adset ou ad) de toda a conta
+# A sincronização é a mesma das campanhas (uma leitura por anúncio); os níveis
+# acima dos anúncios são somados localmente
+def get_account_insights(account_id, level='ad', time_range='last_7d', api=None):
+    try:
+        sync_insights_daily(account_id, api=api)
+        return get_local_insights(account_id, level, time_range=time_range)
+    except Exception as e:
+        report_error(f"Erro ao obter insights da conta: {e}")
+        return []
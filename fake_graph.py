@@ -0,0 +1,159 @@
+import json
+import re
+from datetime import datetime
+from urllib.parse import urlparse
+
+from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
+
+# Resposta HTTP mínima no formato esperado por FacebookAdsApi.call
+class FakeResponse:
+    def __init__(self, body, status_code=200, headers=None, text=None):
+        self.text = text if text is not None else json.dumps(body)
+        self.status_code = status_code
+        self.headers = headers or {'content-type': 'application/json'}
+
+
+# Endpoint local que imita os relatórios de insights da Graph API (sync e async),
+# para testar o fluxo de jobs assíncronos sem rede.
+# rows_for(params) devolve as linhas do relatório para os parâmetros recebidos
+class FakeReportServer:
+    def __init__(self, rows_for, polls_to_complete=2, page_size=100, fail_jobs=False):
+        self.rows_for = rows_for
+        self.polls_to_complete = polls_to_complete
+        self.page_size = page_size
+        self.fail_jobs = fail_jobs
+        self.jobs = {}
+        self.sync_reports = {}
+        self.requests_made = []
+
+    def request(self, method, url, params=None, data=None, headers=None, files=None, timeout=None):
+        params = _decode_params(params if method in ('GET', 'DELETE') else data)
+        path = [part for part in urlparse(url).path.split('/') if part]
+        # Remover a versão da API (ex.: v21.0) do caminho
+        if path and re.match(r'v[0-9]+\.[0-9]+', path[0]):
+            path = path[1:]
+        self.requests_made.append((method, '/'.join(path)))
+
+        # POST act_<id>/insights: cria um job assíncrono
+        if method == 'POST' and len(path) == 2 and path[1] == 'insights':
+            job_id = str(900000 + len(self.jobs))
+            self.jobs[job_id] = {'rows': list(self.rows_for(params)), 'polls': 0}
+            return FakeResponse({'report_run_id': job_id})
+
+        # GET <job_id>: status do job, avançando a cada consulta
+        if method == 'GET' and len(path) == 1 and path[0] in self.jobs:
+            job = self.jobs[path[0]]
+            job['polls'] += 1
+            if self.fail_jobs:
+                status, percent = 'Job Failed', 0
+            elif job['polls'] >= self.polls_to_complete:
+                status, percent = 'Job Completed', 100
+            else:
+                status, percent = 'Job Running', int(100 * job['polls'] / self.polls_to_complete)
+            return FakeResponse({
+                'id': path[0],
+                'async_status': status,
+                'async_percent_completion': percent,
+            })
+
+        # GET <job_id>/insights: resultado paginado do job
+        if method == 'GET' and len(path) == 2 and path[1] == 'insights' and path[0] in self.jobs:
+            return self._page(self.jobs[path[0]]['rows'], params)
+
+        # GET act_<id>/insights: relatório síncrono paginado
+        # As linhas são geradas na primeira página e reutilizadas nas seguintes
+        if method == 'GET' and len(path) == 2 and path[1] == 'insights':
+            report_key = json.dumps(
+                {key: value for key, value in params.items() if key not in ('after', 'limit')},
+                sort_keys=True, default=str
+            )
+            if 'after' not in params or report_key not in self.sync_reports:
+                self.sync_reports[report_key] = list(self.rows_for(params))
+            return self._page(self.sync_reports[report_key], params)
+
+        return FakeResponse(
+            {'error': {'message': f"Endpoint não suportado: {method} {url}", 'code': 100}},
+            status_code=400
+        )
+
+    def _page(self, rows, params):
+        start = int(params.get('after', 0))
+        limit = int(params.get('limit', self.page_size))
+        end = start + limit
+        body = {'data': rows[start:end]}
+        if end < len(rows):
+            body['paging'] = {'cursors': {'after': str(end)}, 'next': f"fake://next?after={end}"}
+        return FakeResponse(body)
+
+
+# Servidor falso de uma conta inteira: além dos relatórios de insights, responde às
+# listagens de campanhas, conjuntos e anúncios (com os filtros por id, status e
+# updated_time usados pelo app) e aceita lotes de alterações (POST com batch).
+# objects: {'campaigns': [...], 'adsets': [...], 'ads': [...]} com dicts da Graph API
+class FakeAccountServer(FakeReportServer):
+    def __init__(self, rows_for, objects, **kwargs):
+        super().__init__(rows_for, **kwargs)
+        self.objects = objects
+        self.updates = []
+
+    def request(self, method, url, params=None, data=None, headers=None, files=None, timeout=None):
+        path = [part for part in urlparse(url).path.split('/') if part]
+        if path and re.match(r'v[0-9]+\.[0-9]+', path[0]):
+            path = path[1:]
+
+        # GET act_<id>/campaigns, adsets ou ads
+        if method == 'GET' and len(path) == 2 and path[1] in self.objects:
+            decoded = _decode_params(params)
+            self.requests_made.append((method, '/'.join(path)))
+            return self._page(_filter_objects(self.objects[path[1]], decoded), decoded)
+
+        # POST na raiz com batch: todas as alterações do lote funcionam
+        if method == 'POST' and not path and data and 'batch' in data:
+            batch = json.loads(data['batch'])
+            self.requests_made.append((method, 'batch'))
+            self.updates.extend(batch)
+            return FakeResponse([
+                {'code': 200, 'headers': [], 'body': json.dumps({'success': True})} for _ in batch
+            ])
+
+        return super().request(method, url, params=params, data=data, headers=headers,
+                               files=files, timeout=timeout)
+
+
+# Função para aplicar a uma listagem os filtros da Graph API usados pelo app
+def _filter_objects(objects, params):
+    statuses = params.get('effective_status')
+    if statuses:
+        objects = [obj for obj in objects if obj.get('effective_status', obj.get('status')) in statuses]
+
+    for condition in params.get('filtering') or []:
+        field = condition['field'].split('.')[-1]
+        value = condition['value']
+        if condition['operator'] == 'IN':
+            values = set(map(str, value))
+            objects = [obj for obj in objects if str(obj.get(field)) in values]
+        elif condition['operator'] == 'GREATER_THAN' and field == 'updated_time':
+            objects = [
+                obj for obj in objects
+                if datetime.strptime(obj['updated_time'], '%Y-%m-%dT%H:%M:%S%z').timestamp() > value
+            ]
+    return objects
+
+
+# Função para decodificar os parâmetros já codificados pela SDK (valores JSON em texto)
+def _decode_params(params):
+    decoded = {}
+    for key, value in (params or {}).items():
+        try:
+            decoded[key] = json.loads(value) if isinstance(value, str) else value
+        except ValueError:
+            decoded[key] = value
+    return decoded
+
+
+# Função para criar uma FacebookAdsApi que fala com um servidor falso em vez da rede
+def fake_api(server):
+    session = FacebookSession('fake_app_id', 'fake_app_secret', 'fake_access_token')
+    session.requests = server
+    return FacebookAdsApi(session)
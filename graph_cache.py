@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Tempo de vida padrão (em segundos) das leituras da Graph API em cache
+DEFAULT_TTL_SECONDS = 300
+
+# Quantidade máxima de leituras mantidas em cache
+DEFAULT_MAX_ENTRIES = 256
+
+# Marcador de ausência no cache (None e [] são resultados válidos)
+_MISSING = object()
+
+# Função para montar a chave de cache de uma leitura da Graph API
+# A conta vem sempre primeiro para permitir invalidar todas as leituras de uma conta
+def cache_key(account_id, kind, fields, params=None):
+    return (
+        str(account_id),
+        kind,
+        tuple(fields),
+        json.dumps(params or {}, sort_keys=True, default=str),
+    )
+
+# Cache com tempo de vida (TTL) e descarte do item usado há mais tempo (LRU)
+class TTLCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Retorna o valor em cache ou chama loader() e guarda o resultado.
+    # Exceções do loader não são guardadas em cache
+    def get_or_load(self, key, loader, ttl_seconds=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, ttl_seconds)
+        return value
+
+    # Remove as leituras de uma conta (ou todas, sem account_id)
+    def invalidate(self, account_id=None):
+        with self._lock:
+            if account_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == str(account_id)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+# Cache compartilhado pelo processo (sobrevive aos reruns do Streamlit)
+graph_cache = TTLCache()
@@ -0,0 +1,114 @@
+import contextvars
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from facebook_business.adobjects.adreportrun import AdReportRun
+
+# Acima desta quantidade esperada de linhas, o relatório é pedido como job assíncrono
+ASYNC_ROW_THRESHOLD = 5000
+
+# Espera inicial e máxima (em segundos) entre as consultas de status do job
+ASYNC_POLL_INITIAL_SECONDS = 1.0
+ASYNC_POLL_MAX_SECONDS = 30.0
+
+# Tempo máximo (em segundos) de espera por um job assíncrono
+ASYNC_TIMEOUT_SECONDS = 1800
+
+# Linhas por página ao ler o resultado de um job assíncrono
+ASYNC_RESULT_PAGE_SIZE = 500
+
+# Status finais de um job que não produziu resultado
+ASYNC_FAILED_STATUSES = ('Job Failed', 'Job Skipped')
+
+# Blocos de ids lidos ao mesmo tempo por iter_chunked_insights
+CHUNK_FETCH_WORKERS = 4
+
+
+class AsyncReportError(Exception):
+    pass
+
+
+# Função para decidir entre relatório síncrono e assíncrono
+# Sem estimativa (expected_rows=None), usa o modo assíncrono por segurança
+def should_use_async(expected_rows):
+    return expected_rows is None or expected_rows >= ASYNC_ROW_THRESHOLD
+
+# Função para aguardar a conclusão de um job de relatório, com espera crescente
+def wait_for_report(report_run, sleep=time.sleep, timeout=ASYNC_TIMEOUT_SECONDS):
+    delay = ASYNC_POLL_INITIAL_SECONDS
+    started_at = time.monotonic()
+
+    while True:
+        report_run.api_get(fields=[
+            AdReportRun.Field.async_status,
+            AdReportRun.Field.async_percent_completion,
+        ])
+        status = report_run.get(AdReportRun.Field.async_status)
+
+        if status == 'Job Completed':
+            return report_run
+        if status in ASYNC_FAILED_STATUSES:
+            raise AsyncReportError(f"Relatório {report_run.get_id()} terminou com status: {status}")
+        if time.monotonic() - started_at > timeout:
+            raise AsyncReportError(
+                f"Tempo esgotado aguardando o relatório {report_run.get_id()} "
+                f"({report_run.get(AdReportRun.Field.async_percent_completion)}% concluído)"
+            )
+
+        sleep(delay)
+        delay = min(delay * 2, ASYNC_POLL_MAX_SECONDS)
+
+# Função para ler insights de uma conta página a página, escolhendo entre o
+# relatório síncrono e o job assíncrono (mode: 'auto', 'sync' ou 'async')
+def iter_insights(account, params, fields, expected_rows=None, mode='auto', sleep=time.sleep):
+    use_async = mode == 'async' or (mode == 'auto' and should_use_async(expected_rows))
+
+    if not use_async:
+        yield from account.get_insights(params=params, fields=fields)
+        return
+
+    report_run = account.get_insights(params=params, fields=fields, is_async=True)
+    wait_for_report(report_run, sleep=sleep)
+    yield from report_run.get_insights(params={'limit': ASYNC_RESULT_PAGE_SIZE})
+
+# Função para ler insights dividindo os objetos em blocos de ids (filtro
+# '<id_field> IN [...]'), com até max_workers blocos lidos ao mesmo tempo.
+# As linhas são entregues à medida que as páginas de cada bloco chegam; o primeiro
+# erro de um bloco interrompe a leitura e é levantado para quem está consumindo
+def iter_chunked_insights(account, params, fields, id_field, chunks, expected_rows=None,
+                          mode='auto', max_workers=CHUNK_FETCH_WORKERS, sleep=time.sleep):
+    results = queue.Queue()
+    finished = object()
+
+    def fetch(chunk):
+        chunk_params = dict(params)
+        chunk_params['filtering'] = list(params.get('filtering', [])) + [
+            {'field': id_field, 'operator': 'IN', 'value': list(chunk)}
+        ]
+        # O erro vai pela fila (antes do marcador de fim), pois o future do bloco
+        # ainda não está concluído quando o consumidor recebe o marcador
+        try:
+            for insight in iter_insights(account, chunk_params, fields, expected_rows, mode, sleep):
+                results.put(insight)
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(finished)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))),
+                                  thread_name_prefix='insights')
+    # Cada bloco roda com uma cópia do contexto atual (ex.: quem chamou, ver graph_ledger)
+    futures = [executor.submit(contextvars.copy_context().run, fetch, chunk) for chunk in chunks]
+    try:
+        pending = len(futures)
+        while pending:
+            item = results.get()
+            if item is finished:
+                pending -= 1
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,189 @@
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection
+from messages import logger
+
+# Registro de cada chamada à Graph API (graph_calls): endpoint, campos, conta,
+# latência, tamanho da resposta, linhas, uso informado pela API e quem chamou
+# (página do app ou execução de regras). As chamadas passam por
+# graph_throttle.GovernedFacebookAdsApi, que registra cada tentativa aqui
+
+# Linhas acumuladas antes de gravar no banco
+LEDGER_FLUSH_ROWS = 200
+
+# Tempo máximo (em segundos) que uma linha fica no buffer antes de ser gravada
+LEDGER_FLUSH_SECONDS = 10.0
+
+# Dias de registro mantidos no banco
+LEDGER_RETENTION_DAYS = 30
+
+# Intervalo (em segundos) entre as limpezas dos registros antigos
+LEDGER_PRUNE_INTERVAL_SECONDS = 3600
+
+# Quem chamou quando nenhuma página ou execução foi informada
+UNKNOWN_CALLER = 'desconhecido'
+
+# Colunas de graph_calls, na ordem da gravação
+LEDGER_COLUMNS = [
+    'called_at', 'account_id', 'caller', 'method', 'endpoint', 'fields', 'status',
+    'error_code', 'attempt', 'latency_ms', 'response_bytes', 'rows', 'usage_pct'
+]
+
+INSERT_GRAPH_CALL_SQL = f'''
+    INSERT INTO graph_calls ({", ".join(LEDGER_COLUMNS)})
+    VALUES ({", ".join("?" for _ in LEDGER_COLUMNS)})
+'''
+
+# Quem está chamando a Graph API no contexto atual (uma página ou execução de regras)
+_caller = contextvars.ContextVar('graph_caller', default=UNKNOWN_CALLER)
+
+# Função para definir quem está chamando a Graph API no contexto atual
+def set_graph_caller(name):
+    _caller.set(name)
+
+# Função para obter quem está chamando a Graph API no contexto atual
+def get_graph_caller():
+    return _caller.get()
+
+# Bloco em que as chamadas à Graph API são atribuídas a name
+@contextmanager
+def graph_caller(name):
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+# Função para normalizar o endpoint de uma chamada, trocando ids por marcadores
+# (ex.: act_123/insights -> act_{id}/insights, 456 -> {id})
+def normalize_endpoint(path):
+    if isinstance(path, (list, tuple)):
+        path = '/'.join(map(str, path))
+    parts = [part for part in urlparse(str(path)).path.split('/') if part]
+    if parts and re.match(r'v[0-9]+\.[0-9]+', parts[0]):
+        parts = parts[1:]
+    normalized = []
+    for part in parts:
+        if re.fullmatch(r'act_[0-9]+', part):
+            normalized.append('act_{id}')
+        elif part.isdigit():
+            normalized.append('{id}')
+        else:
+            normalized.append(part)
+    return '/'.join(normalized)
+
+# Função para obter os campos pedidos em uma chamada, em texto separado por vírgulas
+def requested_fields(params):
+    fields = (params or {}).get('fields')
+    if isinstance(fields, (list, tuple)):
+        return ','.join(map(str, fields))
+    return fields or None
+
+# Função para contar as linhas de uma resposta (páginas de listagens e lotes)
+def response_rows(body):
+    if isinstance(body, list):
+        return len(body)
+    if isinstance(body, dict) and isinstance(body.get('data'), list):
+        return len(body['data'])
+    return None
+
+
+# Buffer das chamadas, gravado em lote (como o ExecutionLogger) por quem passar
+# do limite de linhas ou de tempo; compartilhado por todas as threads
+class GraphCallLedger:
+    def __init__(self, max_rows=LEDGER_FLUSH_ROWS, max_seconds=LEDGER_FLUSH_SECONDS):
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows = []
+        self.first_row_at = None
+        self.pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, **values):
+        row = tuple(values.get(column) for column in LEDGER_COLUMNS)
+        with self._lock:
+            if not self.rows:
+                self.first_row_at = time.monotonic()
+            self.rows.append(row)
+            due = len(self.rows) >= self.max_rows or time.monotonic() - self.first_row_at >= self.max_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self.rows, self.first_row_at = self.rows, [], None
+        if not rows:
+            return 0
+        try:
+            conn = get_connection()
+            with conn:
+                conn.executemany(INSERT_GRAPH_CALL_SQL, rows)
+                if time.time() - self.pruned_at > LEDGER_PRUNE_INTERVAL_SECONDS:
+                    self.pruned_at = time.time()
+                    conn.execute(
+                        "DELETE FROM graph_calls WHERE called_at < ?",
+                        (time.time() - LEDGER_RETENTION_DAYS * 86400,)
+                    )
+        except Exception:
+            # O registro nunca interrompe as chamadas à API
+            logger.exception("Erro ao gravar o registro de chamadas da Graph API")
+            return 0
+        return len(rows)
+
+
+# Registro compartilhado pelo processo
+graph_ledger = GraphCallLedger()
+
+# Função para carregar as chamadas registradas desde since (timestamp) em um DataFrame
+def load_graph_calls(since, account_id=None):
+    graph_ledger.flush()
+    query = f"SELECT {', '.join(LEDGER_COLUMNS)} FROM graph_calls WHERE called_at >= ?"
+    params = [since]
+    if account_id:
+        query += " AND account_id = ?"
+        params.append(str(account_id))
+    c = get_connection().cursor()
+    c.execute(query, params)
+    frame = pd.DataFrame(c.fetchall(), columns=LEDGER_COLUMNS)
+    frame['called_at'] = pd.to_datetime(frame['called_at'], unit='s')
+    return frame
+
+# Função para resumir as chamadas por um ou mais campos (ex.: caller ou endpoint e
+# fields): quantidade, erros, bytes, linhas, latência p50/p95 e maior uso informado
+def summarize_graph_calls(frame, by):
+    if frame.empty:
+        return pd.DataFrame(columns=list(by) + [
+            'calls', 'errors', 'response_mb', 'rows', 'p50_ms', 'p95_ms', 'max_usage_pct'
+        ])
+    grouped = frame.assign(is_error=frame['status'] >= 400).groupby(list(by), dropna=False)
+    summary = grouped.agg(
+        calls=('latency_ms', 'size'),
+        errors=('is_error', 'sum'),
+        response_mb=('response_bytes', lambda values: values.sum() / 2 ** 20),
+        rows=('rows', 'sum'),
+        p50_ms=('latency_ms', lambda values: float(np.percentile(values, 50))),
+        p95_ms=('latency_ms', lambda values: float(np.percentile(values, 95))),
+        max_usage_pct=('usage_pct', 'max'),
+    ).reset_index()
+    return summary.sort_values('calls', ascending=False, ignore_index=True)
+
+# Função para calcular a latência p50/p95 de cada quem chamou por intervalo de tempo
+# (freq do pandas, ex.: 'h' ou 'D'), para o gráfico ao longo do tempo
+def graph_latency_over_time(frame, freq='h', callers=None):
+    if frame.empty:
+        return pd.DataFrame(columns=['called_at', 'caller', 'p50_ms', 'p95_ms'])
+    if callers is not None:
+        frame = frame[frame['caller'].isin(callers)]
+    grouped = frame.groupby([pd.Grouper(key='called_at', freq=freq), 'caller'])['latency_ms']
+    return grouped.agg(
+        p50_ms=lambda values: float(np.percentile(values, 50)),
+        p95_ms=lambda values: float(np.percentile(values, 95)),
+    ).reset_index()
@@ -0,0 +1,245 @@
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from fake_graph import FakeResponse
+from messages import logger
+
+# Gravação e reprodução do tráfego da Graph API, para testes de carga sem rede.
+# Com GRAPH_TRAFFIC_MODE=record cada requisição feita pelas sessões criadas em
+# facebook_api.create_facebook_api é repassada à API e gravada (requisição,
+# resposta e tempo) em GRAPH_FIXTURES_PATH; com GRAPH_TRAFFIC_MODE=replay as
+# respostas gravadas são devolvidas sem acessar a rede, com latência e erros
+# opcionais (GRAPH_REPLAY_LATENCY_SCALE, GRAPH_REPLAY_EXTRA_LATENCY,
+# GRAPH_REPLAY_ERROR_RATE, GRAPH_REPLAY_RATE_LIMIT_RATE, GRAPH_REPLAY_SEED)
+
+# Arquivo padrão das gravações (JSON por linha, compactado com gzip)
+DEFAULT_FIXTURES_PATH = os.path.join('data', 'graph_fixtures.jsonl.gz')
+
+# Cabeçalhos de resposta guardados nas gravações (os de uso alimentam o graph_throttle)
+RECORDED_HEADERS = ('content-type', 'x-business-use-case-usage', 'x-ad-account-usage', 'x-app-usage')
+
+# Parâmetros nunca gravados (nem nos parâmetros nem nas URLs das respostas)
+SECRET_PARAMS = ('access_token', 'appsecret_proof')
+
+# Parâmetros secretos em URLs dentro das respostas (ex.: paging.next), inclusive em
+# textos JSON aninhados (respostas de lotes), onde o valor termina em & " ou \
+SECRET_URL_PARAM = re.compile(r'([?&])(?:' + '|'.join(SECRET_PARAMS) + r')=[^&"\\\s]*&?')
+
+# Parâmetros que mudam a cada dia (períodos e filtros por updated_time); na reprodução,
+# sem uma gravação idêntica, vale a gravação da mesma requisição com outros valores
+VOLATILE_PARAMS = ('time_range',)
+VOLATILE_FILTER_FIELDS = ('updated_time',)
+
+
+# Função para decodificar os parâmetros já codificados pela SDK (valores JSON em texto)
+def _decode_params(params):
+    decoded = {}
+    for key, value in (params or {}).items():
+        if key in SECRET_PARAMS:
+            continue
+        try:
+            decoded[key] = json.loads(value) if isinstance(value, str) else value
+        except ValueError:
+            decoded[key] = value
+    return decoded
+
+# Função para remover os parâmetros secretos das URLs de uma resposta
+def _scrub_secrets(text):
+    return SECRET_URL_PARAM.sub(r'\1', text) if text else text
+
+# Função para obter o caminho da requisição sem a versão da API (ex.: act_1/insights)
+def _request_path(url):
+    path = [part for part in urlparse(url).path.split('/') if part]
+    if path and re.match(r'v[0-9]+\.[0-9]+', path[0]):
+        path = path[1:]
+    return '/'.join(path)
+
+# Função para montar a chave de uma requisição; com loose=True os parâmetros
+# voláteis são ignorados
+def request_key(method, path, params, loose=False):
+    if loose:
+        params = {key: value for key, value in params.items() if key not in VOLATILE_PARAMS}
+        if isinstance(params.get('filtering'), list):
+            params['filtering'] = [
+                condition for condition in params['filtering']
+                if not isinstance(condition, dict) or condition.get('field') not in VOLATILE_FILTER_FIELDS
+            ]
+    return json.dumps([method, path, params], sort_keys=True, default=str)
+
+
+# Repassa as requisições de uma sessão à API (requests.Session original, que já
+# leva o token) e grava cada troca no arquivo compartilhado por todas as sessões
+class RecordingRequests:
+    def __init__(self, inner, writer):
+        self.inner = inner
+        self.writer = writer
+
+    def request(self, method, url, params=None, data=None, headers=None, files=None, timeout=None):
+        started = time.perf_counter()
+        response = self.inner.request(
+            method, url, params=params, data=data, headers=headers, files=files, timeout=timeout
+        )
+        self.writer.write({
+            'method': method,
+            'path': _request_path(url),
+            'params': _decode_params(params if method in ('GET', 'DELETE') else data),
+            'status': response.status_code,
+            'headers': {
+                name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers
+            },
+            'body': _scrub_secrets(response.text),
+            'elapsed': round(time.perf_counter() - started, 4),
+        })
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+# Arquivo de gravação aberto uma vez por processo e compartilhado entre threads
+class FixtureWriter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# Devolve as respostas gravadas. Requisições repetidas (ex.: consultas ao status de
+# um relatório assíncrono) recebem as respostas na ordem gravada, repetindo a última.
+# Alterações sem gravação são aceitas (sucesso); leituras sem gravação falham
+class ReplayRequests:
+    def __init__(self, path, latency_scale=1.0, extra_latency=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, seed=0, sleep=time.sleep):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.extra_latency = extra_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.sleep = sleep
+        self.misses = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._loose = {}
+        self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as fixtures:
+            for line in fixtures:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                method, path, params = record['method'], record['path'], record['params']
+                self._exact.setdefault(request_key(method, path, params), deque()).append(record)
+                self._loose.setdefault(request_key(method, path, params, loose=True), deque()).append(record)
+
+    # Próxima resposta gravada de uma chave (a última se repete)
+    def _next(self, responses):
+        return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def request(self, method, url, params=None, data=None, headers=None, files=None, timeout=None):
+        path = _request_path(url)
+        params = _decode_params(params if method in ('GET', 'DELETE') else data)
+
+        # Erros simulados não consomem a resposta gravada, que fica para a nova tentativa
+        with self._lock:
+            roll = self._random.random()
+            record = None
+            if roll >= self.error_rate + self.rate_limit_rate:
+                responses = (
+                    self._exact.get(request_key(method, path, params))
+                    or self._loose.get(request_key(method, path, params, loose=True))
+                )
+                record = self._next(responses) if responses else None
+                if record is None:
+                    self.misses += 1
+
+        delay = (record['elapsed'] if record else 0.0) * self.latency_scale + self.extra_latency
+        if delay > 0:
+            self.sleep(delay)
+
+        if roll < self.error_rate:
+            return FakeResponse(
+                {'error': {'message': "Falha temporária simulada", 'code': 2, 'is_transient': True}},
+                status_code=503
+            )
+        if roll < self.error_rate + self.rate_limit_rate:
+            return FakeResponse(
+                {'error': {'message': "Limite de requisições simulado", 'code': 17}},
+                status_code=400,
+                headers={'content-type': 'application/json',
+                         'x-ad-account-usage': json.dumps({'acc_id_util_pct': 100, 'reset_time_duration': 5})}
+            )
+
+        if record is not None:
+            return FakeResponse(None, record['status'], record['headers'], text=record['body'])
+
+        logger.info("Requisição sem gravação na reprodução: %s %s", method, path)
+        if method == 'POST' and not path and 'batch' in params:
+            return FakeResponse([
+                {'code': 200, 'headers': [], 'body': json.dumps({'success': True})} for _ in params['batch']
+            ])
+        if method == 'POST':
+            return FakeResponse({'success': True})
+        return FakeResponse(
+            {'error': {'message': f"Requisição sem gravação: {method} {path}", 'code': 100}},
+            status_code=400
+        )
+
+
+# Gravadores e reprodutores por arquivo, compartilhados por todas as sessões do processo
+_writers = {}
+_replays = {}
+_registry_lock = threading.Lock()
+
+# Função para obter o gravador de um arquivo
+def get_fixture_writer(path=DEFAULT_FIXTURES_PATH):
+    with _registry_lock:
+        if path not in _writers:
+            _writers[path] = FixtureWriter(path)
+        return _writers[path]
+
+# Função para obter o reprodutor de um arquivo, com as opções do ambiente
+def get_replay(path=DEFAULT_FIXTURES_PATH):
+    with _registry_lock:
+        if path not in _replays:
+            _replays[path] = ReplayRequests(
+                path,
+                latency_scale=float(os.environ.get('GRAPH_REPLAY_LATENCY_SCALE', 1.0)),
+                extra_latency=float(os.environ.get('GRAPH_REPLAY_EXTRA_LATENCY', 0.0)),
+                error_rate=float(os.environ.get('GRAPH_REPLAY_ERROR_RATE', 0.0)),
+                rate_limit_rate=float(os.environ.get('GRAPH_REPLAY_RATE_LIMIT_RATE', 0.0)),
+                seed=int(os.environ.get('GRAPH_REPLAY_SEED', 0)),
+            )
+        return _replays[path]
+
+# Função para ligar a gravação ou a reprodução em uma sessão da SDK, conforme
+# GRAPH_TRAFFIC_MODE (ou mode); sem modo, a sessão fica como está
+def install_graph_traffic(session, mode=None, path=None):
+    mode = mode or os.environ.get('GRAPH_TRAFFIC_MODE')
+    path = path or os.environ.get('GRAPH_FIXTURES_PATH') or DEFAULT_FIXTURES_PATH
+    if mode == 'record':
+        session.requests = RecordingRequests(session.requests, get_fixture_writer(path))
+    elif mode == 'replay':
+        session.requests = get_replay(path)
+    return session
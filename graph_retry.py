@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+
+from facebook_business.exceptions import FacebookRequestError
+from requests.exceptions import ConnectionError, Timeout
+
+# Novas tentativas após a primeira falha temporária de uma chamada
+MAX_RETRIES = 3
+
+# Espera base e máxima (em segundos) entre tentativas; a espera dobra a cada
+# tentativa e é sorteada entre zero e esse valor (jitter)
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# Falhas temporárias seguidas que abrem o circuito de uma conta
+CIRCUIT_FAILURE_THRESHOLD = 5
+
+# Tempo (em segundos) que o circuito fica aberto antes de permitir uma chamada de teste
+CIRCUIT_RESET_SECONDS = 60
+
+# Códigos de erro temporários da Graph API: erro desconhecido, serviço indisponível
+# e limites de requisições (os limites também são tratados pelo graph_throttle)
+RETRYABLE_ERROR_CODES = {1, 2, 4, 17, 32, 341, 613, 80000, 80001, 80002, 80003, 80004,
+                         80005, 80006, 80008, 80009, 80014}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Função para classificar um erro como temporário (vale tentar de novo) ou definitivo
+def is_retryable_error(error):
+    if isinstance(error, FacebookRequestError):
+        return (
+            error.api_error_code() in RETRYABLE_ERROR_CODES
+            or (error.http_status() or 0) >= 500
+            or bool(error.api_transient_error())
+        )
+    return isinstance(error, (ConnectionError, Timeout))
+
+# Função para calcular a espera antes da nova tentativa (attempt começa em 0)
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# Circuito de uma conta: depois de várias falhas temporárias seguidas, as chamadas
+# falham na hora (sem gastar cota) até passar o tempo de espera; então uma chamada
+# de teste é liberada e, se funcionar, o circuito volta a fechar
+class CircuitBreaker:
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds=CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    # Chamado antes de cada chamada; levanta CircuitOpenError com o circuito aberto
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_seconds - self.clock()
+            if remaining > 0 or self._trial_in_progress:
+                raise CircuitOpenError(
+                    f"Chamadas à Graph API suspensas após {self.failures} falhas seguidas; "
+                    f"nova tentativa em {max(remaining, 0):.0f}s"
+                )
+            self._trial_in_progress = True
+
+    # Libera a chamada de teste quando ela não chegou a ser enviada
+    def cancel_call(self):
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_progress or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_in_progress = False
+
+
+# Circuitos compartilhados por todas as instâncias da API de uma mesma conta
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+# Função para obter o circuito de uma conta
+def get_circuit_breaker(account_id):
+    with _breakers_lock:
+        breaker = _breakers.get(str(account_id))
+        if breaker is None:
+            breaker = _breakers[str(account_id)] = CircuitBreaker()
+        return breaker
@@ -0,0 +1,288 @@
+import json
+import threading
+import time
+
+from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
+
+from graph_ledger import get_graph_caller, graph_ledger, normalize_endpoint, requested_fields, response_rows
+from graph_retry import MAX_RETRIES, backoff_delay, is_retryable_error
+from messages import logger
+from render_profiler import profile_phase
+
+# Pontos consumidos por requisição, como na pontuação da Marketing API
+# (leituras valem 1 ponto e escritas 3)
+READ_COST = 1
+WRITE_COST = 3
+
+# Capacidade do balde de cada conta (rajada máxima, em pontos)
+BUCKET_CAPACITY = 200
+
+# Reposição do balde (pontos por segundo) com uso baixo e com uso no limite
+MAX_REFILL_PER_SECOND = 20.0
+MIN_REFILL_PER_SECOND = 0.5
+
+# Uso (%) informado pela API a partir do qual o ritmo começa a ser reduzido
+SLOWDOWN_USAGE_PCT = 50
+
+# Espera (em segundos) quando o limite é atingido sem a API informar o tempo de retorno
+DEFAULT_BLOCK_SECONDS = 60
+
+# Espera máxima aceita para uma requisição; acima disso ela falha sem ser enviada
+MAX_WAIT_SECONDS = 300
+
+# Códigos de erro da Graph API que indicam limite de requisições atingido
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+
+# Cabeçalhos de uso enviados pela Graph API
+USAGE_HEADERS = ('x-business-use-case-usage', 'x-ad-account-usage', 'x-app-usage')
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+# Função para calcular o custo em pontos de uma chamada (lotes somam cada requisição)
+def request_cost(method, params=None):
+    batch = (params or {}).get('batch')
+    if isinstance(batch, list):
+        return sum(READ_COST if item.get('method') == 'GET' else WRITE_COST for item in batch)
+    return READ_COST if method == 'GET' else WRITE_COST
+
+def _load_header(value):
+    if isinstance(value, (dict, list)):
+        return value
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
+
+# Função para extrair dos cabeçalhos de uso o maior percentual de uso e o tempo
+# (em segundos) até a cota voltar. Retorna (None, 0) sem cabeçalhos de uso
+def parse_usage_headers(headers):
+    headers = {str(name).lower(): value for name, value in (headers or {}).items()}
+    usage_pct = None
+    block_seconds = 0
+
+    def add_usage(value):
+        nonlocal usage_pct
+        if value is not None:
+            usage_pct = max(usage_pct or 0, float(value))
+
+    # {"<business_id>": [{"type": ..., "call_count": %, "total_cputime": %,
+    #                     "total_time": %, "estimated_time_to_regain_access": minutos}]}
+    business_usage = _load_header(headers.get('x-business-use-case-usage'))
+    if isinstance(business_usage, dict):
+        for entries in business_usage.values():
+            for entry in entries or []:
+                for key in ('call_count', 'total_cputime', 'total_time'):
+                    add_usage(entry.get(key))
+                block_seconds = max(block_seconds, (entry.get('estimated_time_to_regain_access') or 0) * 60)
+
+    # {"acc_id_util_pct": %, "reset_time_duration": segundos}
+    account_usage = _load_header(headers.get('x-ad-account-usage'))
+    if isinstance(account_usage, dict):
+        add_usage(account_usage.get('acc_id_util_pct'))
+        if (account_usage.get('acc_id_util_pct') or 0) >= 100:
+            block_seconds = max(block_seconds, account_usage.get('reset_time_duration') or 0)
+
+    # {"call_count": %, "total_cputime": %, "total_time": %}
+    app_usage = _load_header(headers.get('x-app-usage'))
+    if isinstance(app_usage, dict):
+        for key in ('call_count', 'total_cputime', 'total_time'):
+            add_usage(app_usage.get(key))
+
+    return usage_pct, block_seconds
+
+# Balde de pontos de uma conta. A reposição diminui conforme o uso informado pela
+# API se aproxima de 100%, e as requisições são adiadas enquanto a conta está bloqueada
+class RequestGovernor:
+    def __init__(self, capacity=BUCKET_CAPACITY, max_rate=MAX_REFILL_PER_SECOND,
+                 min_rate=MIN_REFILL_PER_SECOND, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = capacity
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.usage_pct = 0.0
+        self.blocked_until = 0.0
+        self.total_wait_seconds = 0.0
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    # Pontos repostos por segundo para o uso atual
+    def refill_rate(self):
+        if self.usage_pct <= SLOWDOWN_USAGE_PCT:
+            return self.max_rate
+        remaining = max(0.0, (100 - self.usage_pct) / (100 - SLOWDOWN_USAGE_PCT))
+        return max(self.min_rate, self.max_rate * remaining)
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate())
+
+    # Aguarda até haver pontos para a requisição. Levanta RateLimitExceeded, sem
+    # esperar, quando a espera necessária passa de max_wait segundos
+    def acquire(self, cost=READ_COST, max_wait=MAX_WAIT_SECONDS):
+        cost = min(cost, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                wait = max(self.blocked_until - now, 0.0)
+                if not wait and self.tokens >= cost:
+                    self.tokens -= cost
+                    self.total_wait_seconds += waited
+                    return waited
+                if not wait:
+                    wait = (cost - self.tokens) / self.refill_rate()
+
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(
+                    f"Limite de requisições da Graph API atingido; nova tentativa possível em {wait:.0f}s"
+                )
+            if wait >= 1:
+                logger.info("Limite de requisições próximo (uso %.0f%%), aguardando %.1fs", self.usage_pct, wait)
+            self.sleep(wait)
+            waited += wait
+
+    # Atualiza o uso e o bloqueio da conta a partir dos cabeçalhos de uma resposta
+    def observe(self, headers, rate_limited=False):
+        usage_pct, block_seconds = parse_usage_headers(headers)
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if usage_pct is not None:
+                self.usage_pct = usage_pct
+            if rate_limited and not block_seconds:
+                block_seconds = DEFAULT_BLOCK_SECONDS
+            if block_seconds:
+                self.blocked_until = max(self.blocked_until, now + block_seconds)
+                self.tokens = 0.0
+
+
+# Baldes compartilhados por todas as instâncias da API de uma mesma conta
+_governors = {}
+_governors_lock = threading.Lock()
+
+# Função para obter o balde de uma conta
+def get_governor(account_id):
+    with _governors_lock:
+        governor = _governors.get(str(account_id))
+        if governor is None:
+            governor = _governors[str(account_id)] = RequestGovernor()
+        return governor
+
+# Função para converter os cabeçalhos de uma resposta de lote ([{name, value}]) em dict
+def _batch_item_headers(headers):
+    if isinstance(headers, list):
+        return {item.get('name'): item.get('value') for item in headers}
+    return headers or {}
+
+def _is_rate_limit_body(body):
+    body = _load_header(body)
+    error = body.get('error') if isinstance(body, dict) else None
+    return bool(error) and error.get('code') in RATE_LIMIT_ERROR_CODES
+
+# FacebookAdsApi que passa todas as chamadas pelo balde da conta: espera antes de
+# enviar e lê os cabeçalhos de uso (inclusive de cada requisição de um lote) depois.
+# Com um circuito (graph_retry.CircuitBreaker), falhas temporárias são repetidas
+# com espera exponencial e o circuito da conta interrompe as chamadas quando abre.
+# Cada tentativa enviada é registrada em graph_calls (ver graph_ledger)
+class GovernedFacebookAdsApi(FacebookAdsApi):
+    def __init__(self, session, governor, breaker=None, max_retries=MAX_RETRIES,
+                 api_version=None, enable_debug_logger=False, sleep=time.sleep,
+                 account_id=None, ledger=graph_ledger):
+        super().__init__(session, api_version, enable_debug_logger)
+        self.governor = governor
+        self.breaker = breaker
+        self.max_retries = max_retries if breaker is not None else 0
+        self.sleep = sleep
+        self.account_id = str(account_id) if account_id is not None else None
+        self.ledger = ledger
+
+    # Registra uma tentativa (com a resposta ou o erro) no registro de chamadas
+    def _record_call(self, method, path, params, attempt, started, response=None, error=None):
+        if self.ledger is None:
+            return
+        values = {
+            'called_at': time.time(),
+            'account_id': self.account_id,
+            'caller': get_graph_caller(),
+            'method': method,
+            'endpoint': normalize_endpoint(path),
+            'fields': requested_fields(params),
+            'attempt': attempt,
+            'latency_ms': (time.perf_counter() - started) * 1000,
+            'status': 0,
+        }
+        if response is not None:
+            body = response.body() or ''
+            values.update(
+                status=response.status(),
+                response_bytes=len(body.encode('utf-8')) if isinstance(body, str) else len(body),
+                rows=response_rows(response.json()),
+                usage_pct=parse_usage_headers(response.headers())[0],
+            )
+        elif isinstance(error, FacebookRequestError):
+            values.update(
+                status=error.http_status() or 0,
+                error_code=error.api_error_code(),
+                response_bytes=len(json.dumps(error.body(), default=str)),
+                usage_pct=parse_usage_headers(error.http_headers())[0],
+            )
+        self.ledger.record(**values)
+
+    def call(self, method, path, params=None, headers=None, files=None, url_override=None,
+             api_version=None):
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                self.governor.acquire(request_cost(method, params))
+            except Exception:
+                if self.breaker is not None:
+                    self.breaker.cancel_call()
+                raise
+
+            started = time.perf_counter()
+            try:
+                with profile_phase('graph'):
+                    response = super().call(
+                        method, path, params=params, headers=headers, files=files,
+                        url_override=url_override, api_version=api_version
+                    )
+            except Exception as e:
+                self._record_call(method, path, params, attempt, started, error=e)
+                if isinstance(e, FacebookRequestError):
+                    self.governor.observe(e.http_headers(), e.api_error_code() in RATE_LIMIT_ERROR_CODES)
+                retryable = is_retryable_error(e)
+                if self.breaker is not None:
+                    # Erros definitivos mostram que a API está respondendo
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("Falha temporária na Graph API (%s), nova tentativa em %.1fs", e, delay)
+                self.sleep(delay)
+                attempt += 1
+                continue
+
+            self._record_call(method, path, params, attempt, started, response=response)
+            if self.breaker is not None:
+                self.breaker.record_success()
+            self.governor.observe(response.headers())
+            if isinstance((params or {}).get('batch'), list):
+                for item in response.json() or []:
+                    if item:
+                        self.governor.observe(
+                            _batch_item_headers(item.get('headers')), _is_rate_limit_body(item.get('body'))
+                        )
+            return response
@@ -0,0 +1,292 @@
+import time
+from datetime import date, timedelta
+
+from facebook_business.adobjects.adaccount import AdAccount
+
+from database import get_connection
+from graph_insights import iter_chunked_insights, iter_insights
+
+# Quantos dias de histórico diário manter sincronizados (cobre o maior período, last_30d)
+INSIGHTS_SYNC_DAYS = 30
+
+# Quantos dias de histórico diário guardar no banco; dias baixados para simulações
+# (ver rule_backtest.py) além de INSIGHTS_SYNC_DAYS só são descartados depois disso
+INSIGHTS_RETENTION_DAYS = 120
+
+# Dias mais recentes baixados novamente a cada sincronização (atribuição tardia)
+INSIGHTS_REFETCH_DAYS = 3
+
+# Intervalo mínimo (em segundos) entre duas sincronizações da mesma conta
+INSIGHTS_SYNC_INTERVAL_SECONDS = 900
+
+# Campos pedidos à Graph API para o histórico diário (por anúncio, com a hierarquia)
+DAILY_INSIGHT_FIELDS = [
+    'campaign_id', 'campaign_name', 'adset_id', 'adset_name', 'ad_id', 'ad_name',
+    'date_start', 'spend', 'impressions', 'clicks', 'actions', 'cost_per_action_type'
+]
+
+# Colunas de identificação de cada nível, do mais alto ao próprio nível.
+# Campanhas e conjuntos são somados a partir das linhas diárias de anúncios
+LEVEL_COLUMNS = {
+    'campaign': ['campaign_id', 'campaign_name'],
+    'adset': ['campaign_id', 'campaign_name', 'adset_id', 'adset_name'],
+    'ad': ['campaign_id', 'campaign_name', 'adset_id', 'adset_name', 'ad_id', 'ad_name'],
+}
+
+# Status das campanhas incluídas no histórico (campanhas arquivadas e excluídas ficam de fora)
+INSIGHTS_EFFECTIVE_STATUSES = ['ACTIVE', 'PAUSED', 'IN_PROCESS', 'WITH_ISSUES']
+
+# Acima desta quantidade de linhas esperadas, a leitura é dividida em blocos de campanhas
+# lidos em paralelo, em vez de um único relatório da conta
+CHUNKED_FETCH_ROW_THRESHOLD = 50000
+
+# Campanhas por bloco na leitura dividida
+INSIGHTS_CHUNK_SIZE = 100
+
+# Quantidade de dias de cada período suportado (todos terminam ontem)
+TIME_RANGE_DAYS = {
+    'yesterday': 1,
+    'last_7d': 7,
+    'last_30d': 30,
+}
+
+# Função para extrair compras e CPA das listas de ações de um insight
+def process_insight(insight_dict):
+    # Processar ações e conversões
+    purchases = 0
+    if 'actions' in insight_dict:
+        for action in insight_dict['actions']:
+            if action['action_type'] == 'purchase':
+                purchases = int(action['value'])
+
+    # Calcular CPA
+    cpa = 0
+    if 'cost_per_action_type' in insight_dict:
+        for cost_action in insight_dict['cost_per_action_type']:
+            if cost_action['action_type'] == 'purchase':
+                cpa = float(cost_action['value'])
+
+    # Adicionar dados processados
+    insight_dict['purchases'] = purchases
+    insight_dict['cpa'] = cpa
+    return insight_dict
+
+# Função para calcular o intervalo de datas (inclusive) de um período
+def time_range_dates(time_range, today=None):
+    today = today or date.today()
+    days = TIME_RANGE_DAYS[time_range]
+    return today - timedelta(days=days), today - timedelta(days=1)
+
+# Função para calcular os intervalos de datas que ainda precisam ser baixados
+def _missing_ranges(sync_state, window_start, window_end, refetch_days):
+    if sync_state is None:
+        return [(window_start, window_end)]
+
+    synced_since = date.fromisoformat(sync_state['synced_since'])
+    synced_until = date.fromisoformat(sync_state['synced_until'])
+    ranges = []
+
+    # Dias anteriores ao que já foi sincronizado
+    if window_start < synced_since:
+        ranges.append((window_start, min(synced_since - timedelta(days=1), window_end)))
+
+    # Dias novos mais a janela de nova busca para atribuição tardia
+    since = max(window_start, synced_since, synced_until + timedelta(days=1 - refetch_days))
+    if since <= window_end:
+        ranges.append((since, window_end))
+
+    return ranges
+
+# Função para obter o estado de sincronização de uma conta
+def get_sync_state(account_id):
+    c = get_connection().cursor()
+    c.execute(
+        "SELECT synced_since, synced_until, synced_at FROM insights_sync WHERE account_id = ?",
+        (str(account_id),)
+    )
+    row = c.fetchone()
+    if row:
+        return {"synced_since": row[0], "synced_until": row[1], "synced_at": row[2]}
+    return None
+
+# Função para antecipar a próxima sincronização de uma conta (ignora o intervalo mínimo)
+def expire_insights_sync(account_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE insights_sync SET synced_at = 0 WHERE account_id = ?", (str(account_id),))
+
+# Função para estimar quantas linhas diárias um intervalo vai retornar
+# (anúncios já conhecidos x dias); None quando a conta nunca foi sincronizada
+def estimate_daily_rows(account_id, since, until):
+    c = get_connection().cursor()
+    c.execute(
+        "SELECT COUNT(DISTINCT ad_id) FROM insights_daily WHERE account_id = ?",
+        (str(account_id),)
+    )
+    known_ads = c.fetchone()[0]
+    if not known_ads and get_sync_state(account_id) is None:
+        return None
+    return max(known_ads, 1) * ((until - since).days + 1)
+
+# Função para listar os ids das campanhas incluídas no histórico, página a página
+def list_campaign_ids(account_id, api=None):
+    account = AdAccount(f'act_{account_id}', api=api)
+    campaigns = account.get_campaigns(
+        fields=['id'],
+        params={'effective_status': INSIGHTS_EFFECTIVE_STATUSES, 'limit': 500}
+    )
+    return [campaign['id'] for campaign in campaigns]
+
+# Função para escolher como ler os insights: um único relatório da conta ('account')
+# ou blocos de campanhas lidos em paralelo ('chunks'), para contas grandes ou
+# ainda desconhecidas (expected_rows=None)
+def choose_fetch_strategy(expected_rows):
+    if expected_rows is not None and expected_rows < CHUNKED_FETCH_ROW_THRESHOLD:
+        return 'account'
+    return 'chunks'
+
+# Função para baixar da Graph API os insights diários de um intervalo, página a página;
+# relatórios grandes usam automaticamente o job assíncrono (ver graph_insights).
+# Uma única leitura por anúncio traz também os ids de campanha e conjunto.
+# strategy: 'auto', 'account' ou 'chunks' (ver choose_fetch_strategy)
+def fetch_daily_insights(account_id, since, until, api=None, mode='auto', strategy='auto'):
+    account = AdAccount(f'act_{account_id}', api=api)
+    params = {
+        'level': 'ad',
+        'time_increment': 1,
+        'time_range': {'since': since.isoformat(), 'until': until.isoformat()},
+    }
+    expected_rows = estimate_daily_rows(account_id, since, until) if mode == 'auto' else None
+    if strategy == 'auto':
+        strategy = choose_fetch_strategy(expected_rows)
+
+    chunks = []
+    if strategy == 'chunks':
+        campaign_ids = list_campaign_ids(account_id, api=api)
+        chunks = [
+            campaign_ids[start:start + INSIGHTS_CHUNK_SIZE]
+            for start in range(0, len(campaign_ids), INSIGHTS_CHUNK_SIZE)
+        ]
+
+    if len(chunks) > 1:
+        chunk_rows = expected_rows // len(chunks) if expected_rows is not None else None
+        insights = iter_chunked_insights(
+            account, params, DAILY_INSIGHT_FIELDS, 'campaign.id', chunks, chunk_rows, mode
+        )
+    else:
+        params['filtering'] = [
+            {'field': 'campaign.effective_status', 'operator': 'IN', 'value': INSIGHTS_EFFECTIVE_STATUSES}
+        ]
+        insights = iter_insights(account, params, DAILY_INSIGHT_FIELDS, expected_rows, mode)
+
+    for insight in insights:
+        yield process_insight(insight.export_all_data())
+
+# Função para gravar os insights diários de um intervalo, substituindo os existentes
+# As páginas são convertidas em linhas à medida que chegam; a gravação acontece
+# depois, em uma única transação, para não segurar o banco durante o download
+def _store_daily_insights(account_id, since, until, insights):
+    rows = [
+        (
+            str(account_id), insight.get('ad_id'), insight.get('date_start'),
+            insight.get('campaign_id'), insight.get('campaign_name'),
+            insight.get('adset_id'), insight.get('adset_name'), insight.get('ad_name'),
+            float(insight.get('spend', 0)), int(insight.get('impressions', 0)),
+            int(insight.get('clicks', 0)), insight.get('purchases', 0)
+        )
+        for insight in insights
+    ]
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM insights_daily WHERE account_id = ? AND date BETWEEN ? AND ?",
+            (str(account_id), since.isoformat(), until.isoformat())
+        )
+        conn.executemany('''
+            INSERT INTO insights_daily
+            (account_id, ad_id, date, campaign_id, campaign_name, adset_id, adset_name, ad_name,
+             spend, impressions, clicks, purchases)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    return len(rows)
+
+# Função para sincronizar o histórico diário de uma conta, baixando apenas os dias
+# que faltam mais os últimos refetch_days dias. Retorna a quantidade de linhas gravadas
+def sync_insights_daily(account_id, days=INSIGHTS_SYNC_DAYS, refetch_days=INSIGHTS_REFETCH_DAYS,
+                        min_interval=INSIGHTS_SYNC_INTERVAL_SECONDS, force=False, api=None, mode='auto'):
+    sync_state = get_sync_state(account_id)
+    today = date.today()
+    window_start, window_end = today - timedelta(days=days), today - timedelta(days=1)
+
+    # O intervalo mínimo só vale quando o histórico já cobre o início da janela
+    covered = sync_state and date.fromisoformat(sync_state['synced_since']) <= window_start
+    if not force and covered and time.time() - sync_state['synced_at'] < min_interval:
+        return 0
+
+    written = 0
+    for since, until in _missing_ranges(sync_state, window_start, window_end, refetch_days):
+        insights = fetch_daily_insights(account_id, since, until, api=api, mode=mode)
+        written += _store_daily_insights(account_id, since, until, insights)
+
+    # Guardar o período coberto (a janela mais os dias anteriores ainda retidos)
+    # e descartar dias além de INSIGHTS_RETENTION_DAYS
+    retention_start = today - timedelta(days=max(days, INSIGHTS_RETENTION_DAYS))
+    synced_since = window_start
+    if sync_state:
+        synced_since = max(retention_start, min(window_start, date.fromisoformat(sync_state['synced_since'])))
+
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM insights_daily WHERE account_id = ? AND date < ?",
+            (str(account_id), synced_since.isoformat())
+        )
+        conn.execute('''
+            INSERT OR REPLACE INTO insights_sync (account_id, synced_since, synced_until, synced_at)
+            VALUES (?, ?, ?, ?)
+        ''', (str(account_id), synced_since.isoformat(), window_end.isoformat(), time.time()))
+
+    return written
+
+# Função para calcular localmente os insights de um nível (campaign, adset ou ad)
+# em um período, somando as linhas diárias dos anúncios. Cada linha traz as colunas
+# de LEVEL_COLUMNS e as métricas no formato da Graph API (purchases e cpa já processados)
+def get_local_insights(account_id, level='campaign', object_ids=None, time_range='last_7d'):
+    since, until = time_range_dates(time_range)
+    columns = LEVEL_COLUMNS[level]
+    id_columns = [column for column in columns if column.endswith('_id')]
+    name_columns = [column for column in columns if column.endswith('_name')]
+
+    c = get_connection().cursor()
+    c.execute(f'''
+        SELECT {", ".join(id_columns)},
+               {", ".join(f"MAX({column}) AS {column}" for column in name_columns)},
+               SUM(spend) AS spend, SUM(impressions) AS impressions,
+               SUM(clicks) AS clicks, SUM(purchases) AS purchases
+        FROM insights_daily
+        WHERE account_id = ? AND date BETWEEN ? AND ?
+        GROUP BY {", ".join(id_columns)}
+    ''', (str(account_id), since.isoformat(), until.isoformat()))
+
+    result_columns = [description[0] for description in c.description]
+    wanted_ids = set(map(str, object_ids)) if object_ids is not None else None
+    insights = []
+    for row in c.fetchall():
+        insight = dict(zip(result_columns, row))
+        if wanted_ids is not None and insight[f'{level}_id'] not in wanted_ids:
+            continue
+        spend, impressions = insight['spend'], insight['impressions']
+        clicks, purchases = insight['clicks'], insight['purchases']
+        insight.update({
+            'date_start': since.isoformat(),
+            'date_stop': until.isoformat(),
+            'ctr': clicks / impressions * 100 if impressions else 0,
+            'cpc': spend / clicks if clicks else 0,
+            'cpa': spend / purchases if purchases else 0,
+        })
+        insights.append(insight)
+    return insights
+
+# Função para calcular localmente os insights de campanhas de um período
+def get_local_campaign_insights(account_id, campaign_ids=None, time_range='last_7d'):
+    return get_local_insights(account_id, 'campaign', campaign_ids, time_range)
@@ -0,0 +1,54 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('gerenciador_anuncios')
+
+# Funções usadas pelos módulos sem interface para exibir mensagens.
+# Fora do Streamlit as mensagens vão para o logging; o app troca por st.error etc.
+_default_handlers = {
+    'error': logger.error,
+    'info': logger.info,
+    'success': logger.info,
+}
+
+# As funções trocadas valem apenas para a thread que as registrou (a thread do
+# script do Streamlit); threads do executor de várias contas continuam no logging
+_local = threading.local()
+
+def _current_handlers():
+    return getattr(_local, 'handlers', _default_handlers)
+
+# Função para trocar as funções de exibição de mensagens da thread atual
+def set_message_handlers(error=None, info=None, success=None):
+    handlers = dict(_current_handlers())
+    if error is not None:
+        handlers['error'] = error
+    if info is not None:
+        handlers['info'] = info
+    if success is not None:
+        handlers['success'] = success
+    _local.handlers = handlers
+
+# Função para coletar as mensagens de erro emitidas na thread atual dentro do bloco
+# (as mensagens continuam sendo exibidas normalmente)
+@contextmanager
+def capture_errors():
+    previous = getattr(_local, 'errors', None)
+    errors = _local.errors = []
+    try:
+        yield errors
+    finally:
+        _local.errors = previous
+
+def report_error(message):
+    errors = getattr(_local, 'errors', None)
+    if errors is not None:
+        errors.append(message)
+    _current_handlers()['error'](message)
+
+def report_info(message):
+    _current_handlers()['info'](message)
+
+def report_success(message):
+    _current_handlers()['success'](message)
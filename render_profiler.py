@@ -0,0 +1,216 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+# Perfil de renderização do app: com o perfil ativo (opção na barra lateral ou
+# RENDER_PROFILE=1), cada execução do script do Streamlit é dividida em fases
+# (leituras do banco, inicialização da API, chamadas à Graph API, montagem de
+# DataFrames e renderização de tabelas e gráficos) e guardada por página, para
+# montar histogramas das últimas execuções e exportar em JSON
+
+# Fases medidas e seus nomes na tela; 'other' é o tempo fora de todas as fases
+PROFILE_PHASES = {
+    'db': "Banco de dados",
+    'api_init': "Inicialização da API",
+    'graph': "Graph API",
+    'dataframe': "Montagem de DataFrames",
+    'render': "Renderização",
+    'other': "Outros",
+}
+
+# Execuções guardadas por página para os histogramas
+PROFILE_HISTORY_RERUNS = 200
+
+# Limites (em ms) das faixas dos histogramas; a última faixa vai até o infinito
+PROFILE_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Perfil ativo por padrão ao iniciar o app
+PROFILE_ENABLED_BY_DEFAULT = os.environ.get('RENDER_PROFILE', '') not in ('', '0', 'false')
+
+# Execução medida no contexto atual (None sem perfil ativo)
+_active_profile = contextvars.ContextVar('render_profile', default=None)
+
+
+# Tempos de uma execução do script. As fases podem ser aninhadas (ex.: chamadas à
+# Graph API durante uma leitura do catálogo local) e cada fase conta apenas o tempo
+# fora das fases internas. Só a thread do script (a que criou o perfil) entra em
+# phases, que somam no máximo o tempo total; as threads do executor (insights em
+# paralelo) rodam enquanto o script espera em outra fase e ficam em worker_phases
+class RerunProfile:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.page = None
+        self.started = clock()
+        self.total_ms = None
+        self.thread = threading.get_ident()
+        self.phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.calls = dict.fromkeys(PROFILE_PHASES, 0)
+        self.worker_phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.worker_calls = dict.fromkeys(PROFILE_PHASES, 0)
+        self._stacks = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        stack = getattr(self._stacks, 'stack', None)
+        if stack is None:
+            stack = self._stacks.stack = []
+        # Fases repetidas dentro de si mesmas (ex.: uma função medida que chama
+        # outra da mesma fase) contam uma vez só
+        if stack and stack[-1][0] == name:
+            yield
+            return
+        entry = [name, self.clock(), 0.0]
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = self.clock() - entry[1]
+            if stack:
+                stack[-1][2] += elapsed
+            if threading.get_ident() == self.thread:
+                phases, calls = self.phases, self.calls
+            else:
+                phases, calls = self.worker_phases, self.worker_calls
+            with self._lock:
+                phases[name] += (elapsed - entry[2]) * 1000
+                calls[name] += 1
+
+    def finish(self):
+        self.total_ms = (self.clock() - self.started) * 1000
+        measured = sum(ms for name, ms in self.phases.items() if name != 'other')
+        self.phases['other'] = max(self.total_ms - measured, 0.0)
+        return self
+
+    def as_dict(self):
+        return {
+            'page': self.page,
+            'total_ms': round(self.total_ms or 0.0, 2),
+            'phases': {name: round(ms, 2) for name, ms in self.phases.items()},
+            'calls': dict(self.calls),
+            'worker_phases': {name: round(ms, 2) for name, ms in self.worker_phases.items() if name != 'other'},
+            'worker_calls': {name: count for name, count in self.worker_calls.items() if name != 'other'},
+        }
+
+
+# Últimas execuções medidas de cada página, compartilhadas pelas sessões do processo
+class ProfileHistory:
+    def __init__(self, max_reruns=PROFILE_HISTORY_RERUNS):
+        self.max_reruns = max_reruns
+        self.reruns = {}
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self.reruns.setdefault(profile.page, deque(maxlen=self.max_reruns)).append(profile.as_dict())
+
+    def pages(self):
+        with self._lock:
+            return list(self.reruns)
+
+    def get(self, page):
+        with self._lock:
+            return list(self.reruns.get(page, ()))
+
+    def clear(self):
+        with self._lock:
+            self.reruns.clear()
+
+
+# Histórico compartilhado pelo processo
+profile_history = ProfileHistory()
+
+# Função para medir uma execução do script; as fases medidas dentro do bloco
+# entram no perfil, que é guardado no histórico ao final (mesmo quando a execução
+# é interrompida por st.rerun ou st.stop) se a página tiver sido informada
+@contextmanager
+def rerun_profile(enabled=True, history=profile_history):
+    if not enabled:
+        yield None
+        return
+    profile = RerunProfile()
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+        if profile.page is not None:
+            history.add(profile.finish())
+
+# Função para informar a página da execução medida no contexto atual
+def set_profile_page(page):
+    profile = _active_profile.get()
+    if profile is not None:
+        profile.page = page
+
+# Bloco medido na fase name da execução atual (sem perfil ativo, não faz nada)
+@contextmanager
+def profile_phase(name):
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.phase(name):
+        yield
+
+# Função para medir todas as chamadas de func na fase name
+def profiled(name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile_phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+# Função para resumir as últimas execuções de uma página: por fase, a última
+# medição, p50, p95 e a contagem de execuções em cada faixa de PROFILE_BUCKETS_MS.
+# As fases das threads do executor ficam em worker_phases (só as que foram usadas)
+def summarize_page_profile(page, history=profile_history):
+    reruns = history.get(page)
+    if not reruns:
+        return None
+    summary = {'page': page, 'reruns': len(reruns), 'phases': {}, 'worker_phases': {}}
+    series = {'total': [rerun['total_ms'] for rerun in reruns]}
+    series.update({name: [rerun['phases'][name] for rerun in reruns] for name in PROFILE_PHASES})
+    for name, values in series.items():
+        summary['phases'][name] = _summarize_series(values)
+    for name in PROFILE_PHASES:
+        values = [rerun['worker_phases'].get(name, 0.0) for rerun in reruns]
+        if any(values):
+            summary['worker_phases'][name] = _summarize_series(values)
+    return summary
+
+# Função para resumir uma série de medições (ms) de uma fase
+def _summarize_series(values):
+    values = np.asarray(values, dtype=float)
+    counts, _ = np.histogram(values, bins=[0] + PROFILE_BUCKETS_MS + [np.inf])
+    return {
+        'last_ms': round(float(values[-1]), 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'histogram': dict(zip(bucket_labels(), counts.tolist())),
+    }
+
+# Função para obter os nomes das faixas dos histogramas (ex.: "<10 ms", "10-25 ms", ">=10000 ms")
+def bucket_labels():
+    labels = [f"<{PROFILE_BUCKETS_MS[0]} ms"]
+    labels += [f"{low}-{high} ms" for low, high in zip(PROFILE_BUCKETS_MS, PROFILE_BUCKETS_MS[1:])]
+    labels.append(f">={PROFILE_BUCKETS_MS[-1]} ms")
+    return labels
+
+# Função para exportar os resumos e as execuções guardadas de todas as páginas
+def export_profiles(history=profile_history):
+    return {
+        'exported_at': time.time(),
+        'buckets_ms': PROFILE_BUCKETS_MS,
+        'pages': {
+            page: {'summary': summarize_page_profile(page, history), 'reruns': history.get(page)}
+            for page in history.pages()
+        },
+    }
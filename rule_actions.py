@@ -0,0 +1,250 @@
+import time
+from functools import partial
+
+from facebook_business.api import FacebookAdsApi
+from facebook_business.adobjects.ad import Ad
+from facebook_business.adobjects.adaccount import AdAccount
+from facebook_business.adobjects.adset import AdSet
+from facebook_business.adobjects.campaign import Campaign
+
+from graph_retry import backoff_delay, is_retryable_error
+
+# Limite de requisições por lote da Graph API
+BATCH_SIZE = 50
+
+# Quantas vezes enviar as requisições de um lote que ficaram sem resposta
+# ou falharam por erro temporário
+MAX_BATCH_RETRIES = 3
+
+# Idade máxima (em segundos) do snapshot de objetos antes de ser relido
+SNAPSHOT_MAX_AGE_SECONDS = 300
+
+# Quantidade de ids por requisição ao reler o snapshot
+SNAPSHOT_CHUNK_SIZE = 50
+
+# Campos dos objetos necessários para calcular as ações
+SNAPSHOT_FIELDS = ['id', 'name', 'status', 'daily_budget', 'lifetime_budget']
+
+# Campos lidos de cada tipo de objeto (anúncios não têm orçamento)
+LEVEL_SNAPSHOT_FIELDS = {
+    'campaign': SNAPSHOT_FIELDS,
+    'adset': SNAPSHOT_FIELDS,
+    'ad': ['id', 'name', 'status'],
+}
+
+# Classes da SDK usadas para cada tipo de objeto alvo das regras
+OBJECT_CLASSES = {
+    'campaign': Campaign,
+    'adset': AdSet,
+    'ad': Ad,
+}
+
+# Leitura em bloco de cada tipo de objeto: (método da AdAccount, campo do filtro por id)
+LEVEL_READERS = {
+    'campaign': ('get_campaigns', 'campaign.id'),
+    'adset': ('get_ad_sets', 'adset.id'),
+    'ad': ('get_ads', 'ad.id'),
+}
+
+# Nomes de cada tipo de objeto nas mensagens
+LEVEL_LABELS = {
+    'campaign': 'Campanha',
+    'adset': 'Conjunto de anúncios',
+    'ad': 'Anúncio',
+}
+
+# Mensagem da ação de pausa para cada tipo de objeto
+PAUSE_MESSAGES = {
+    'campaign': "Campanha pausada",
+    'adset': "Conjunto de anúncios pausado",
+    'ad': "Anúncio pausado",
+}
+
+# Textos das ações de orçamento: (particípio usado na mensagem, verbo usado no erro)
+BUDGET_ACTION_TEXTS = {
+    'duplicate_budget': ('duplicado', 'duplicar'),
+    'triple_budget': ('triplicado', 'triplicar'),
+    'halve_budget': ('reduzido pela metade', 'reduzir'),
+    'custom_budget_multiplier': ('multiplicado por {value}', 'multiplicar'),
+}
+
+# Função para montar a entrada do snapshot de um objeto já obtido da API
+def snapshot_entry(ad_object, fetched_at=None):
+    if hasattr(ad_object, 'export_all_data'):
+        ad_object = ad_object.export_all_data()
+    entry = {field: ad_object.get(field) for field in SNAPSHOT_FIELDS}
+    entry['fetched_at'] = fetched_at or time.time()
+    return entry
+
+# Função para montar o snapshot (id -> estado) a partir de uma listagem de objetos
+# (campanhas, conjuntos ou anúncios). Para listagens do catálogo local, fetched_at
+# deve ser o horário da sincronização (catalog_synced_at), não o da leitura
+def build_campaign_snapshot(ad_objects, fetched_at=None):
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    snapshot = {}
+    for ad_object in ad_objects:
+        entry = snapshot_entry(ad_object, fetched_at)
+        snapshot[entry['id']] = entry
+    return snapshot
+
+# Função para reler em bloco os objetos de um nível ausentes ou antigos do snapshot
+# Sem max_age, apenas os objetos ausentes são buscados
+def refresh_snapshot(snapshot, account_id, object_ids, max_age=None, api=None, level='campaign'):
+    now = time.time()
+    stale_ids = [
+        object_id for object_id in object_ids
+        if object_id not in snapshot
+        or (max_age is not None and now - snapshot[object_id]['fetched_at'] > max_age)
+    ]
+    if not stale_ids:
+        return snapshot
+
+    account = AdAccount(f'act_{account_id}', api=api)
+    reader, filter_field = LEVEL_READERS[level]
+    for start in range(0, len(stale_ids), SNAPSHOT_CHUNK_SIZE):
+        chunk = stale_ids[start:start + SNAPSHOT_CHUNK_SIZE]
+        ad_objects = getattr(account, reader)(
+            fields=LEVEL_SNAPSHOT_FIELDS[level],
+            params={'filtering': [{'field': filter_field, 'operator': 'IN', 'value': chunk}]}
+        )
+        snapshot.update(build_campaign_snapshot(ad_objects))
+
+    return snapshot
+
+# Função para calcular o novo orçamento de acordo com o tipo de ação
+def _new_budget(action_type, budget, action_value):
+    if action_type == 'duplicate_budget':
+        return budget * 2
+    if action_type == 'triple_budget':
+        return budget * 3
+    if action_type == 'halve_budget':
+        return budget // 2
+    return int(budget * action_value)
+
+# Função para planejar a ação de uma regra sobre um objeto
+# O estado do objeto (status e orçamentos) é atualizado com o resultado planejado,
+# para que a próxima regra que atingir o mesmo objeto parta do valor já alterado
+def plan_action(rule, object_id, object_name, state, object_type='campaign'):
+    action = {
+        'rule': rule,
+        'object_id': object_id,
+        'object_type': object_type,
+        'object_name': object_name,
+        'params': None,
+        'message': '',
+        'success': False,
+    }
+    action_type = rule.get('action_type')
+
+    if action_type == 'pause_campaign':
+        action['params'] = {'status': 'PAUSED'}
+        action['message'] = PAUSE_MESSAGES[object_type]
+    elif action_type in BUDGET_ACTION_TEXTS:
+        participle, verb = BUDGET_ACTION_TEXTS[action_type]
+        action_value = rule.get('action_value')
+
+        if action_type == 'custom_budget_multiplier' and not action_value:
+            action['message'] = "Multiplicador de orçamento não definido"
+            return action
+
+        for field, label in (('daily_budget', 'diário'), ('lifetime_budget', 'total')):
+            if state.get(field):
+                old_budget = int(state[field])
+                new_budget = _new_budget(action_type, old_budget, action_value)
+                action['params'] = {field: new_budget}
+                action['message'] = (
+                    f"Orçamento {label} {participle.format(value=action_value)} "
+                    f"de {old_budget} para {new_budget}"
+                )
+                break
+        else:
+            action['message'] = f"Nenhum orçamento encontrado para {verb}"
+            return action
+    else:
+        action['message'] = f"Tipo de ação desconhecido: {action_type}"
+        return action
+
+    state.update(action['params'])
+    return action
+
+# Callback de sucesso de uma requisição do lote
+def _on_success(entry, response):
+    for action in entry['actions']:
+        action['success'] = True
+    entry['done'] = True
+
+# Callback de falha de uma requisição do lote
+# Falhas temporárias deixam a requisição pendente para a próxima tentativa
+def _on_failure(entry, response):
+    error = response.error()
+    message = error.api_error_message() or str(error)
+    entry['error'] = f"Erro ao atualizar objeto {entry['object_id']}: {message}"
+    if not is_retryable_error(error):
+        _fail_entry(entry, entry['error'])
+
+# Função para marcar todas as ações de uma requisição como falhas
+def _fail_entry(entry, message):
+    for action in entry['actions']:
+        action['success'] = False
+        action['message'] = message
+    entry['done'] = True
+
+# Função para enviar um lote de até BATCH_SIZE atualizações
+# Requisições sem resposta ou com falha temporária são reenviadas em um novo lote,
+# com espera exponencial, até MAX_BATCH_RETRIES vezes
+def _execute_chunk(api, entries, sleep=time.sleep):
+    pending = entries
+    for attempt in range(MAX_BATCH_RETRIES):
+        if attempt:
+            sleep(backoff_delay(attempt - 1))
+
+        batch = api.new_batch()
+        for entry in pending:
+            ad_object = OBJECT_CLASSES[entry['object_type']](entry['object_id'], api=api)
+            ad_object.api_update(
+                params=entry['params'],
+                batch=batch,
+                success=partial(_on_success, entry),
+                failure=partial(_on_failure, entry),
+            )
+
+        # Falhas do lote inteiro já foram repetidas pela API (ver graph_throttle)
+        try:
+            batch.execute()
+        except Exception as e:
+            for entry in pending:
+                _fail_entry(entry, f"Erro ao enviar lote de atualizações: {str(e)}")
+            return
+
+        pending = [entry for entry in pending if not entry['done']]
+        if not pending:
+            return
+
+    for entry in pending:
+        _fail_entry(entry, entry.get('error') or "Sem resposta da API para a atualização")
+
+# Função para executar as ações planejadas usando requisições em lote da Graph API
+# Ações sobre o mesmo objeto são combinadas em uma única atualização
+def execute_actions(actions, api=None, batch_size=BATCH_SIZE, sleep=time.sleep):
+    api = api or FacebookAdsApi.get_default_api()
+
+    entries = {}
+    for action in actions:
+        if not action['params']:
+            continue
+        key = (action['object_type'], action['object_id'])
+        entry = entries.setdefault(key, {
+            'object_type': action['object_type'],
+            'object_id': action['object_id'],
+            'params': {},
+            'actions': [],
+            'done': False,
+        })
+        entry['params'].update(action['params'])
+        entry['actions'].append(action)
+
+    entries = list(entries.values())
+    for start in range(0, len(entries), batch_size):
+        _execute_chunk(api, entries[start:start + batch_size], sleep)
+
+    return actions
@@ -0,0 +1,191 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection
+from insights_store import TIME_RANGE_DAYS, sync_insights_daily
+from rule_engine import RULE_LEVELS, compile_rule, rule_level
+
+# Simulação das regras sobre o histórico diário (insights_daily), sem alterar nada
+# na Graph API. Cada dia as regras são verificadas uma vez sobre a janela do
+# período escolhido (ex.: últimos 7 dias até o dia) e o efeito da ação vale a
+# partir do dia seguinte. O gasto simulado supõe gasto proporcional ao orçamento
+# e CPA constante; as métricas vistas pelas regras são as do histórico real
+
+# Dias simulados por padrão
+BACKTEST_DAYS = 30
+
+# Níveis cujos objetos têm orçamento (nos anúncios as ações de orçamento não têm efeito)
+BUDGET_LEVELS = {'campaign', 'adset'}
+
+# Multiplicador do orçamento de cada ação com valor fixo
+BUDGET_MULTIPLIERS = {
+    'duplicate_budget': 2.0,
+    'triple_budget': 3.0,
+    'halve_budget': 0.5,
+}
+
+# Colunas lidas do histórico diário
+BACKTEST_COLUMNS = ['campaign_id', 'adset_id', 'ad_id', 'date', 'spend', 'purchases']
+
+# Colunas do resumo por regra
+RULE_REPORT_COLUMNS = [
+    'rule_id', 'rule_name', 'level', 'action_type', 'fires', 'objects', 'first_date', 'last_date'
+]
+
+# Colunas do resumo por dia
+DAILY_REPORT_COLUMNS = ['date', 'spend', 'simulated_spend', 'purchases', 'simulated_purchases']
+
+# Função para obter o fator aplicado ao orçamento de um objeto pela ação de uma regra
+# (pausar zera o orçamento; ações desconhecidas ou sem valor não têm efeito)
+def action_multiplier(rule, level):
+    action_type = rule.get('action_type')
+    if action_type == 'pause_campaign':
+        return 0.0
+    if level not in BUDGET_LEVELS:
+        return 1.0
+    if action_type == 'custom_budget_multiplier':
+        return float(rule.get('action_value') or 1.0)
+    return BUDGET_MULTIPLIERS.get(action_type, 1.0)
+
+# Função para carregar as linhas diárias de anúncios de um intervalo
+def load_daily_frame(account_id, since, until):
+    c = get_connection().cursor()
+    c.execute(f'''
+        SELECT {", ".join(BACKTEST_COLUMNS)} FROM insights_daily
+        WHERE account_id = ? AND date BETWEEN ? AND ?
+    ''', (str(account_id), since.isoformat(), until.isoformat()))
+    return pd.DataFrame(c.fetchall(), columns=BACKTEST_COLUMNS)
+
+# Função para somar, em uma janela móvel de window dias, uma matriz objetos x dias
+def _rolling_sum(values, window):
+    totals = np.cumsum(values, axis=1)
+    totals[:, window:] -= totals[:, :-window].copy()
+    return totals
+
+# Função para simular as regras sobre linhas diárias de anúncios (BACKTEST_COLUMNS)
+# de since - (lookback - 1) até until. Todos os objetos e dias são avaliados de uma
+# vez em matrizes objetos x dias; apenas a propagação do efeito segue dia a dia
+# (produto acumulado). Retorna {'rules', 'daily', 'totals'}
+def simulate_rules(frame, rules, since, until, lookback=7, include_inactive=True):
+    dates = pd.date_range(since - timedelta(days=lookback - 1), until).strftime('%Y-%m-%d')
+    n_days = len(dates)
+    first_day = lookback - 1
+    compiled = [
+        compile_rule(rule) for rule in rules
+        if include_inactive or rule.get('is_active', 1)
+    ]
+
+    frame = frame[frame['date'].isin(dates)]
+    date_positions = dates.get_indexer(frame['date'])
+    spend = frame['spend'].to_numpy(dtype='float64')
+    purchases = frame['purchases'].to_numpy(dtype='float64')
+
+    # Códigos de cada nível por linha e, por anúncio, o objeto de cada nível
+    ad_codes, ad_ids = pd.factorize(frame['ad_id'].astype(str))
+    codes, sizes, ad_to_level = {}, {}, {}
+    for level in RULE_LEVELS:
+        codes[level], level_ids = pd.factorize(frame[f'{level}_id'].astype(str))
+        sizes[level] = len(level_ids)
+        ad_to_level[level] = np.zeros(len(ad_ids), dtype=np.intp)
+        ad_to_level[level][ad_codes] = codes[level]
+
+    # Matriz objetos x dias de uma coluna, somando as linhas de cada objeto e dia
+    def dense(level, values):
+        size = sizes[level]
+        flat = np.bincount(codes[level] * n_days + date_positions, weights=values, minlength=size * n_days)
+        return flat.reshape(size, n_days)
+
+    factors = {}
+    rule_reports = []
+    for level in RULE_LEVELS:
+        level_rules = [rule for rule in compiled if rule_level(rule.rule) == level]
+        if not level_rules:
+            continue
+
+        shape = (sizes[level], n_days)
+        window_spend = _rolling_sum(dense(level, spend), lookback)
+        window_purchases = _rolling_sum(dense(level, purchases), lookback)
+        present = _rolling_sum(dense(level, np.ones(len(frame))), lookback) > 0
+        metrics = {
+            'purchases': window_purchases,
+            'cpa': np.divide(window_spend, window_purchases, out=np.zeros(shape), where=window_purchases > 0),
+        }
+
+        # Objetos pausados por uma regra de nível acima não são mais verificados
+        upstream = np.ones(shape)
+        for upper_level, upper_factor in factors.items():
+            level_to_upper = np.zeros(sizes[level], dtype=np.intp)
+            level_to_upper[ad_to_level[level]] = ad_to_level[upper_level]
+            upstream *= upper_factor[level_to_upper]
+        eligible = present & (upstream > 0)
+        eligible[:, :first_day] = False
+
+        # Fator do dia (produto das ações do dia) e fator acumulado a partir do dia seguinte
+        step = np.ones(shape)
+        masks = []
+        for rule in level_rules:
+            mask = np.broadcast_to(rule(metrics, shape), shape) & eligible
+            step = np.where(mask, step * action_multiplier(rule.rule, level), step)
+            masks.append(mask)
+        factor = np.ones(shape)
+        factor[:, 1:] = np.cumprod(step, axis=1)[:, :-1]
+        factors[level] = factor
+
+        for rule, mask in zip(level_rules, masks):
+            fired = mask & (factor > 0)
+            fire_days = np.flatnonzero(fired.any(axis=0))
+            rule_reports.append({
+                'rule_id': rule.id,
+                'rule_name': rule.rule.get('name'),
+                'level': level,
+                'action_type': rule.rule.get('action_type'),
+                'fires': int(fired.sum()),
+                'objects': int(fired.any(axis=1).sum()),
+                'first_date': dates[fire_days[0]] if len(fire_days) else None,
+                'last_date': dates[fire_days[-1]] if len(fire_days) else None,
+            })
+
+    # Efeito combinado dos níveis em cada anúncio
+    ad_factor = np.ones((len(ad_ids), n_days))
+    for level, factor in factors.items():
+        ad_factor *= factor[ad_to_level[level]]
+    ad_spend = dense('ad', spend)
+    ad_purchases = dense('ad', purchases)
+
+    daily = pd.DataFrame({
+        'date': dates[first_day:],
+        'spend': ad_spend.sum(axis=0)[first_day:],
+        'simulated_spend': (ad_spend * ad_factor).sum(axis=0)[first_day:],
+        'purchases': ad_purchases.sum(axis=0)[first_day:],
+        'simulated_purchases': (ad_purchases * ad_factor).sum(axis=0)[first_day:],
+    }, columns=DAILY_REPORT_COLUMNS)
+
+    totals = {column: float(daily[column].sum()) for column in DAILY_REPORT_COLUMNS[1:]}
+    totals['cpa'] = totals['spend'] / totals['purchases'] if totals['purchases'] else 0.0
+    totals['simulated_cpa'] = (
+        totals['simulated_spend'] / totals['simulated_purchases'] if totals['simulated_purchases'] else 0.0
+    )
+    totals['days'] = len(daily)
+    totals['objects'] = {level: sizes[level] for level in RULE_LEVELS}
+
+    return {
+        'rules': pd.DataFrame(rule_reports, columns=RULE_REPORT_COLUMNS),
+        'daily': daily,
+        'totals': totals,
+    }
+
+# Função para simular as regras de uma conta nos últimos days dias (até ontem),
+# com a janela de time_range usada pelas regras. Com sync=True o histórico que
+# falta para o período é baixado antes (ver sync_insights_daily)
+def backtest_rules(account_id, rules, days=BACKTEST_DAYS, time_range='last_7d',
+                   include_inactive=True, sync=False, api=None):
+    lookback = TIME_RANGE_DAYS[time_range]
+    until = date.today() - timedelta(days=1)
+    since = until - timedelta(days=days - 1)
+    if sync:
+        sync_insights_daily(account_id, days=days + lookback - 1, api=api)
+
+    frame = load_daily_frame(account_id, since - timedelta(days=lookback - 1), until)
+    return simulate_rules(frame, rules, since, until, lookback, include_inactive)
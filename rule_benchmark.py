@@ -0,0 +1,396 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import database
+from database import ExecutionLogger, add_rule, close_connection, get_all_rules, init_db
+from fake_graph import FakeAccountServer, fake_api
+from insights_store import fetch_daily_insights, get_local_insights, sync_insights_daily
+from rule_actions import build_campaign_snapshot, execute_actions, plan_action
+from rule_engine import (
+    OPERATORS, RULE_LEVELS, RULE_METRICS, build_insights_frame, matches_from_matrix,
+    rollup_insights, rule_level, rule_matrix
+)
+from rule_runner import apply_rules
+from rule_trace import RuleTrace
+
+# Medição de desempenho do fluxo das regras com uma conta sintética: a Graph API é
+# substituída pelo servidor falso (fake_graph) e o banco por um SQLite temporário.
+# Uso: python rule_benchmark.py --campaigns 500 --days 30 --repeat 5
+
+# Tamanho padrão da conta sintética
+DEFAULT_ACCOUNT_SIZE = {
+    'campaigns': 100,
+    'adsets_per_campaign': 3,
+    'ads_per_adset': 3,
+    'days': 7,
+    'actions_per_row': 5,
+    'rules': 10,
+}
+
+# Execuções medidas de cada etapa (além de uma execução de aquecimento)
+DEFAULT_REPEAT = 3
+
+# Arquivo com o histórico das medições (uma linha JSON por execução)
+BENCHMARK_HISTORY_PATH = os.path.join('data', 'benchmark_history.jsonl')
+
+# Tipos de ação incluídos nas listas actions dos insights, além de purchase
+NOISE_ACTION_TYPES = [
+    'link_click', 'landing_page_view', 'view_content', 'add_to_cart', 'initiate_checkout',
+    'post_engagement', 'page_engagement', 'video_view', 'lead', 'omni_purchase',
+    'add_payment_info', 'complete_registration',
+]
+
+# Ações sorteadas para as regras sintéticas
+BENCHMARK_ACTION_TYPES = ['pause_campaign', 'duplicate_budget', 'halve_budget', 'custom_budget_multiplier']
+
+# Conta usada nas medições
+BENCHMARK_ACCOUNT_ID = '1000'
+
+# Função para gerar uma conta sintética: campanhas, conjuntos e anúncios no formato
+# da Graph API, regras (argumentos de add_rule) e um gerador das linhas diárias de
+# insights por anúncio para o servidor falso
+def generate_account(campaigns=100, adsets_per_campaign=3, ads_per_adset=3, days=7,
+                     actions_per_row=5, rules=10, seed=0):
+    rng = np.random.default_rng(seed)
+    updated_time = '2026-01-01T00:00:00+0000'
+
+    campaign_objects, adset_objects, ad_objects = [], [], []
+    for campaign_index in range(campaigns):
+        campaign_id = str(100000 + campaign_index)
+        campaign_objects.append({
+            'id': campaign_id, 'name': f"Campanha {campaign_index}", 'status': 'ACTIVE',
+            'effective_status': 'ACTIVE', 'objective': 'OUTCOME_SALES',
+            'daily_budget': str(int(rng.integers(1000, 100000))), 'updated_time': updated_time,
+        })
+        for adset_index in range(adsets_per_campaign):
+            adset_id = f"{campaign_id}{adset_index:03d}"
+            adset = {
+                'id': adset_id, 'name': f"Conjunto {campaign_index}.{adset_index}", 'status': 'ACTIVE',
+                'effective_status': 'ACTIVE', 'campaign_id': campaign_id, 'updated_time': updated_time,
+            }
+            # Metade dos conjuntos usa o orçamento da campanha
+            if rng.random() < 0.5:
+                adset['daily_budget'] = str(int(rng.integers(500, 50000)))
+            adset_objects.append(adset)
+            for ad_index in range(ads_per_adset):
+                ad_objects.append({
+                    'id': f"{adset_id}{ad_index:03d}", 'name': f"Anúncio {campaign_index}.{adset_index}.{ad_index}",
+                    'status': 'ACTIVE', 'effective_status': 'ACTIVE', 'campaign_id': campaign_id,
+                    'adset_id': adset_id, 'updated_time': updated_time,
+                })
+
+    rule_specs = []
+    for rule_index in range(rules):
+        metric = RULE_METRICS[rule_index % len(RULE_METRICS)]
+        level = RULE_LEVELS[rule_index % len(RULE_LEVELS)]
+        # Anúncios não têm orçamento; as regras de anúncios apenas pausam
+        action_type = (
+            'pause_campaign' if level == 'ad'
+            else BENCHMARK_ACTION_TYPES[rule_index % len(BENCHMARK_ACTION_TYPES)]
+        )
+        rule_specs.append({
+            'name': f"Regra {rule_index}", 'description': "Regra sintética", 'condition_type': 'custom',
+            'primary_metric': metric, 'primary_operator': list(OPERATORS)[rule_index % len(OPERATORS)],
+            'primary_value': float(rng.integers(1, 60)) if metric == 'cpa' else float(rng.integers(0, 5)),
+            'action_type': action_type,
+            'action_value': 1.2 if action_type == 'custom_budget_multiplier' else None,
+            'is_composite': rule_index % 3 == 0, 'secondary_metric': 'purchases',
+            'secondary_operator': '>=', 'secondary_value': 1.0, 'join_operator': 'AND',
+            'target_level': level,
+        })
+
+    names = {obj['id']: obj['name'] for obj in campaign_objects + adset_objects}
+    noise_types = NOISE_ACTION_TYPES[:max(actions_per_row - 1, 0)]
+    rows_by_date = {}
+
+    # Linhas de um dia para todos os anúncios, sorteadas uma vez por data
+    def rows_for_date(day):
+        if day not in rows_by_date:
+            day_rng = np.random.default_rng([seed, day.toordinal()])
+            size = len(ad_objects)
+            spend = day_rng.gamma(2.0, 15.0, size)
+            impressions = day_rng.integers(100, 20000, size)
+            clicks = day_rng.binomial(impressions, 0.01)
+            purchases = day_rng.poisson(0.6, size)
+            noise = day_rng.integers(1, 500, (size, len(noise_types)))
+            rows = []
+            for position, ad in enumerate(ad_objects):
+                actions = [{'action_type': action_type, 'value': str(noise[position, index])}
+                           for index, action_type in enumerate(noise_types)]
+                row = {
+                    'campaign_id': ad['campaign_id'], 'campaign_name': names[ad['campaign_id']],
+                    'adset_id': ad['adset_id'], 'adset_name': names[ad['adset_id']],
+                    'ad_id': ad['id'], 'ad_name': ad['name'], 'date_start': day.isoformat(),
+                    'date_stop': day.isoformat(), 'spend': f"{spend[position]:.2f}",
+                    'impressions': str(impressions[position]), 'clicks': str(clicks[position]),
+                }
+                if purchases[position]:
+                    actions.append({'action_type': 'purchase', 'value': str(purchases[position])})
+                    row['cost_per_action_type'] = [
+                        {'action_type': 'purchase', 'value': f"{spend[position] / purchases[position]:.2f}"}
+                    ]
+                if actions:
+                    row['actions'] = actions
+                rows.append(row)
+            rows_by_date[day] = rows
+        return rows_by_date[day]
+
+    # Linhas do relatório pedido (período e, na leitura em blocos, campanhas do bloco)
+    def rows_for(params):
+        time_range = params['time_range']
+        day = date.fromisoformat(time_range['since'])
+        until = date.fromisoformat(time_range['until'])
+        campaign_ids = None
+        for condition in params.get('filtering') or []:
+            if condition['field'] == 'campaign.id':
+                campaign_ids = set(condition['value'])
+        while day <= until:
+            for row in rows_for_date(day):
+                if campaign_ids is None or row['campaign_id'] in campaign_ids:
+                    yield row
+            day += timedelta(days=1)
+
+    return {
+        'objects': {'campaigns': campaign_objects, 'adsets': adset_objects, 'ads': ad_objects},
+        'rules': rule_specs,
+        'rows_for': rows_for,
+        'days': days,
+    }
+
+# Etapa: leitura e conversão dos insights diários (Graph API falsa, sem banco)
+def _stage_insights_parsing(context):
+    insights = fetch_daily_insights(
+        BENCHMARK_ACCOUNT_ID, context['since'], context['until'], api=context['api'],
+        mode='sync', strategy='account'
+    )
+    return sum(1 for _ in insights)
+
+# Etapa: sincronização completa do período para insights_daily (leitura + gravação)
+def _stage_insights_sync(context):
+    days = context['account']['days']
+    return sync_insights_daily(BENCHMARK_ACCOUNT_ID, days=days, refetch_days=days, force=True,
+                               api=context['api'], mode='sync')
+
+# Etapa: insights do período calculados a partir de insights_daily, em DataFrame tipado
+def _stage_local_insights(context):
+    context['insights'] = get_local_insights(BENCHMARK_ACCOUNT_ID, 'ad', time_range=context['time_range'])
+    context['frame'] = build_insights_frame(context['insights'], 'ad')
+    return len(context['insights'])
+
+# Etapa: avaliação das regras em todos os níveis (itens = objetos x regras)
+def _stage_rule_evaluation(context):
+    frame = context['frame']
+    matches = []
+    evaluated = 0
+    for level in RULE_LEVELS:
+        level_rules = [rule for rule in context['rules'] if rule_level(rule) == level]
+        if not level_rules:
+            continue
+        level_frame = frame if level == 'ad' else rollup_insights(frame, level)
+        active_rules, matrix = rule_matrix(level_frame, level_rules)
+        evaluated += len(level_frame) * len(active_rules)
+        matches.extend((level, row, rule) for row, rule in matches_from_matrix(level_frame, active_rules, matrix))
+    context['matches'] = matches
+    return evaluated
+
+# Etapa: planejamento das ações e envio em lotes (itens = ações)
+def _stage_action_dispatch(context):
+    objects = context['account']['objects']
+    snapshots = {
+        'campaign': build_campaign_snapshot(objects['campaigns']),
+        'adset': build_campaign_snapshot(objects['adsets']),
+        'ad': build_campaign_snapshot(objects['ads']),
+    }
+    actions = [
+        plan_action(rule, row[f'{level}_id'], row[f'{level}_name'],
+                    snapshots[level].setdefault(row[f'{level}_id'], {}), level)
+        for level, row, rule in context['matches']
+    ]
+    context['actions'] = execute_actions(actions, api=context['api'], sleep=lambda seconds: None)
+    return len(actions)
+
+# Etapa: gravação do histórico de execuções (itens = linhas gravadas)
+def _stage_execution_logging(context):
+    with ExecutionLogger() as execution_logger:
+        for action in context['actions']:
+            execution_logger.log(
+                action['rule']['id'], action['object_id'], action['object_type'],
+                action['object_name'], action['success'], action['message']
+            )
+    return execution_logger.total_written
+
+# Etapa: execução completa das regras (apply_rules), como no agendador
+def _stage_apply_rules(context):
+    campaign_snapshot = build_campaign_snapshot(context['account']['objects']['campaigns'])
+    apply_rules(context['insights'], context['rules'], BENCHMARK_ACCOUNT_ID, campaign_snapshot,
+                snapshot_max_age=None, api=context['api'], trace=RuleTrace('quiet'),
+                insights_level='ad')
+    return len(context['insights'])
+
+# Etapas medidas, na ordem em que rodam (cada uma usa o resultado das anteriores)
+BENCHMARK_STAGES = {
+    'insights_parsing': _stage_insights_parsing,
+    'insights_sync': _stage_insights_sync,
+    'local_insights': _stage_local_insights,
+    'rule_evaluation': _stage_rule_evaluation,
+    'action_dispatch': _stage_action_dispatch,
+    'execution_logging': _stage_execution_logging,
+    'apply_rules': _stage_apply_rules,
+}
+
+# Função para medir uma etapa: latência de cada execução (sem tracemalloc) e pico de
+# memória em uma execução separada, já que o tracemalloc deixa o código mais lento
+def measure_stage(stage, context, repeat=DEFAULT_REPEAT):
+    items = stage(context)
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = stage(context)
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        stage(context)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    median = float(np.percentile(latencies, 50))
+    return {
+        'items': int(items or 0),
+        'runs': repeat,
+        'p50_ms': median * 1000,
+        'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'items_per_second': (items or 0) / median if median else 0.0,
+        'peak_memory_mb': peak_bytes / 2 ** 20,
+    }
+
+# Função para executar as etapas sobre uma conta sintética em um banco temporário
+# Retorna {etapa: estatísticas}
+def run_benchmark(size=None, repeat=DEFAULT_REPEAT, stages=None, seed=0, time_range='last_7d'):
+    size = dict(DEFAULT_ACCOUNT_SIZE, **(size or {}))
+    account = generate_account(seed=seed, **size)
+    server = FakeAccountServer(account['rows_for'], account['objects'], page_size=500)
+
+    db_dir, db_path = database.DB_DIR, database.DB_PATH
+    with tempfile.TemporaryDirectory() as temp_dir:
+        close_connection()
+        database.DB_DIR, database.DB_PATH = temp_dir, os.path.join(temp_dir, 'benchmark.db')
+        try:
+            init_db()
+            for spec in account['rules']:
+                add_rule(**spec)
+
+            until = date.today() - timedelta(days=1)
+            context = {
+                'account': account,
+                'api': fake_api(server),
+                'rules': get_all_rules(),
+                'since': until - timedelta(days=size['days'] - 1),
+                'until': until,
+                'time_range': time_range,
+            }
+            # Etapas não pedidas rodam uma vez, sem medição, quando uma etapa seguinte depende delas
+            names = list(BENCHMARK_STAGES)
+            last = max(names.index(name) for name in stages) if stages else len(names) - 1
+            results = {}
+            for name in names[:last + 1]:
+                if stages and name not in stages:
+                    BENCHMARK_STAGES[name](context)
+                else:
+                    results[name] = measure_stage(BENCHMARK_STAGES[name], context, repeat)
+        finally:
+            close_connection()
+            database.DB_DIR, database.DB_PATH = db_dir, db_path
+    return results
+
+# Função para obter o commit atual (para o histórico), se houver um repositório git
+def _current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Função para ler o histórico de medições
+def load_history(path=BENCHMARK_HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+# Função para acrescentar uma medição ao histórico
+def append_history(entry, path=BENCHMARK_HISTORY_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as history_file:
+        history_file.write(json.dumps(entry) + "\n")
+
+# Função para montar o relatório em texto, com a variação do p50 em relação à
+# última medição do mesmo tamanho de conta
+def format_report(results, previous=None):
+    previous_stages = (previous or {}).get('stages', {})
+    lines = [
+        f"{'etapa':<18} {'itens':>9} {'itens/s':>12} {'p50 ms':>10} {'p95 ms':>10} "
+        f"{'max ms':>10} {'pico MB':>9} {'vs. anterior':>13}"
+    ]
+    for name, stats in results.items():
+        change = ''
+        before = previous_stages.get(name)
+        if before and before.get('p50_ms'):
+            change = f"{(stats['p50_ms'] / before['p50_ms'] - 1) * 100:+.1f}%"
+        lines.append(
+            f"{name:<18} {stats['items']:>9} {stats['items_per_second']:>12.0f} {stats['p50_ms']:>10.1f} "
+            f"{stats['p95_ms']:>10.1f} {stats['max_ms']:>10.1f} {stats['peak_memory_mb']:>9.1f} {change:>13}"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Medição de desempenho do fluxo das regras com uma conta sintética")
+    parser.add_argument('--campaigns', type=int, default=DEFAULT_ACCOUNT_SIZE['campaigns'])
+    parser.add_argument('--adsets', type=int, default=DEFAULT_ACCOUNT_SIZE['adsets_per_campaign'],
+                        help="conjuntos por campanha")
+    parser.add_argument('--ads', type=int, default=DEFAULT_ACCOUNT_SIZE['ads_per_adset'],
+                        help="anúncios por conjunto")
+    parser.add_argument('--days', type=int, default=DEFAULT_ACCOUNT_SIZE['days'])
+    parser.add_argument('--actions', type=int, default=DEFAULT_ACCOUNT_SIZE['actions_per_row'],
+                        help="tipos de ação na lista actions de cada linha de insights")
+    parser.add_argument('--rules', type=int, default=DEFAULT_ACCOUNT_SIZE['rules'])
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stage', dest='stages', action='append', choices=list(BENCHMARK_STAGES),
+                        help="medir apenas esta etapa (pode repetir)")
+    parser.add_argument('--history', default=BENCHMARK_HISTORY_PATH)
+    parser.add_argument('--no-history', action='store_true', help="não gravar no histórico")
+    args = parser.parse_args()
+
+    size = {
+        'campaigns': args.campaigns, 'adsets_per_campaign': args.adsets, 'ads_per_adset': args.ads,
+        'days': args.days, 'actions_per_row': args.actions, 'rules': args.rules,
+    }
+    results = run_benchmark(size, args.repeat, args.stages, args.seed)
+
+    history = load_history(args.history)
+    previous = next((entry for entry in reversed(history) if entry.get('size') == size), None)
+    print(format_report(results, previous))
+
+    if not args.no_history:
+        append_history({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': _current_commit(),
+            'size': size,
+            'repeat': args.repeat,
+            'stages': results,
+        }, args.history)
+
+if __name__ == "__main__":
+    main()
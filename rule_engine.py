@@ -0,0 +1,186 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from insights_store import LEVEL_COLUMNS
+
+# Métricas que podem ser usadas nas condições das regras
+RULE_METRICS = ['cpa', 'purchases']
+
+# Operadores de comparação suportados pelas regras
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+}
+
+# Colunas numéricas dos insights e seus tipos no DataFrame
+INSIGHT_COLUMNS = {
+    'spend': 'float64',
+    'impressions': 'int64',
+    'clicks': 'int64',
+    'ctr': 'float64',
+    'cpc': 'float64',
+    'purchases': 'int64',
+    'cpa': 'float64',
+}
+
+# Níveis de objeto que podem ser alvo das regras, do mais alto ao mais baixo
+RULE_LEVELS = ['campaign', 'adset', 'ad']
+
+# Métricas somadas ao agrupar os insights em um nível acima
+ADDITIVE_COLUMNS = ['spend', 'impressions', 'clicks', 'purchases']
+
+# Função para carregar os insights de um nível em um DataFrame tipado
+def build_insights_frame(insights, level='campaign'):
+    frame = pd.DataFrame(list(insights), columns=LEVEL_COLUMNS[level] + list(INSIGHT_COLUMNS))
+    for column in LEVEL_COLUMNS[level]:
+        if column.endswith('_id'):
+            frame[column] = frame[column].astype(str)
+        else:
+            frame[column] = frame[column].fillna('')
+
+    # A API retorna números como texto; valores ausentes viram 0
+    for column, dtype in INSIGHT_COLUMNS.items():
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0).astype(dtype)
+
+    return frame
+
+# Função para somar um DataFrame de insights de um nível mais baixo (ex.: anúncios)
+# em um nível acima (conjuntos ou campanhas); as métricas derivadas são recalculadas
+def rollup_insights(frame, level):
+    columns = LEVEL_COLUMNS[level]
+    id_columns = [column for column in columns if column.endswith('_id')]
+    aggregations = {column: 'first' for column in columns if column not in id_columns}
+    aggregations.update({column: 'sum' for column in ADDITIVE_COLUMNS})
+
+    rolled = frame.groupby(id_columns, sort=False, as_index=False).agg(aggregations)
+
+    spend = rolled['spend'].to_numpy(dtype='float64')
+    impressions = rolled['impressions'].to_numpy(dtype='float64')
+    clicks = rolled['clicks'].to_numpy(dtype='float64')
+    purchases = rolled['purchases'].to_numpy(dtype='float64')
+    rolled['ctr'] = np.divide(clicks * 100, impressions, out=np.zeros(len(rolled)), where=impressions > 0)
+    rolled['cpc'] = np.divide(spend, clicks, out=np.zeros(len(rolled)), where=clicks > 0)
+    rolled['cpa'] = np.divide(spend, purchases, out=np.zeros(len(rolled)), where=purchases > 0)
+
+    return rolled[columns + list(INSIGHT_COLUMNS)]
+
+# Função para obter o nível alvo de uma regra (regras antigas atuam em campanhas)
+def rule_level(rule):
+    return rule.get('target_level') or 'campaign'
+
+# Regras compiladas em cache por id, recompiladas apenas quando a versão muda
+_compiled_rules = {}
+_compiled_rules_lock = threading.Lock()
+
+# Regra já interpretada: um único callable que recebe as métricas e devolve a máscara
+class CompiledRule:
+    def __init__(self, rule, predicate):
+        self.rule = rule
+        self.id = rule.get('id')
+        self.version = _rule_version(rule)
+        self.is_active = bool(rule.get('is_active', 1))
+        self._predicate = predicate
+
+    def __call__(self, metrics, size):
+        return self._predicate(metrics, size)
+
+# Função para obter a versão de uma regra (muda a cada atualização no banco)
+def _rule_version(rule):
+    return (rule.get('created_at'), rule.get('updated_at'))
+
+# Função para compilar uma condição em um predicado vetorizado
+def _compile_condition(metric, operator, value):
+    compare = OPERATORS.get(operator)
+    if metric not in RULE_METRICS or compare is None or value is None:
+        return lambda metrics, size: np.zeros(size, dtype=bool)
+
+    threshold = float(value)
+    return lambda metrics, size: compare(metrics[metric], threshold)
+
+# Função para compilar uma regra (formato novo ou antigo) em um predicado
+def compile_rule(rule):
+    # Formato antigo (regras simples)
+    if 'is_composite' not in rule:
+        predicate = _compile_condition(
+            rule.get('condition_metric'), rule.get('condition_operator'), rule.get('condition_value')
+        )
+        return CompiledRule(rule, predicate)
+
+    primary = _compile_condition(
+        rule.get('primary_metric'), rule.get('primary_operator'), rule.get('primary_value')
+    )
+
+    # Se regra não é composta, usa apenas a condição primária
+    if not rule.get('is_composite', 0):
+        return CompiledRule(rule, primary)
+
+    secondary = _compile_condition(
+        rule.get('secondary_metric'), rule.get('secondary_operator'), rule.get('secondary_value')
+    )
+
+    # Combina as condições de acordo com o operador de junção
+    if rule.get('join_operator') == 'AND':
+        predicate = lambda metrics, size: primary(metrics, size) & secondary(metrics, size)
+    elif rule.get('join_operator') == 'OR':
+        predicate = lambda metrics, size: primary(metrics, size) | secondary(metrics, size)
+    else:
+        predicate = primary
+
+    return CompiledRule(rule, predicate)
+
+# Função para compilar as regras usando o cache, recompilando apenas as alteradas
+def compile_rules(rules):
+    compiled = []
+    with _compiled_rules_lock:
+        for rule in rules:
+            cached = _compiled_rules.get(rule.get('id'))
+            if cached is None or cached.version != _rule_version(rule):
+                cached = compile_rule(rule)
+                _compiled_rules[cached.id] = cached
+            compiled.append(cached)
+    return compiled
+
+# Função para remover do cache as regras que foram excluídas; rules deve ser a
+# lista completa do banco (get_all_rules), não as regras de um nível
+def evict_compiled_rules(rules):
+    current_ids = {rule.get('id') for rule in rules}
+    with _compiled_rules_lock:
+        for rule_id in list(_compiled_rules):
+            if rule_id not in current_ids:
+                del _compiled_rules[rule_id]
+
+# Função para calcular a matriz objetos x regras ativas com o resultado de cada condição
+# Retorna (regras ativas compiladas, matriz booleana), ou matriz None sem dados
+def rule_matrix(frame, rules):
+    return compiled_rule_matrix(frame, compile_rules(rules))
+
+# Função para calcular a matriz de rule_matrix a partir de regras já compiladas
+def compiled_rule_matrix(frame, compiled_rules):
+    active_rules = [rule for rule in compiled_rules if rule.is_active]
+    if frame.empty or not active_rules:
+        return active_rules, None
+
+    size = len(frame)
+    metrics = {metric: frame[metric].to_numpy(dtype='float64') for metric in RULE_METRICS}
+    return active_rules, np.column_stack([rule(metrics, size) for rule in active_rules])
+
+# Função para listar os pares (objeto, regra) atendidos em uma matriz de rule_matrix,
+# na mesma ordem do laço antigo (objeto por objeto, regra por regra)
+def matches_from_matrix(frame, active_rules, matrix):
+    if matrix is None:
+        return []
+
+    object_positions, rule_positions = np.nonzero(matrix)
+    if len(object_positions) == 0:
+        return []
+
+    matched_objects = frame.iloc[np.unique(object_positions)].to_dict('index')
+    return [
+        (matched_objects[frame.index[object_pos]], active_rules[rule_pos].rule)
+        for object_pos, rule_pos in zip(object_positions, rule_positions)
+    ]
@@ -0,0 +1,164 @@
+import os
+import socket
+import threading
+from sqlite3 import Error
+
+from database import ExecutionLogger, get_all_rules
+from entity_catalog import catalog_synced_at
+from facebook_api import get_account_insights, get_facebook_api, get_facebook_campaigns
+from graph_cache import graph_cache
+from messages import logger
+from rule_actions import (
+    BATCH_SIZE, LEVEL_LABELS, SNAPSHOT_MAX_AGE_SECONDS, build_campaign_snapshot,
+    execute_actions, plan_action, refresh_snapshot
+)
+from rule_engine import (
+    RULE_LEVELS, build_insights_frame, compile_rules, compiled_rule_matrix, evict_compiled_rules,
+    matches_from_matrix, rollup_insights, rule_level
+)
+from rule_trace import RuleTrace
+
+# Função para obter o nome da trava de execução de regras de uma conta
+def rules_lock_name(account_id):
+    return f"rules:{account_id}"
+
+# Função para identificar quem está executando (processo e thread)
+def lock_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+# Função para avaliar as regras sobre os insights e aplicar as ações na conta
+# Não depende do Streamlit: o progresso e cada decisão vão para o trace (RuleTrace).
+# insights_level é o nível das linhas recebidas; com insights de anúncios ('ad'),
+# as regras de conjuntos e campanhas usam os anúncios somados em cada nível
+def apply_rules(insights, rules, account_id, campaign_snapshot=None,
+                snapshot_max_age=SNAPSHOT_MAX_AGE_SECONDS, api=None, trace=None,
+                insights_level='campaign'):
+    trace = trace or RuleTrace(log=logger.info)
+    summary = {'matches': 0, 'actions': 0, 'successes': 0, 'failures': 0}
+
+    trace.message(f"- Total de regras encontradas: {len(rules)}")
+    trace.message(f"- Total de insights ({LEVEL_LABELS[insights_level].lower()}): {len(insights)}")
+
+    if not rules:
+        trace.message("❌ ERRO: Nenhuma regra encontrada no banco de dados", essential=True)
+        return summary
+
+    if not insights:
+        trace.message("❌ ERRO: Nenhum insight disponível para análise", essential=True)
+        return summary
+
+    # Carregar insights em um DataFrame tipado e avaliar as regras de cada nível de
+    # uma vez, sobre os insights somados localmente até esse nível
+    # As regras são compiladas uma vez (cache de rule_engine) e separadas por nível
+    insights_frame = build_insights_frame(insights, insights_level)
+    compiled_rules = compile_rules(rules)
+    evict_compiled_rules(rules)
+    matches = []
+    for level in RULE_LEVELS:
+        level_rules = [rule for rule in compiled_rules if rule_level(rule.rule) == level]
+        if not level_rules:
+            continue
+        if RULE_LEVELS.index(level) > RULE_LEVELS.index(insights_level):
+            trace.message(f"- {len(level_rules)} regras de {LEVEL_LABELS[level].lower()} ignoradas (insights por {LEVEL_LABELS[insights_level].lower()})")
+            continue
+
+        level_frame = insights_frame if level == insights_level else rollup_insights(insights_frame, level)
+        active_rules, matrix = compiled_rule_matrix(level_frame, level_rules)
+        trace.record_misses(level, level_frame, active_rules, matrix)
+        matches.extend((level, row, rule) for row, rule in matches_from_matrix(level_frame, active_rules, matrix))
+
+    summary['matches'] = len(matches)
+    trace.message(f"- Total de condições atendidas: {len(matches)}")
+
+    # Juntar os insights ao snapshot dos objetos (orçamentos e status), relendo em bloco
+    # apenas os ausentes ou mais antigos que snapshot_max_age. O snapshot de campanhas
+    # pode vir da listagem da página; conjuntos e anúncios são lidos quando atingidos
+    snapshots = {level: {} for level in RULE_LEVELS}
+    if campaign_snapshot is not None:
+        snapshots['campaign'] = campaign_snapshot
+    for level in RULE_LEVELS:
+        matched_ids = list(dict.fromkeys(row[f'{level}_id'] for row_level, row, _ in matches if row_level == level))
+        if not matched_ids:
+            continue
+        try:
+            refresh_snapshot(snapshots[level], account_id, matched_ids, snapshot_max_age, api=api, level=level)
+        except Exception as e:
+            trace.message(f"❌ ERRO ao atualizar dados ({LEVEL_LABELS[level].lower()}): {str(e)}", essential=True)
+
+    # Planejar as ações sobre uma cópia do estado de cada objeto
+    object_states = {}
+    decisions = []
+
+    for level, row, rule in matches:
+        object_id = row[f'{level}_id']
+        if object_id not in snapshots[level]:
+            trace.record(level, row, rule, 'skipped', "Dados do objeto não encontrados")
+            continue
+
+        object_data = object_states.setdefault((level, object_id), dict(snapshots[level][object_id]))
+        action = plan_action(rule, object_id, row[f'{level}_name'], object_data, object_type=level)
+        decisions.append((level, row, rule, action))
+
+    actions = [action for _, _, _, action in decisions]
+
+    # Enviar todas as alterações em lotes e registrar o resultado de cada regra;
+    # as execuções ficam em buffer e são gravadas em uma única transação
+    try:
+        with ExecutionLogger() as execution_logger:
+            if any(action['params'] for action in actions):
+                trace.message(f"Enviando alterações em lotes de até {BATCH_SIZE} requisições...")
+                try:
+                    execute_actions(actions, api=api)
+                except Exception as e:
+                    for action in actions:
+                        if action['params'] and not action['success']:
+                            action['message'] = f"Erro ao aplicar regra: {str(e)}"
+                    trace.message(f"❌ ERRO GERAL: {str(e)}", essential=True)
+
+                # Descartar leituras em cache dos objetos alterados
+                if any(action['success'] for action in actions):
+                    graph_cache.invalidate(account_id)
+
+            for level, row, rule, action in decisions:
+                if not action['params']:
+                    outcome = 'skipped'
+                else:
+                    outcome = 'success' if action['success'] else 'failure'
+                trace.record(level, row, rule, outcome, action['message'])
+                execution_logger.log(
+                    rule_id=action['rule'].get('id'),
+                    ad_object_id=action['object_id'],
+                    ad_object_type=action['object_type'],
+                    ad_object_name=action['object_name'],
+                    was_successful=action['success'],
+                    message=action['message']
+                )
+        trace.message(f"- Execuções registradas no histórico: {execution_logger.total_written}")
+    except Error as e:
+        trace.message(f"❌ ERRO ao registrar execuções no histórico: {e}", essential=True)
+
+    summary['actions'] = len(actions)
+    summary['successes'] = sum(1 for action in actions if action['success'])
+    # Ações sem alteração (ex.: orçamento não encontrado) são ignoradas, não falhas
+    summary['failures'] = sum(1 for action in actions if action['params'] and not action['success'])
+    trace.message(
+        f"Resumo: {summary['matches']} condições atendidas, {summary['successes']} ações aplicadas, "
+        f"{summary['failures']} falhas",
+        essential=True
+    )
+
+    return summary
+
+# Função para executar as regras de uma conta do início ao fim (listagem de
+# campanhas, insights por anúncio, avaliação, ações e histórico), usada pelo agendador
+def run_rules_for_account(config, time_range='last_7d', api=None, trace=None):
+    api = api or get_facebook_api(config)
+    account_id = config['account_id']
+
+    campaigns = get_facebook_campaigns(account_id, api=api)
+    campaign_snapshot = build_campaign_snapshot(campaigns, catalog_synced_at(account_id, 'campaign'))
+    insights = get_account_insights(account_id, 'ad', time_range, api=api)
+    rules = get_all_rules()
+
+    return apply_rules(insights, rules, account_id, campaign_snapshot, api=api, trace=trace,
+                       insights_level='ad')
@@ -0,0 +1,189 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (
+    acquire_run_lock, close_connection, get_all_api_configs, get_rule_schedules, init_db,
+    release_run_lock, update_rule_schedule
+)
+from graph_ledger import graph_caller, graph_ledger
+from messages import capture_errors, logger
+from rule_runner import lock_owner, rules_lock_name, run_rules_for_account
+from rule_trace import VERBOSITY_LEVELS, RuleTrace
+
+# Executor de regras em segundo plano, independente da interface Streamlit.
+# Uso: python rule_scheduler.py [--interval 900] [--once] [--workers 8] [--time-range last_7d]
+#                               [--verbosity quiet|matches|full]
+
+# Intervalo padrão (em segundos) entre execuções das regras de uma conta
+DEFAULT_INTERVAL_SECONDS = 900
+
+# Espera máxima (em segundos) entre duas verificações da agenda
+IDLE_SLEEP_MAX_SECONDS = 60
+
+# Quantidade padrão de contas executadas em paralelo
+DEFAULT_MAX_WORKERS = 8
+
+# Função para executar as regras de uma conta sob a trava da conta
+# Retorna o resultado da conta: situação ('ok', 'error' ou 'skipped' quando outra
+# execução já está em andamento), duração em segundos, resumo e erro
+def run_account(config, owner=None, time_range='last_7d', verbosity='matches'):
+    owner = owner or lock_owner()
+    result = {
+        'config_id': config['id'],
+        'name': config['name'],
+        'account_id': config['account_id'],
+        'status': 'skipped',
+        'seconds': 0.0,
+        'summary': None,
+        'error': None,
+    }
+
+    lock_name = rules_lock_name(config['account_id'])
+    if not acquire_run_lock(lock_name, owner):
+        logger.info("Conta %s já está em execução, pulando", config['name'])
+        return result
+
+    started_at = time.monotonic()
+    # Dentro do try: se a gravação falhar (ex.: banco bloqueado), a trava é liberada
+    try:
+        update_rule_schedule(
+            config['id'], last_started_at=time.time(), last_status='running', last_message=None
+        )
+        logger.info("Executando regras da conta %s (%s)", config['name'], config['account_id'])
+        # Erros das leituras da Graph API são exibidos e não interrompem a execução;
+        # são coletados para que a conta apareça como falha no resultado
+        with capture_errors() as errors, graph_caller(f"regras: {config['name']}"):
+            trace = RuleTrace(verbosity, log=logger.info)
+            summary = run_rules_for_account(config, time_range, trace=trace)
+    except Exception as e:
+        logger.exception("Erro ao executar regras da conta %s", config['name'])
+        result['status'] = 'error'
+        result['error'] = str(e)
+        message = str(e)
+    else:
+        result['status'] = 'error' if errors else 'ok'
+        result['summary'] = summary
+        result['error'] = "; ".join(errors) or None
+        message = (
+            f"{summary['matches']} condições atendidas, {summary['successes']} ações aplicadas, "
+            f"{summary['failures']} falhas"
+        )
+        if errors:
+            message = f"{message}. {result['error']}"
+    finally:
+        result['seconds'] = time.monotonic() - started_at
+        release_run_lock(lock_name, owner)
+
+    # Uma falha ao gravar a agenda (ex.: banco bloqueado) não descarta o resultado da conta
+    try:
+        update_rule_schedule(
+            config['id'], last_finished_at=time.time(), last_status=result['status'], last_message=message
+        )
+    except Exception:
+        logger.exception("Erro ao gravar a agenda da conta %s", config['name'])
+    logger.info(
+        "Conta %s: %s em %.1fs", config['name'], result['status'], result['seconds']
+    )
+    return result
+
+# Função executada em cada thread do pool: a conexão SQLite da thread é
+# fechada ao final, já que as threads do pool são descartadas depois
+def _run_account_in_worker(config, time_range, verbosity):
+    try:
+        return run_account(config, time_range=time_range, verbosity=verbosity)
+    finally:
+        graph_ledger.flush()
+        close_connection()
+
+# Função para executar as regras de várias contas em paralelo, com no máximo
+# max_workers contas ao mesmo tempo. Cada conta usa sua própria instância da
+# FacebookAdsApi (ver run_rules_for_account). Retorna os resultados na ordem de configs
+def run_all_accounts(configs=None, max_workers=DEFAULT_MAX_WORKERS, time_range='last_7d',
+                     verbosity='matches'):
+    configs = get_all_api_configs() if configs is None else configs
+    if not configs:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(configs))),
+                            thread_name_prefix='rules') as executor:
+        return list(executor.map(
+            lambda config: _run_account_in_worker(config, time_range, verbosity), configs
+        ))
+
+# Função para resumir os resultados de uma rodada no log
+def log_run_results(results, elapsed):
+    failed = [result for result in results if result['status'] == 'error']
+    logger.info(
+        "%d contas executadas em %.1fs (%d com falha, %d puladas)",
+        len(results), elapsed, len(failed),
+        sum(1 for result in results if result['status'] == 'skipped')
+    )
+    for result in failed:
+        logger.warning("Falha na conta %s (%s): %s", result['name'], result['account_id'], result['error'])
+
+# Função com o laço do agendador: executa, em paralelo, as contas cujo intervalo venceu
+def run_scheduler(default_interval=DEFAULT_INTERVAL_SECONDS, once=False, time_range='last_7d',
+                  config_ids=None, max_workers=DEFAULT_MAX_WORKERS, verbosity='matches'):
+    init_db()
+
+    while True:
+        now = time.time()
+        next_due = now + IDLE_SLEEP_MAX_SECONDS
+        # Uma falha na rodada (ex.: banco bloqueado) é registrada e o agendador
+        # tenta de novo em até IDLE_SLEEP_MAX_SECONDS, sem encerrar o processo
+        try:
+            schedules = {schedule['config_id']: schedule for schedule in get_rule_schedules()}
+
+            due_configs = []
+            for config in get_all_api_configs():
+                if config_ids and config['id'] not in config_ids:
+                    continue
+
+                schedule = schedules.get(config['id'], {})
+                interval = schedule.get('interval_seconds') or default_interval
+                due_at = (schedule.get('last_started_at') or 0) + interval
+
+                if once or due_at <= now:
+                    due_configs.append(config)
+                else:
+                    next_due = min(next_due, due_at)
+
+            if due_configs:
+                started_at = time.monotonic()
+                results = run_all_accounts(due_configs, max_workers, time_range, verbosity)
+                log_run_results(results, time.monotonic() - started_at)
+
+                for config in due_configs:
+                    interval = schedules.get(config['id'], {}).get('interval_seconds') or default_interval
+                    next_due = min(next_due, time.time() + interval)
+        except Exception:
+            logger.exception("Erro na rodada do agendador de regras")
+
+        if once:
+            return
+        time.sleep(max(1, next_due - time.time()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Executor de regras em segundo plano")
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL_SECONDS,
+                        help="intervalo padrão entre execuções de cada conta, em segundos")
+    parser.add_argument('--once', action='store_true',
+                        help="executar todas as contas uma vez e sair")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="quantidade máxima de contas executadas em paralelo")
+    parser.add_argument('--time-range', default='last_7d', choices=['last_7d', 'last_30d', 'yesterday'],
+                        help="período dos insights usados pelas regras")
+    parser.add_argument('--verbosity', default='matches', choices=list(VERBOSITY_LEVELS),
+                        help="detalhe do log de cada execução: quiet, matches ou full")
+    parser.add_argument('--config-id', type=int, action='append', dest='config_ids',
+                        help="executar apenas esta configuração de conta (pode repetir)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    run_scheduler(args.interval, args.once, args.time_range, args.config_ids, args.workers,
+                  args.verbosity)
+
+if __name__ == "__main__":
+    main()
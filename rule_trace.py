@@ -0,0 +1,136 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+# Níveis de detalhe do registro da verificação de regras
+VERBOSITY_LEVELS = {
+    'quiet': "Silencioso (apenas falhas e resumo)",
+    'matches': "Condições atendidas",
+    'full': "Completo (todas as verificações)",
+}
+
+# Resultado de cada decisão (objeto x regra)
+OUTCOME_LABELS = {
+    'success': "✅ Aplicada",
+    'failure': "❌ Falha",
+    'skipped': "⚠️ Não aplicada",
+    'no_match': "Condição não atendida",
+}
+
+# Resultados mantidos em cada nível de detalhe
+VERBOSITY_OUTCOMES = {
+    'quiet': {'failure', 'skipped'},
+    'matches': {'success', 'failure', 'skipped'},
+    'full': set(OUTCOME_LABELS),
+}
+
+# Intervalo mínimo (em segundos) entre duas atualizações da exibição
+UPDATE_INTERVAL_SECONDS = 0.5
+
+# Colunas de cada registro de decisão
+RECORD_COLUMNS = [
+    'level', 'object_id', 'object_name', 'rule_id', 'rule_name', 'action_type',
+    'cpa', 'purchases', 'outcome', 'message'
+]
+
+# Função para formatar um registro de decisão em uma linha de texto
+def format_record(record):
+    return (
+        f"{OUTCOME_LABELS[record['outcome']]} | {record['level']} {record['object_name']} "
+        f"({record['object_id']}) | regra {record['rule_name']} | CPA {record['cpa']:.2f}, "
+        f"compras {record['purchases']} | {record['message']}"
+    )
+
+# Registro estruturado da verificação de regras: mensagens gerais (lines) e uma
+# decisão por objeto x regra (records). on_update(trace) é chamado no máximo a
+# cada update_interval segundos e no fim, para a interface exibir o progresso
+# sem redesenhar a cada linha; log recebe cada linha e decisão (ex.: logging)
+class RuleTrace:
+    def __init__(self, verbosity='matches', log=None, on_update=None,
+                 update_interval=UPDATE_INTERVAL_SECONDS, clock=time.monotonic):
+        self.verbosity = verbosity
+        self.log = log
+        self.on_update = on_update
+        self.update_interval = update_interval
+        self.clock = clock
+        self.lines = []
+        self.records = []
+        self.counts = dict.fromkeys(OUTCOME_LABELS, 0)
+        self._miss_frames = []
+        self._updated_at = None
+
+    def _maybe_update(self):
+        if self.on_update is None:
+            return
+        now = self.clock()
+        if self._updated_at is None or now - self._updated_at >= self.update_interval:
+            self._updated_at = now
+            self.on_update(self)
+
+    # Mensagem geral; no modo silencioso apenas as essenciais (erros e resumo)
+    def message(self, text, essential=False):
+        if self.verbosity == 'quiet' and not essential:
+            return
+        self.lines.append(text)
+        if self.log:
+            self.log(text)
+        self._maybe_update()
+
+    # Decisão de uma regra sobre um objeto (linha de insights do nível)
+    def record(self, level, row, rule, outcome, message=''):
+        self.counts[outcome] += 1
+        if outcome not in VERBOSITY_OUTCOMES[self.verbosity]:
+            return
+        record = {
+            'level': level,
+            'object_id': row[f'{level}_id'],
+            'object_name': row[f'{level}_name'],
+            'rule_id': rule.get('id'),
+            'rule_name': rule.get('name'),
+            'action_type': rule.get('action_type'),
+            'cpa': float(row['cpa']),
+            'purchases': int(row['purchases']),
+            'outcome': outcome,
+            'message': message,
+        }
+        self.records.append(record)
+        if self.log:
+            self.log(format_record(record))
+        self._maybe_update()
+
+    # Registra de uma vez as condições não atendidas de uma matriz objetos x regras
+    # (apenas no modo completo; os registros são montados de forma vetorizada)
+    def record_misses(self, level, frame, active_rules, matrix):
+        if matrix is None:
+            return
+        object_positions, rule_positions = np.nonzero(~matrix)
+        self.counts['no_match'] += len(object_positions)
+        if self.verbosity != 'full' or not len(object_positions):
+            return
+
+        rule_field = lambda field: np.array([rule.rule.get(field) for rule in active_rules], dtype=object)
+        self._miss_frames.append(pd.DataFrame({
+            'level': level,
+            'object_id': frame[f'{level}_id'].to_numpy()[object_positions],
+            'object_name': frame[f'{level}_name'].to_numpy()[object_positions],
+            'rule_id': rule_field('id')[rule_positions],
+            'rule_name': rule_field('name')[rule_positions],
+            'action_type': rule_field('action_type')[rule_positions],
+            'cpa': frame['cpa'].to_numpy()[object_positions],
+            'purchases': frame['purchases'].to_numpy()[object_positions],
+            'outcome': 'no_match',
+            'message': '',
+        }, columns=RECORD_COLUMNS))
+        self._maybe_update()
+
+    # Última atualização da exibição
+    def finish(self):
+        if self.on_update is not None:
+            self._updated_at = self.clock()
+            self.on_update(self)
+
+    # Todas as decisões registradas em um DataFrame
+    def to_frame(self):
+        frames = [pd.DataFrame(self.records, columns=RECORD_COLUMNS)] + self._miss_frames
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]